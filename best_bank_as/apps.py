@@ -6,3 +6,9 @@ class BestBankAsConfig(AppConfig):
 
     default_auto_field = "django.db.models.BigAutoField"
     name = "best_bank_as"
+
+    def ready(self) -> None:
+        from best_bank_as import bank_registry, roles
+
+        bank_registry.connect_signals()
+        roles.connect_signals()
@@ -0,0 +1,43 @@
+"""Helpers for async views and middleware on Django 4.2."""
+
+from typing import Any
+
+from asgiref.sync import sync_to_async
+from django.db.models import Model, QuerySet
+from django.http import Http404, HttpRequest, HttpResponse
+from django.shortcuts import render
+
+
+async def aget_user(request: HttpRequest) -> Any:
+    """
+    Load the user of a request. Django 4.2 only loads it synchronously, from
+    the session, so this is the one step run in a thread.
+    """
+    await sync_to_async(lambda: request.user.is_authenticated)()
+    return request.user
+
+
+async def aget_object_or_404(queryset: type[Model] | QuerySet, **kwargs: Any) -> Any:
+    """Async version of `get_object_or_404`."""
+    if not isinstance(queryset, QuerySet):
+        queryset = queryset._default_manager.all()
+    try:
+        return await queryset.aget(**kwargs)
+    except queryset.model.DoesNotExist as e:
+        raise Http404(
+            f"No {queryset.model._meta.object_name} matches the query."
+        ) from e
+
+
+async def arender(
+    request: HttpRequest, template_name: str, context: dict[str, Any] | None = None
+) -> HttpResponse:
+    """
+    Render a template from async code. Everything the shared templates read
+    from the request user is loaded first, so rendering never hits the
+    database.
+    """
+    user = await aget_user(request)
+    if user.is_authenticated:
+        await user.aload_group_names()
+    return render(request, template_name, context)
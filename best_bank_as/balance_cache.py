@@ -0,0 +1,141 @@
+"""Write-through cache of account balances in the django-rq Redis."""
+
+from collections.abc import Awaitable, Callable
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from redis import Redis
+from redis.exceptions import RedisError
+
+from best_bank_as import constants, metrics, redis_clients
+
+# Cache "<version>:<balance>" unless a newer version is cached already. When
+# populating after a miss, also give up if a write bumped the version since
+# the balance was read from the database.
+_STORE = """
+local cached = redis.call('GET', KEYS[2])
+if cached and tonumber(string.match(cached, '^(%d+):')) >= tonumber(ARGV[1]) then
+    return 0
+end
+local version = tonumber(redis.call('GET', KEYS[1]) or '0')
+if ARGV[3] == '1' and version ~= tonumber(ARGV[1]) then
+    return 0
+end
+redis.call('SET', KEYS[2], ARGV[1] .. ':' .. ARGV[2], 'EX', ARGV[4])
+return 1
+"""
+
+
+def enabled() -> bool:
+    """Check if the balance cache is switched on."""
+    return settings.BALANCE_CACHE_ENABLED
+
+
+def _version_key(account_id: int) -> str:
+    return f"balance:{account_id}:version"
+
+
+def _value_key(account_id: int) -> str:
+    return f"balance:{account_id}"
+
+
+def _store_arguments(
+    account_id: int, version: int, balance: Decimal, populate: bool
+) -> dict[str, list]:
+    return {
+        "keys": [_version_key(account_id), _value_key(account_id)],
+        "args": [
+            version,
+            str(balance),
+            int(populate),
+            constants.BALANCE_CACHE_TTL_SECONDS,
+        ],
+    }
+
+
+def _store(
+    redis: Redis, account_id: int, version: int, balance: Decimal, populate: bool
+) -> None:
+    redis.register_script(_STORE)(
+        **_store_arguments(account_id, version, balance, populate)
+    )
+
+
+def get(account_id: int, load: Callable[[], Decimal]) -> Decimal:
+    """Read a balance from the cache, loading and caching it on a miss."""
+    if not enabled():
+        return load()
+
+    try:
+        redis = redis_clients.client()
+        version, cached = redis.mget(_version_key(account_id), _value_key(account_id))
+        if cached is not None:
+            metrics.incr("balance_cache.hits")
+            return Decimal(cached.decode().split(":", 1)[1])
+
+        metrics.incr("balance_cache.misses")
+        balance = load()
+        _store(redis, account_id, int(version or 0), balance, populate=True)
+        return balance
+    except RedisError:
+        metrics.incr("balance_cache.errors")
+        return load()
+
+
+async def aget(account_id: int, load: Callable[[], Awaitable[Decimal]]) -> Decimal:
+    """Async version of `get`."""
+    if not enabled():
+        return await load()
+
+    try:
+        redis = redis_clients.async_client()
+        version, cached = await redis.mget(
+            _version_key(account_id), _value_key(account_id)
+        )
+        if cached is not None:
+            metrics.incr("balance_cache.hits")
+            return Decimal(cached.decode().split(":", 1)[1])
+
+        metrics.incr("balance_cache.misses")
+        balance = await load()
+        await redis.register_script(_STORE)(
+            **_store_arguments(account_id, int(version or 0), balance, True)
+        )
+        return balance
+    except RedisError:
+        metrics.incr("balance_cache.errors")
+        return await load()
+
+
+def refresh(
+    account_ids: list[int], load: Callable[[list[int]], dict[int, Decimal]]
+) -> None:
+    """
+    Bump the version of the given accounts and cache their balances.
+    The old values are dropped together with the version bump, so if this
+    fails halfway readers fall back to the database instead of a stale value.
+    """
+    try:
+        redis = redis_clients.client()
+        pipeline = redis.pipeline()
+        for account_id in account_ids:
+            pipeline.incr(_version_key(account_id))
+            pipeline.delete(_value_key(account_id))
+        versions = pipeline.execute()[::2]
+
+        balances = load(account_ids)
+        for account_id, version in zip(account_ids, versions, strict=True):
+            if account_id in balances:
+                _store(redis, account_id, version, balances[account_id], False)
+    except RedisError:
+        metrics.incr("balance_cache.errors")
+
+
+def refresh_on_commit(
+    account_ids: list[int], load: Callable[[list[int]], dict[int, Decimal]]
+) -> None:
+    """Refresh the cached balances once the current transaction commits."""
+    if not enabled() or not account_ids:
+        return
+    transaction.on_commit(lambda: refresh(account_ids, load))
@@ -0,0 +1,130 @@
+"""
+The banks external transfers go to, loaded once per process and kept by
+registration number. Saving or deleting a bank publishes a message on a
+Redis channel, and a listener thread in every process drops its banks when
+one arrives, so they are loaded again on the next lookup.
+"""
+
+import os
+import threading
+import time
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from redis.exceptions import RedisError
+
+from best_bank_as import metrics, redis_clients
+from best_bank_as.db_models.bank import Bank
+
+CHANNEL = "banks:changed"
+
+_lock = threading.Lock()
+_banks: dict[str, Bank] | None = None
+# Bumped on every drop, so banks loaded before a change are not kept
+_generation = 0
+_listener: threading.Thread | None = None
+
+
+def _drop() -> None:
+    global _banks, _generation
+    with _lock:
+        _banks = None
+        _generation += 1
+
+
+def _listen(subscribed: threading.Event) -> None:
+    while True:
+        try:
+            pubsub = redis_clients.client().pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(CHANNEL)
+            # Changes published while not subscribed were missed
+            _drop()
+            subscribed.set()
+            for _ in pubsub.listen():
+                _drop()
+        except RedisError:
+            metrics.incr("banks.errors")
+            _drop()
+            time.sleep(1)
+
+
+def _ensure_listener() -> None:
+    global _listener
+    with _lock:
+        # Threads do not survive a fork, so forked workers start their own
+        if _listener is not None and _listener.is_alive():
+            return
+        subscribed = threading.Event()
+        _listener = threading.Thread(
+            target=_listen, args=(subscribed,), name="bank-registry", daemon=True
+        )
+        _listener.start()
+    # Banks loaded before the subscription would be dropped by it
+    subscribed.wait(timeout=1)
+
+
+def _registry() -> dict[str, Bank]:
+    global _banks
+    _ensure_listener()
+    with _lock:
+        banks, generation = _banks, _generation
+    if banks is not None:
+        metrics.incr("banks.hits")
+        return banks
+
+    metrics.incr("banks.misses")
+    banks = {bank.reg_number: bank for bank in Bank.objects.all()}
+    with _lock:
+        if _generation == generation:
+            _banks = banks
+    return banks
+
+
+def get(reg_number: str) -> Bank:
+    """The bank with a registration number, raises Bank.DoesNotExist."""
+    try:
+        return _registry()[reg_number]
+    except KeyError:
+        raise Bank.DoesNotExist(
+            f"No bank with registration number {reg_number}."
+        ) from None
+
+
+def reg_numbers() -> list[str]:
+    """Registration numbers of all banks."""
+    return sorted(_registry())
+
+
+def validate_registration_number(value: str) -> None:
+    """Form validator accepting this bank and the banks of the registry."""
+    if value != os.environ["BANK_REGISTRATION_NUMBER"] and value not in _registry():
+        raise ValidationError("Unknown registration number.", code="invalid")
+
+
+def invalidate() -> None:
+    """Drop the banks of this process and tell the other processes to."""
+    _drop()
+    try:
+        redis_clients.client().publish(CHANNEL, "changed")
+    except RedisError:
+        metrics.incr("banks.errors")
+
+
+def invalidate_on_commit() -> None:
+    """
+    Invalidate now and again once the current transaction commits, so
+    banks loaded by other processes before the commit are dropped too.
+    """
+    invalidate()
+    transaction.on_commit(invalidate)
+
+
+def _bank_changed(**kwargs: object) -> None:
+    invalidate_on_commit()
+
+
+def connect_signals() -> None:
+    """Invalidate the registries whenever a bank changes."""
+    post_save.connect(_bank_changed, sender=Bank)
+    post_delete.connect(_bank_changed, sender=Bank)
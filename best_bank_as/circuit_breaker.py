@@ -0,0 +1,146 @@
+"""
+Circuit breakers for the banks external transfers are sent to, kept in the
+django-rq Redis so every worker process agrees on the state of a bank.
+
+A bank is closed while requests succeed. After
+`INTERBANK_BREAKER_FAILURES` failures in a row it opens for
+`INTERBANK_BREAKER_OPEN_SECONDS` and nothing is sent to it. It is then
+half open: one request at a time probes the bank, a success closes it
+again and a failure opens it again.
+"""
+
+from best_bank_as import constants, metrics, redis_clients
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+def _key(reg_number: str, part: str) -> str:
+    return f"interbank:breaker:{reg_number}:{part}"
+
+
+def _failures(reg_number: str) -> int:
+    return int(redis_clients.client().get(_key(reg_number, "failures")) or 0)
+
+
+def state(reg_number: str) -> str:
+    """State of the breaker of a bank."""
+    if redis_clients.client().exists(_key(reg_number, "open")):
+        return OPEN
+    if _failures(reg_number) >= constants.INTERBANK_BREAKER_FAILURES:
+        return HALF_OPEN
+    return CLOSED
+
+
+def allow(reg_number: str) -> bool:
+    """Check if a request may be sent to a bank, claiming the probe if half open."""
+    current = state(reg_number)
+    if current != HALF_OPEN:
+        return current == CLOSED
+    # The probe is released when it fails or succeeds, or after its timeout
+    return bool(
+        redis_clients.client().set(
+            _key(reg_number, "probe"),
+            1,
+            nx=True,
+            ex=constants.INTERBANK_TIMEOUT_SECONDS,
+        )
+    )
+
+
+def record_success(reg_number: str) -> None:
+    """Close the breaker of a bank that answered."""
+    redis_clients.client().delete(
+        _key(reg_number, "failures"),
+        _key(reg_number, "open"),
+        _key(reg_number, "probe"),
+    )
+
+
+def record_failure(reg_number: str) -> None:
+    """Count a failed request, opening the breaker after too many in a row."""
+    redis = redis_clients.client()
+    pipe = redis.pipeline()
+    pipe.incr(_key(reg_number, "failures"))
+    # Failures long ago do not count towards opening
+    pipe.expire(
+        _key(reg_number, "failures"), constants.INTERBANK_BREAKER_WINDOW_SECONDS
+    )
+    failures, _ = pipe.execute()
+    metrics.incr("interbank.failures")
+
+    if failures < constants.INTERBANK_BREAKER_FAILURES:
+        return
+    opened = redis.set(
+        _key(reg_number, "open"),
+        1,
+        nx=True,
+        ex=constants.INTERBANK_BREAKER_OPEN_SECONDS,
+    )
+    redis.delete(_key(reg_number, "probe"))
+    if opened:
+        metrics.incr("interbank.breakers_opened")
+
+
+async def _afailures(reg_number: str) -> int:
+    return int(
+        await redis_clients.async_client().get(_key(reg_number, "failures")) or 0
+    )
+
+
+async def astate(reg_number: str) -> str:
+    """Async version of `state`."""
+    if await redis_clients.async_client().exists(_key(reg_number, "open")):
+        return OPEN
+    if await _afailures(reg_number) >= constants.INTERBANK_BREAKER_FAILURES:
+        return HALF_OPEN
+    return CLOSED
+
+
+async def aallow(reg_number: str) -> bool:
+    """Async version of `allow`."""
+    current = await astate(reg_number)
+    if current != HALF_OPEN:
+        return current == CLOSED
+    return bool(
+        await redis_clients.async_client().set(
+            _key(reg_number, "probe"),
+            1,
+            nx=True,
+            ex=constants.INTERBANK_TIMEOUT_SECONDS,
+        )
+    )
+
+
+async def arecord_success(reg_number: str) -> None:
+    """Async version of `record_success`."""
+    await redis_clients.async_client().delete(
+        _key(reg_number, "failures"),
+        _key(reg_number, "open"),
+        _key(reg_number, "probe"),
+    )
+
+
+async def arecord_failure(reg_number: str) -> None:
+    """Async version of `record_failure`."""
+    redis = redis_clients.async_client()
+    pipe = redis.pipeline()
+    pipe.incr(_key(reg_number, "failures"))
+    pipe.expire(
+        _key(reg_number, "failures"), constants.INTERBANK_BREAKER_WINDOW_SECONDS
+    )
+    failures, _ = await pipe.execute()
+    metrics.incr("interbank.failures")
+
+    if failures < constants.INTERBANK_BREAKER_FAILURES:
+        return
+    opened = await redis.set(
+        _key(reg_number, "open"),
+        1,
+        nx=True,
+        ex=constants.INTERBANK_BREAKER_OPEN_SECONDS,
+    )
+    await redis.delete(_key(reg_number, "probe"))
+    if opened:
+        metrics.incr("interbank.breakers_opened")
@@ -1,3 +1,44 @@
 YEAR_DAYS = 365
 SESSION_TIMEOUT_SECONDS = 300
 DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+TRANSFER_RETRY_ATTEMPTS = 5
+TRANSFER_RETRY_BASE_DELAY_SECONDS = 0.02
+TRANSFER_RETRY_MAX_DELAY_SECONDS = 0.5
+BULK_BATCH_SIZE = 1000
+TRANSACTIONS_PAGE_SIZE = 25
+TRANSACTIONS_PAGE_SIZE_MAX = 100
+STATEMENT_CHUNK_SIZE = 2000
+CHECKPOINT_SETTLE_SECONDS = 300
+BALANCE_CACHE_TTL_SECONDS = 300
+LEDGER_PARTITION_MONTHS_AHEAD = 3
+ARCHIVE_BATCH_ACCOUNTS = 100
+IDEMPOTENCY_KEY_TTL_SECONDS = 86400
+IDEMPOTENCY_IN_FLIGHT_SECONDS = 60
+ROLE_CACHE_MAX_USERS = 10000
+INTERBANK_BATCH_SIZE = 100
+INTERBANK_BATCH_WINDOW_SECONDS = 1
+# Far longer than booking a claimed transfer takes
+INTERBANK_QUEUE_CLAIM_SECONDS = 300
+INTERBANK_TIMEOUT_SECONDS = 10
+# Requests the dispatcher has in flight per bank, awaited on its event loop
+INTERBANK_BANK_CONCURRENCY = 100
+# Threads the dispatcher books and finalizes transfers on, for all banks
+INTERBANK_DISPATCHER_DB_THREADS = 8
+INTERBANK_DISPATCHER_BANK_REFRESH_SECONDS = 30
+INTERBANK_DISPATCHER_POLL_SECONDS = 0.2
+INTERBANK_REQUEST_RETRIES = 2
+INTERBANK_BREAKER_FAILURES = 5
+INTERBANK_BREAKER_OPEN_SECONDS = 30
+# Longer than the open time, so a bank half opens before it is forgiven
+INTERBANK_BREAKER_WINDOW_SECONDS = 300
+INTERBANK_RETRY_ATTEMPTS = 12
+INTERBANK_RETRY_BASE_DELAY_SECONDS = 2
+INTERBANK_RETRY_MAX_DELAY_SECONDS = 3600
+INTERBANK_OUTBOX_BATCH_SIZE = 100
+INTERBANK_OUTBOX_POLL_SECONDS = 0.5
+# Longer than a batch takes to send, transfers of a relay that died are sent
+# again by another after this, under the same reference
+INTERBANK_OUTBOX_LEASE_SECONDS = 600
+INTERBANK_OUTBOX_REPORT_SECONDS = 60
+# Allowed clock skew of signed interbank requests, either way
+INTERBANK_SIGNATURE_MAX_AGE_SECONDS = 300
@@ -1,18 +1,71 @@
-from decimal import Decimal
+import base64
+import random
+from collections.abc import AsyncIterator, Iterator
+from datetime import date, datetime, time, timedelta
+from decimal import ROUND_DOWN, Decimal
 from typing import TYPE_CHECKING, Any
 
 from django.db import models
-from django.db.models import OuterRef, Subquery, Sum
+from django.db.models import F, OuterRef, Q, QuerySet, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.db.transaction import atomic
+from django.utils.timezone import is_naive, localtime, make_aware
 
-from best_bank_as import enums
+from best_bank_as import balance_cache, constants, enums
+from best_bank_as.db_models.account_balance import AccountBalance
+from best_bank_as.db_models.balance_checkpoint import BalanceCheckpoint
 from best_bank_as.db_models.core import base_model
 from best_bank_as.db_models.ledger import Ledger
+from best_bank_as.db_models.ledger_archive import LedgerArchive
 from best_bank_as.enums import AccountStatus
 
 if TYPE_CHECKING:
     from best_bank_as.db_models.customer import Customer
 
 
+def encode_cursor(created_at: datetime, pk: int) -> str:
+    """Encode a position in the account history as an opaque token."""
+    position = f"{created_at.isoformat()}|{pk}"
+    return base64.urlsafe_b64encode(position.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    """Decode a history cursor, raises ValueError if it is malformed."""
+    try:
+        created_at, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), int(pk)
+    except (UnicodeError, ValueError, TypeError) as e:
+        raise ValueError("Invalid cursor.") from e
+
+
+class AccountQuerySet(QuerySet):
+    """QuerySet for account."""
+
+    def with_balances(self) -> "AccountQuerySet":
+        """
+        Annotate each account with its `booked` and `available` balance,
+        read from the balance projection in the same query. House accounts
+        include the balance of their shards, as in `Account.get_balance`.
+        """
+        zero = Value(Decimal(0))
+        shards = (
+            AccountBalance.objects.filter(account__parent_id=OuterRef("pk"))
+            .values("account__parent_id")
+            .annotate(booked_sum=Sum("booked"), pending_sum=Sum("pending"))
+        )
+        shards_booked = Coalesce(Subquery(shards.values("booked_sum")), zero)
+        shards_pending = Coalesce(Subquery(shards.values("pending_sum")), zero)
+        return self.annotate(
+            booked=Coalesce(F("balance_projection__booked"), zero) + shards_booked,
+            available=Coalesce(
+                F("balance_projection__booked") + F("balance_projection__pending"),
+                zero,
+            )
+            + shards_booked
+            + shards_pending,
+        )
+
+
 class Account(base_model.BaseModel):
     """Model for account."""
 
@@ -26,24 +79,206 @@ class Account(base_model.BaseModel):
     account_status = models.IntegerField(
         choices=enums.AccountStatus.choices, default=enums.AccountStatus.INACTIVE
     )  # noqa: E501
+    parent = models.ForeignKey(
+        "self",
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="shards",
+    )
+
+    objects = AccountQuerySet.as_manager()
 
     @property
     def account_number(self) -> str:
         """Get account number."""
         return self.pk
 
-    def get_balance(self) -> Decimal:
+    @property
+    def is_house_account(self) -> bool:
+        """Check if the account is an internal account that can be sharded."""
+        return self.account_type == enums.AccountType.INTERNAL and not self.parent_id
+
+    def _house_balances(self) -> Any:
+        """Balance rows of a house account and all of its shards."""
+        return AccountBalance.objects.filter(
+            Q(account_id=self.pk) | Q(account__parent_id=self.pk)
+        )
+
+    def pick_shard(self, amount: Decimal) -> "Account":
+        """
+        Pick the account to debit when paying `amount` out of this account.
+        For a sharded house account this is a random funded shard (or the
+        house account itself), which spreads concurrent payouts over several
+        balance rows instead of locking a single one.
+        """
+        if not self.is_house_account:
+            return self
+
+        candidates = list(
+            Account.objects.filter(Q(pk=self.pk) | Q(parent_id=self.pk))
+            .annotate(
+                available=F("balance_projection__booked")
+                + F("balance_projection__pending")
+            )
+            .filter(available__gte=amount)
+        )
+        if not candidates:
+            return self
+
+        return random.choice(candidates)
+
+    def get_balance(self, as_of: date | datetime | None = None) -> Decimal:
         """
         Retrieve the balance for the account.
         Excludes the ledgerentries that have a status of rejected.
+        Read from the balance cache or the balance projection maintained by
+        the ledger, or with `as_of` from the daily checkpoints, see
+        `_balance_as_of`.
+        House accounts include the balance of their shards.
+        """
+
+        if as_of is not None:
+            return self._balance_as_of(as_of)
+
+        if self.is_house_account:
+            totals = self._house_balances().aggregate(Sum("booked"), Sum("pending"))
+            return (totals["booked__sum"] or Decimal(0)) + (
+                totals["pending__sum"] or Decimal(0)
+            )
+
+        return balance_cache.get(
+            self.pk,
+            lambda: AccountBalance.available_of([self.pk]).get(self.pk, Decimal(0)),
+        )
+
+    async def aget_balance(self) -> Decimal:
+        """Async version of `get_balance` for the current balance."""
+        if self.is_house_account:
+            totals = await self._house_balances().aaggregate(
+                Sum("booked"), Sum("pending")
+            )
+            return (totals["booked__sum"] or Decimal(0)) + (
+                totals["pending__sum"] or Decimal(0)
+            )
+
+        async def load() -> Decimal:
+            projection = await AccountBalance.objects.filter(
+                account_id=self.pk
+            ).afirst()
+            return projection.available if projection else Decimal(0)
+
+        return await balance_cache.aget(self.pk, load)
+
+    def _balance_as_of(self, as_of: date | datetime) -> Decimal:
         """
+        Balance at the end of a day, or at a point in time for a datetime.
+        Starts from the latest checkpoint before that and only sums the
+        ledger entries written after the checkpointed day.
+        """
+        if isinstance(as_of, datetime):
+            if is_naive(as_of):
+                as_of = make_aware(as_of)
+            before_day = localtime(as_of).date()
+            until = Q(created_at__lte=as_of)
+        else:
+            before_day = as_of + timedelta(days=1)
+            until = Q(created_at__lt=make_aware(datetime.combine(before_day, time.min)))
+
+        account_ids = [self.pk]
+        if self.is_house_account:
+            account_ids += list(self.shards.values_list("pk", flat=True))
+
+        checkpoints = {
+            account_id: (day, closing_balance)
+            for account_id, day, closing_balance in BalanceCheckpoint.objects.filter(
+                account_id__in=account_ids, day__lt=before_day
+            )
+            .order_by("account_id", "-day")
+            .distinct("account_id")
+            .values_list("account_id", "day", "closing_balance")
+        }
+
+        balance = sum((closing for _, closing in checkpoints.values()), Decimal(0))
+        since = Q()
+        for account_id in account_ids:
+            if account_id not in checkpoints:
+                since |= Q(account_id=account_id)
+                continue
+            day = checkpoints[account_id][0] + timedelta(days=1)
+            since |= Q(
+                account_id=account_id,
+                created_at__gte=make_aware(datetime.combine(day, time.min)),
+            )
 
-        balance = (
-            Ledger.objects.filter(account=self)
+        # Archived entries are summed instead of their carried forward total,
+        # in one statement so an archive batch committing in between is
+        # counted exactly once
+        live, archived = (
+            entries.filter(since, until)
             .exclude(status=enums.TransactionStatus.REJECTED)
-            .aggregate(Sum("amount"))["amount__sum"]
+            .values_list("account_id")
+            .annotate(total=Sum("amount"))
+            .order_by()
+            for entries in (
+                Ledger.objects.filter(carried_forward=False),
+                LedgerArchive.objects.all(),
+            )
         )
-        return balance or Decimal(0)
+        totals = live.union(archived, all=True)
+        return balance + sum((total for _, total in totals), Decimal(0))
+
+    @atomic
+    def rebalance_shards(self, shard_count: int) -> list["Account"]:
+        """
+        Split a house account into `shard_count` shard accounts and spread its
+        funds evenly over them. With a single shard, all funds are moved back
+        to the house account itself.
+        """
+        if not self.is_house_account:
+            raise ValueError("Only house accounts can be sharded.")
+
+        shards = list(self.shards.order_by("pk"))
+        while shard_count > 1 and len(shards) < shard_count:
+            shards.append(
+                Account.objects.create(
+                    account_type=enums.AccountType.INTERNAL,
+                    account_status=enums.AccountStatus.ACTIVE,
+                    parent=self,
+                )
+            )
+
+        holders = [self] + shards
+        balances = Ledger.lock_balances([holder.pk for holder in holders])
+        current = {pk: balance.available for pk, balance in balances.items()}
+        total = sum(current.values(), Decimal(0))
+
+        targets = {holder.pk: Decimal(0) for holder in holders}
+        if shard_count > 1:
+            share = (total / shard_count).quantize(Decimal("0.01"), rounding=ROUND_DOWN)
+            for shard in shards[:shard_count]:
+                targets[shard.pk] = share
+            targets[shards[0].pk] += total - share * shard_count
+        else:
+            targets[self.pk] = total
+
+        by_pk = {holder.pk: holder for holder in holders}
+        donors = [pk for pk in targets if current[pk] > targets[pk]]
+        receivers = [pk for pk in targets if current[pk] < targets[pk]]
+        while donors and receivers:
+            donor, receiver = donors[0], receivers[0]
+            amount = min(
+                current[donor] - targets[donor], targets[receiver] - current[receiver]
+            )
+            Ledger.transfer(by_pk[donor], by_pk[receiver], amount)
+            current[donor] -= amount
+            current[receiver] += amount
+            if current[donor] == targets[donor]:
+                donors.pop(0)
+            if current[receiver] == targets[receiver]:
+                receivers.pop(0)
+
+        return shards
 
     def get_transactions(self) -> list[dict[str, Any]]:
         """
@@ -59,24 +294,127 @@ class Account(base_model.BaseModel):
         - date: Transaction date
         """
 
-        counterpart_subquery = (
-            Ledger.objects.filter(transaction_id=OuterRef("transaction_id"))
-            .exclude(account=self)
-            .values("account_id")[:1]
+        fields = ("transaction_id", "amount", "created_at")
+        counterpart = {"counterpart_account_number": F("counterpart_account_id")}
+        archived = LedgerArchive.objects.filter(account=self).values(
+            *fields, **counterpart
         )
-
-        # Fetch transactions with related counterpart account information
         transactions = (
-            Ledger.objects.filter(account=self)
-            .annotate(counterpart_account_number=Subquery(counterpart_subquery))
-            .values(
-                "transaction_id", "amount", "created_at", "counterpart_account_number"
-            )
+            Ledger.objects.filter(account=self, carried_forward=False)
+            .values(*fields, **counterpart)
+            .union(archived, all=True)
             .order_by("transaction_id")
         )
 
         return list(transactions)
 
+    def get_transaction_page(
+        self,
+        cursor: str | None = None,
+        limit: int = constants.TRANSACTIONS_PAGE_SIZE,
+        start: date | None = None,
+        end: date | None = None,
+    ) -> tuple[list[dict[str, Any]], str | None]:
+        """
+        Retrieve one page of the account history, newest first, optionally
+        limited to the entries between two dates (both inclusive).
+
+        Pages are keyset paginated on (created_at, id), so loading a page
+        costs the same no matter how deep into the history it is.
+        Returns the transactions, in the format of `get_transactions`, and
+        the cursor for the next page or None on the last page.
+        """
+        query, limit = self._transaction_page_query(cursor, limit, start, end)
+        return self._transaction_page(list(query), limit)
+
+    async def aget_transaction_page(
+        self,
+        cursor: str | None = None,
+        limit: int = constants.TRANSACTIONS_PAGE_SIZE,
+        start: date | None = None,
+        end: date | None = None,
+    ) -> tuple[list[dict[str, Any]], str | None]:
+        """Async version of `get_transaction_page`."""
+        query, limit = self._transaction_page_query(cursor, limit, start, end)
+        return self._transaction_page([row async for row in query], limit)
+
+    def _transaction_page_query(
+        self, cursor: str | None, limit: int, start: date | None, end: date | None
+    ) -> tuple[Any, int]:
+        """Query for one page of history plus one row, and the clamped limit."""
+        limit = max(1, min(limit, constants.TRANSACTIONS_PAGE_SIZE_MAX))
+        entries = Ledger.objects.filter(account=self).between(start, end)
+
+        if cursor:
+            created_at, pk = decode_cursor(cursor)
+            entries = entries.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+            )
+
+        query = entries.order_by("-created_at", "-id").values(
+            "id",
+            "transaction_id",
+            "amount",
+            "created_at",
+            counterpart_account_number=F("counterpart_account_id"),
+        )[: limit + 1]
+        return query, limit
+
+    @staticmethod
+    def _transaction_page(
+        transactions: list[dict[str, Any]], limit: int
+    ) -> tuple[list[dict[str, Any]], str | None]:
+        """Split off the extra row of a page query into the next cursor."""
+        if len(transactions) <= limit:
+            return transactions, None
+
+        last = transactions[limit - 1]
+        return transactions[:limit], encode_cursor(last["created_at"], last["id"])
+
+    def _statement_entries(
+        self, start: date | None, end: date | None
+    ) -> QuerySet["Ledger"]:
+        entries = Ledger.objects.filter(account=self).between(start, end)
+        # Dicts, since the values_list iterator of Django 4.2 runs its query
+        # in the calling thread, which aiterator may not do
+        return entries.order_by("created_at", "id").values(
+            "transaction_id",
+            "counterpart_account_id",
+            "amount",
+            "status",
+            "created_at",
+        )
+
+    @staticmethod
+    def _statement_row(entry: dict[str, Any]) -> dict[str, Any]:
+        return {
+            "transaction_id": entry["transaction_id"],
+            "counterpart_account_number": entry["counterpart_account_id"],
+            "amount": entry["amount"],
+            "status": enums.TransactionStatus.int_to_enum(entry["status"]),
+            "date": entry["created_at"],
+        }
+
+    def iter_statement(
+        self, start: date | None = None, end: date | None = None
+    ) -> Iterator[dict[str, Any]]:
+        """
+        Stream the account history between two dates (both inclusive), oldest
+        first. Rows are fetched through a server-side cursor in chunks, so
+        memory use does not grow with the size of the history.
+        """
+        entries = self._statement_entries(start, end)
+        for entry in entries.iterator(chunk_size=constants.STATEMENT_CHUNK_SIZE):
+            yield self._statement_row(entry)
+
+    async def aiter_statement(
+        self, start: date | None = None, end: date | None = None
+    ) -> AsyncIterator[dict[str, Any]]:
+        """Async version of `iter_statement`, fetching a chunk at a time."""
+        entries = self._statement_entries(start, end)
+        async for entry in entries.aiterator(chunk_size=constants.STATEMENT_CHUNK_SIZE):
+            yield self._statement_row(entry)
+
     @classmethod
     def request_new_account(
         cls, customer: "Customer", status: enums.AccountStatus
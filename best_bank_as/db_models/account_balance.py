@@ -0,0 +1,108 @@
+from decimal import Decimal
+
+from django.db import models
+from django.db.models import Case, F, Value, When
+from django.utils.timezone import now
+
+from best_bank_as import balance_cache, enums
+from best_bank_as.db_models.core import base_model
+
+
+class AccountBalance(base_model.BaseModel):
+    """
+    Materialized balance for an account.
+    Maintained by the ledger in the same database transaction as the entries,
+    so reading a balance is a primary key lookup instead of a ledger sum.
+    """
+
+    account = models.OneToOneField(
+        "Account",
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="balance_projection",
+    )
+    booked = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    pending = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def available(self) -> Decimal:
+        """Balance as reported by `Account.get_balance`."""
+        return self.booked + self.pending
+
+    @staticmethod
+    def split(status: int, amount: Decimal) -> tuple[Decimal, Decimal]:
+        """Split a ledger amount into its (booked, pending) contribution."""
+        if status == enums.TransactionStatus.PROCESSED:
+            return amount, Decimal(0)
+        if status == enums.TransactionStatus.PENDING:
+            return Decimal(0), amount
+        return Decimal(0), Decimal(0)
+
+    @classmethod
+    def apply(cls, deltas: dict[int, tuple[Decimal, Decimal]]) -> None:
+        """
+        Add (booked, pending) deltas to the balances of the given accounts
+        in a single UPDATE. Writers that can race on the same accounts lock
+        the rows first with `Ledger.lock_balances`, so the update never
+        waits on a lock in an unpredictable order.
+        """
+        deltas = {pk: delta for pk, delta in deltas.items() if any(delta)}
+        if not deltas:
+            return
+        balance_cache.refresh_on_commit(list(deltas), cls.available_of)
+
+        if cls._add(deltas) < len(deltas):
+            existing = set(
+                cls.objects.filter(account_id__in=deltas).values_list(
+                    "account_id", flat=True
+                )
+            )
+            missing = {pk: delta for pk, delta in deltas.items() if pk not in existing}
+            cls.objects.bulk_create(
+                [cls(account_id=pk) for pk in missing], ignore_conflicts=True
+            )
+            cls._add(missing)
+
+    @classmethod
+    def _add(cls, deltas: dict[int, tuple[Decimal, Decimal]]) -> int:
+        """Add deltas to existing balance rows, returns the number updated."""
+
+        def delta_of(index: int) -> Case:
+            return Case(
+                *[
+                    When(account_id=pk, then=Value(delta[index]))
+                    for pk, delta in deltas.items()
+                ],
+                default=Value(Decimal(0)),
+                output_field=models.DecimalField(max_digits=15, decimal_places=2),
+            )
+
+        return cls.objects.filter(account_id__in=deltas).update(
+            booked=F("booked") + delta_of(0),
+            pending=F("pending") + delta_of(1),
+            updated_at=now(),
+        )
+
+    @classmethod
+    def available_of(cls, account_ids: list[int]) -> dict[int, Decimal]:
+        """Read the available balance of the given accounts."""
+        return {
+            account_id: booked + pending
+            for account_id, booked, pending in cls.objects.filter(
+                account_id__in=account_ids
+            ).values_list("account_id", "booked", "pending")
+        }
+
+    @classmethod
+    def rebuild(cls, totals: dict[int, tuple[Decimal, Decimal]]) -> None:
+        """Overwrite the balances of the given accounts with ledger totals."""
+        balance_cache.refresh_on_commit(list(totals), cls.available_of)
+        for account_id, (booked, pending) in totals.items():
+            cls.objects.update_or_create(
+                account_id=account_id,
+                defaults={"booked": booked, "pending": pending},
+            )
+
+    def __str__(self) -> str:
+        return f"Account {self.account_id}: {self.booked} (+{self.pending} pending)"
@@ -0,0 +1,24 @@
+from django.db import models
+
+from best_bank_as.db_models.core import base_model
+
+
+class BalanceCheckpoint(base_model.BaseModel):
+    """
+    Model for the closing balance of an account at the end of a day (UTC).
+    Written by the checkpoint_balances command for days with ledger activity.
+    """
+
+    account = models.ForeignKey("Account", on_delete=models.CASCADE)
+    day = models.DateField()
+    closing_balance = models.DecimalField(max_digits=15, decimal_places=2)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["account", "day"], name="unique_account_day_checkpoint"
+            )
+        ]
+
+    def __str__(self) -> str:
+        return f"Account {self.account_id} on {self.day}: {self.closing_balance}"
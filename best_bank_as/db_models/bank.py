@@ -13,3 +13,5 @@ class Bank(base_model.BaseModel):
     bank_name = models.CharField(max_length=255)
     branch_name = models.CharField(max_length=255)
     url = models.CharField(max_length=255)
+    # Shared with the bank to sign requests between the two, see interbank_signing
+    signing_key = models.CharField(max_length=128, blank=True, default="")
@@ -2,7 +2,7 @@ from typing import Any
 
 from django.contrib.auth.models import Group
 from django.db import models
-from django.db.models import Q, QuerySet, Sum
+from django.db.models import Q, QuerySet
 from django.db.transaction import atomic
 
 from best_bank_as import enums
@@ -42,19 +42,8 @@ class Customer(BaseModel):
     objects = CustomerManager()
 
     def get_accounts(self) -> QuerySet[Account]:
-        """Retrieve all accounts for a give user."""
-        accounts = Account.objects.filter(customer_id=self.pk)
-
-        for account in accounts:
-            balance = (
-                Ledger.objects.filter(account=account).aggregate(Sum("amount"))[
-                    "amount__sum"
-                ]
-                or 0
-            )
-            account.balance = balance
-
-        return accounts
+        """Retrieve all accounts for a give user, annotated with balances."""
+        return Account.objects.filter(customer_id=self.pk).with_balances()
 
     def update_status(self, status: enums.CustomerStatus) -> "Customer":
         """Method for updating status on the customer."""
@@ -104,11 +93,11 @@ class Customer(BaseModel):
         )
 
         internal_account = Account.objects.get(
-            account_type=enums.AccountType.INTERNAL, customer=None
+            account_type=enums.AccountType.INTERNAL, customer=None, parent=None
         )
 
         Ledger.transfer(
-            source_account=internal_account,
+            source_account=internal_account.pick_shard(loan_application.amount),
             destination_account=loan_account,
             amount=loan_application.amount,
         )
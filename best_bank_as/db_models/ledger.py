@@ -1,27 +1,102 @@
-import os
+import logging
+import math
+import time
+from dataclasses import dataclass, replace
+from datetime import date, datetime, timedelta
 from decimal import Decimal
 from typing import TYPE_CHECKING, Any
 from uuid import uuid4
 
-import django_rq
+import httpx
 import requests
-from django.db import models
+from django.conf import settings
+from django.db import connection, models
+from django.db.models import Sum
 from django.db.transaction import atomic
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
+from django.utils.timezone import localtime, make_aware, now
 
-from best_bank_as import enums
+from best_bank_as import (
+    balance_cache,
+    bank_registry,
+    circuit_breaker,
+    constants,
+    enums,
+    interbank,
+    interbank_batches,
+    job_queues,
+    metrics,
+    outgoing_transfers,
+)
+from best_bank_as.db_models.account_balance import AccountBalance
+from best_bank_as.db_models.balance_checkpoint import BalanceCheckpoint
 from best_bank_as.db_models.bank import Bank
 from best_bank_as.db_models.core import base_model
+from best_bank_as.db_models.ledger_archive import LedgerArchive
+from best_bank_as.db_models.outbox_transfer import OutboxTransfer
 from best_bank_as.db_models.transaction import Transaction
+from best_bank_as.decorators import retry_on_conflict
 from best_bank_as.enums import AccountStatus
 
 if TYPE_CHECKING:
     from best_bank_as.db_models.account import Account
 
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class TransferInstruction:
+    """A single transfer in a batch for `Ledger.bulk_transfer`."""
+
+    source_account_id: int
+    destination_account_id: int
+    amount: Decimal
+
+
+@dataclass
+class TransferResult:
+    """Outcome of a single transfer in a batch."""
+
+    instruction: TransferInstruction
+    transaction_id: int | None = None
+    error: str | None = None
+
+    @property
+    def ok(self) -> bool:
+        """Check if the transfer was written."""
+        return self.error is None
+
+
+class LedgerQuerySet(models.QuerySet):
+    """QuerySet for ledger."""
+
+    def between(
+        self, start: date | None = None, end: date | None = None
+    ) -> "LedgerQuerySet":
+        """
+        Filter entries created between two dates (both inclusive). The bounds
+        are constants on `created_at`, so the planner only scans the monthly
+        partitions that overlap them.
+        """
+        entries = self
+        if start is not None:
+            entries = entries.filter(
+                created_at__gte=make_aware(datetime.combine(start, datetime.min.time()))
+            )
+        if end is not None:
+            entries = entries.filter(
+                created_at__lt=make_aware(
+                    datetime.combine(end + timedelta(days=1), datetime.min.time())
+                )
+            )
+        return entries
+
 
 class Ledger(base_model.BaseModel):
-    """Model for ledger."""
+    """
+    Model for ledger.
+    The table is range partitioned by month on `created_at`, see
+    `best_bank_as.ledger_partitions`, so its primary key is (id, created_at).
+    """
 
     registration_number = models.ForeignKey(
         "best_bank_as.Bank", on_delete=models.CASCADE, default=1
@@ -42,11 +117,179 @@ class Ledger(base_model.BaseModel):
         null=True,
     )
     amount = models.DecimalField(max_digits=15, decimal_places=2)
+    # Account of the other leg of the transaction, denormalized for history
+    counterpart_account = models.ForeignKey(
+        "Account",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="+",
+    )
+    # Opening balance standing in for entries moved to the ledger archive
+    carried_forward = models.BooleanField(default=False)
+
+    objects = LedgerQuerySet.as_manager()
+
+    class Meta:
+        indexes = [models.Index(fields=["account", "created_at", "id"])]
 
     @classmethod
     @atomic
+    def post_entries(cls, entries: list["Ledger"]) -> list["Ledger"]:
+        """Write ledger entries and apply them to the account balances."""
+        legs: dict[int, list["Ledger"]] = {}
+        for entry in entries:
+            if entry.transaction_id is not None:
+                legs.setdefault(entry.transaction_id, []).append(entry)
+        for first, *others in legs.values():
+            if len(others) == 1 and first.counterpart_account_id is None:
+                first.counterpart_account_id = others[0].account_id
+                others[0].counterpart_account_id = first.account_id
+
+        created = cls.objects.bulk_create(entries, batch_size=constants.BULK_BATCH_SIZE)
+
+        deltas: dict[int, tuple[Decimal, Decimal]] = {}
+        for entry in created:
+            booked, pending = AccountBalance.split(entry.status, entry.amount)
+            old_booked, old_pending = deltas.get(
+                entry.account_id, (Decimal(0), Decimal(0))
+            )
+            deltas[entry.account_id] = (old_booked + booked, old_pending + pending)
+        AccountBalance.apply(deltas)
+
+        return created
+
+    @classmethod
+    def balance_totals(
+        cls, account_ids: list[int] | None = None
+    ) -> dict[int, tuple[Decimal, Decimal]]:
+        """Sum the ledger into (booked, pending) totals per account."""
+        entries = cls.objects.exclude(status=enums.TransactionStatus.REJECTED)
+        if account_ids is not None:
+            entries = entries.filter(account_id__in=account_ids)
+
+        totals: dict[int, tuple[Decimal, Decimal]] = {}
+        for row in entries.values("account_id", "status").annotate(Sum("amount")):
+            booked, pending = AccountBalance.split(row["status"], row["amount__sum"])
+            old_booked, old_pending = totals.get(
+                row["account_id"], (Decimal(0), Decimal(0))
+            )
+            totals[row["account_id"]] = (old_booked + booked, old_pending + pending)
+        return totals
+
+    @classmethod
+    @atomic
+    def archive(cls, account_ids: list[int], before: datetime) -> int:
+        """
+        Move the settled entries of the given accounts created before
+        `before` to the ledger archive, and carry their sum forward in a
+        single opening balance entry per account. Balances do not change.
+        Returns the number of entries archived.
+        """
+        cls.lock_balances(account_ids)
+
+        columns = (
+            "id, created_at, status, amount, account_id, registration_number_id, "
+            "transaction_id, counterpart_account_id"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                WITH moved AS (
+                    DELETE FROM {cls._meta.db_table}
+                    WHERE account_id = ANY(%s) AND created_at < %s
+                    AND status <> %s AND NOT carried_forward
+                    RETURNING {columns}
+                ), archived AS (
+                    INSERT INTO {LedgerArchive._meta.db_table} ({columns}, archived_at)
+                    SELECT *, now() FROM moved
+                    RETURNING account_id, status, amount, registration_number_id
+                )
+                SELECT account_id, count(*), min(registration_number_id),
+                    coalesce(sum(amount) FILTER (WHERE status <> %s), 0)
+                FROM archived GROUP BY account_id
+                """,
+                [
+                    account_ids,
+                    before,
+                    enums.TransactionStatus.PENDING,
+                    enums.TransactionStatus.REJECTED,
+                ],
+            )
+            archived = cursor.fetchall()
+
+        # Keep the opening balance just before the entries that stay
+        opened_at = before - timedelta(microseconds=1)
+        openings = cls.objects.filter(carried_forward=True)
+        for account_id, _, registration_number_id, amount in archived:
+            if not openings.filter(account_id=account_id).update(
+                amount=models.F("amount") + amount, created_at=opened_at
+            ):
+                opening = cls.objects.create(
+                    account_id=account_id,
+                    registration_number_id=registration_number_id,
+                    amount=amount,
+                    status=enums.TransactionStatus.PROCESSED,
+                    carried_forward=True,
+                )
+                openings.filter(pk=opening.pk).update(created_at=opened_at)
+
+        return sum(count for _, count, _, _ in archived)
+
+    @classmethod
+    def lock_balances(cls, account_ids: list[int]) -> dict[int, AccountBalance]:
+        """
+        Lock the balance rows of the given accounts with SELECT ... FOR UPDATE.
+        Rows are always locked in account id order, so two transfers touching
+        the same accounts wait for each other instead of deadlocking.
+        Must be called inside a transaction.
+        """
+        account_ids = sorted(set(account_ids))
+        locked_rows = AccountBalance.objects.select_for_update().order_by("account_id")
+
+        started = time.monotonic()
+        balances = {
+            balance.account_id: balance
+            for balance in locked_rows.filter(account_id__in=account_ids)
+        }
+        if len(balances) < len(account_ids):
+            AccountBalance.objects.bulk_create(
+                [
+                    AccountBalance(account_id=account_id)
+                    for account_id in account_ids
+                    if account_id not in balances
+                ],
+                ignore_conflicts=True,
+            )
+            balances = {
+                balance.account_id: balance
+                for balance in locked_rows.filter(account_id__in=account_ids)
+            }
+        waited = time.monotonic() - started
+
+        metrics.incr("transfer.lock_acquisitions")
+        metrics.incr("transfer.lock_wait_seconds", waited)
+        metrics.maximum("transfer.lock_wait_max_seconds", waited)
+        return balances
+
+    @classmethod
     def transfer(
         cls, source_account: "Account", destination_account: "Account", amount: Decimal
+    ) -> None:
+        """
+        Move `amount` between two internal accounts. With the
+        TRANSFER_SINGLE_STATEMENT setting the transfer is written by a single
+        statement, see `_transfer_in_one_statement`.
+        """
+        cls._check_transfer(source_account, destination_account, amount)
+        if settings.TRANSFER_SINGLE_STATEMENT:
+            cls._transfer_in_one_statement(source_account, destination_account, amount)
+        else:
+            cls._transfer_with_locks(source_account, destination_account, amount)
+
+    @staticmethod
+    def _check_transfer(
+        source_account: "Account", destination_account: "Account", amount: Decimal
     ) -> None:
         if amount <= 0:
             raise ValueError("Amount must be a positive number.")
@@ -59,26 +302,203 @@ class Ledger(base_model.BaseModel):
         if destination_account.account_status == AccountStatus.PENDING:
             raise ValueError("Cannot transfer money to pending account.")
 
+    @classmethod
+    @retry_on_conflict
+    @atomic
+    def _transfer_with_locks(
+        cls, source_account: "Account", destination_account: "Account", amount: Decimal
+    ) -> None:
+        new_transaction = Transaction.objects.create()
+
+        balances = cls.lock_balances([source_account.pk, destination_account.pk])
+
         # TODO: Handle this with better error page and handling.
-        if source_account.get_balance() < amount:
+        if balances[source_account.pk].available < amount:
             raise ValueError("Amount cannot be less than balance")
-        new_transaction = Transaction.objects.create()
 
-        # Source account
-        cls.objects.create(
-            amount=-amount,
-            account=source_account,
-            transaction=new_transaction,
+        cls.post_entries(
+            [
+                # Source account
+                cls(
+                    amount=-amount,
+                    account=source_account,
+                    transaction=new_transaction,
+                    status=enums.TransactionStatus.PROCESSED,
+                ),
+                # Destination account
+                cls(
+                    amount=amount,
+                    account=destination_account,
+                    transaction=new_transaction,
+                    status=enums.TransactionStatus.PROCESSED,
+                ),
+            ]
         )
 
-        # Destination account
-        cls.objects.create(
-            amount=amount,
-            account=destination_account,
-            transaction=new_transaction,
+    @classmethod
+    @retry_on_conflict
+    def _transfer_in_one_statement(
+        cls, source_account: "Account", destination_account: "Account", amount: Decimal
+    ) -> None:
+        """
+        Lock both balances in account order, check the source balance, insert
+        the transaction and both ledger legs and update the balances in one
+        statement. Outside a transaction block it commits on its own, so the
+        whole transfer is a single round trip.
+        """
+        source_id, destination_id = source_account.pk, destination_account.pk
+        balance_table = AccountBalance._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                WITH locked AS MATERIALIZED (
+                    SELECT account_id, booked + pending AS available
+                    FROM {balance_table}
+                    WHERE account_id IN (%(source)s, %(destination)s)
+                    ORDER BY account_id
+                    FOR UPDATE
+                ), funded AS (
+                    SELECT 1 FROM locked
+                    HAVING bool_or(account_id = %(source)s AND available >= %(amount)s)
+                ), new_transaction AS (
+                    INSERT INTO {Transaction._meta.db_table} (created_at)
+                    SELECT now() FROM funded
+                    RETURNING id
+                ), legs AS (
+                    INSERT INTO {cls._meta.db_table} (
+                        created_at, status, amount, account_id, counterpart_account_id,
+                        transaction_id, registration_number_id, carried_forward
+                    )
+                    SELECT now(), %(status)s, leg.amount, leg.account_id,
+                        leg.counterpart_account_id, new_transaction.id, %(bank)s, false
+                    FROM new_transaction, (
+                        VALUES
+                            (%(source)s, -%(amount)s, %(destination)s),
+                            (%(destination)s, %(amount)s, %(source)s)
+                    ) AS leg (account_id, amount, counterpart_account_id)
+                    RETURNING account_id, amount
+                ), balances AS (
+                    INSERT INTO {balance_table}
+                        (account_id, booked, pending, created_at, updated_at)
+                    SELECT account_id, amount, 0, now(), now() FROM legs
+                    ON CONFLICT (account_id) DO UPDATE
+                    SET booked = {balance_table}.booked + EXCLUDED.booked,
+                        updated_at = EXCLUDED.updated_at
+                )
+                SELECT id FROM new_transaction
+                """,
+                {
+                    "source": source_id,
+                    "destination": destination_id,
+                    "amount": amount,
+                    "status": enums.TransactionStatus.PROCESSED,
+                    "bank": cls._meta.get_field("registration_number").get_default(),
+                },
+            )
+            if cursor.fetchone() is None:
+                raise ValueError("Amount cannot be less than balance")
+
+        balance_cache.refresh_on_commit(
+            [source_id, destination_id], AccountBalance.available_of
+        )
+
+    @classmethod
+    @retry_on_conflict
+    @atomic
+    def bulk_transfer(
+        cls, instructions: list[TransferInstruction], all_or_nothing: bool = True
+    ) -> list[TransferResult]:
+        """
+        Execute a batch of internal transfers with a handful of set-based
+        queries instead of several round trips per transfer.
+
+        Instructions are validated in order against the locked balances, so
+        an earlier transfer can fund a later one. With `all_or_nothing` the
+        first invalid instruction raises ValueError and nothing is written,
+        otherwise invalid instructions are reported in their result and the
+        rest are written.
+        """
+        account_model = cls.account.field.related_model
+        account_ids = {i.source_account_id for i in instructions} | {
+            i.destination_account_id for i in instructions
+        }
+        statuses = dict(
+            account_model.objects.filter(pk__in=account_ids).values_list(
+                "pk", "account_status"
+            )
+        )
+        balances = cls.lock_balances(list(statuses))
+        available = {pk: balance.available for pk, balance in balances.items()}
+
+        results = []
+        for instruction in instructions:
+            error = cls._validate_instruction(instruction, statuses, available)
+            if error and all_or_nothing:
+                raise ValueError(f"{error} ({instruction})")
+
+            results.append(TransferResult(instruction, error=error))
+            if not error:
+                available[instruction.source_account_id] -= instruction.amount
+                available[instruction.destination_account_id] += instruction.amount
+
+        accepted = [result for result in results if result.ok]
+        transactions = Transaction.objects.bulk_create(
+            [Transaction() for _ in accepted], batch_size=constants.BULK_BATCH_SIZE
         )
 
+        entries = []
+        for result, new_transaction in zip(accepted, transactions, strict=True):
+            result.transaction_id = new_transaction.id
+            instruction = result.instruction
+            entries += [
+                # Source account
+                cls(
+                    amount=-instruction.amount,
+                    account_id=instruction.source_account_id,
+                    transaction=new_transaction,
+                    status=enums.TransactionStatus.PROCESSED,
+                ),
+                # Destination account
+                cls(
+                    amount=instruction.amount,
+                    account_id=instruction.destination_account_id,
+                    transaction=new_transaction,
+                    status=enums.TransactionStatus.PROCESSED,
+                ),
+            ]
+        cls.post_entries(entries)
+
+        return results
+
+    @staticmethod
+    def _validate_instruction(
+        instruction: TransferInstruction,
+        statuses: dict[int, int],
+        available: dict[int, Decimal],
+    ) -> str | None:
+        """Validate a batch instruction the same way `transfer` does."""
+        if instruction.amount <= 0:
+            return "Amount must be a positive number."
+
+        if instruction.source_account_id == instruction.destination_account_id:
+            return "Source account and destination account cannot be the same."
+
+        if instruction.source_account_id not in statuses:
+            return "Source account does not exist."
+
+        if instruction.destination_account_id not in statuses:
+            return "Destination account does not exist."
+
+        if statuses[instruction.destination_account_id] == AccountStatus.PENDING:
+            return "Cannot transfer money to pending account."
+
+        if available[instruction.source_account_id] < instruction.amount:
+            return "Amount cannot be less than balance"
+
+        return None
+
     @classmethod
+    @retry_on_conflict
     @atomic
     def transfer_external(
         cls,
@@ -94,35 +514,38 @@ class Ledger(base_model.BaseModel):
             raise ValueError("Destination account must be input")
 
         if amount <= 0:
-            print(amount)
             raise ValueError("Amount must be a positive number.")
 
-        # TODO: Handle this with better error page and handling.
-        if source_account.get_balance() < amount:
-            raise ValueError("Amount cannot be less than balance")
-
-        try:
-            bank = Bank.objects.get(reg_number=destination_reg_no)
-        except Bank.DoesNotExist as e:
-            raise e
+        bank = bank_registry.get(destination_reg_no)
 
         new_transaction = Transaction.objects.create()
 
-        # Source account
-        cls.objects.create(
-            amount=-amount,
-            account=source_account,
-            transaction_id=new_transaction.id,
-            registration_number=bank,
-            status=enums.TransactionStatus.PENDING,
-        )
         # Destination account the bank
-
         destination_account.id = 1
-        cls.objects.create(
-            amount=amount,
-            account=destination_account,
-            transaction=new_transaction,
+
+        balances = cls.lock_balances([source_account.pk, destination_account.id])
+
+        # TODO: Handle this with better error page and handling.
+        if balances[source_account.pk].available < amount:
+            raise ValueError("Amount cannot be less than balance")
+
+        cls.post_entries(
+            [
+                # Source account
+                cls(
+                    amount=-amount,
+                    account=source_account,
+                    transaction_id=new_transaction.id,
+                    registration_number=bank,
+                    status=enums.TransactionStatus.PENDING,
+                ),
+                cls(
+                    amount=amount,
+                    account=destination_account,
+                    transaction=new_transaction,
+                    status=enums.TransactionStatus.PENDING,
+                ),
+            ]
         )
         return new_transaction.id
 
@@ -134,70 +557,288 @@ class Ledger(base_model.BaseModel):
         destination_account: Any,
         amount: Decimal,
     ) -> None:
-        django_rq.enqueue(
-            cls.initiate_external_transfer,
+        if settings.INTERBANK_SENDER == "outbox":
+            cls.book_external_transfer(
+                source_account, registration_number, destination_account, amount
+            )
+            return
+
+        if settings.INTERBANK_SENDER == "batches":
+            cls.enqueue_batched_external_transfer(
+                source_account, registration_number, destination_account, amount
+            )
+            return
+
+        if settings.INTERBANK_SENDER == "dispatcher":
+            outgoing_transfers.push(
+                outgoing_transfers.DISPATCH,
+                registration_number,
+                outgoing_transfers.OutgoingTransfer(
+                    str(uuid4()), source_account.pk, destination_account.pk, amount
+                ),
+            )
+            return
+
+        # On the queue of the bank, so a slow bank only holds up its own
+        # workers, and ahead of its retries and batches, as the customer waits
+        job_queues.for_bank(registration_number).enqueue(
+            cls.initiate_external_transfer_job,
+            str(uuid4()),
+            source_account.pk,
+            registration_number,
+            destination_account.pk,
+            str(amount),
+            at_front=True,
+        )
+
+    @classmethod
+    @retry_on_conflict
+    @atomic
+    def book_external_transfer(
+        cls,
+        source_account: Any,
+        registration_number: Any,
+        destination_account: Any,
+        amount: Decimal,
+    ) -> OutboxTransfer:
+        """
+        Book an external transfer and put it in the outbox, in one database
+        transaction, for `relay_external_transfers` to send.
+        """
+        # Booking credits the bank, so keep the id to send first
+        destination_account_id = destination_account.id
+        transaction_id = cls.transfer_external(
+            source_account, registration_number, destination_account, amount
+        )
+        return OutboxTransfer.objects.create(
+            transaction_id=transaction_id,
+            registration_number=bank_registry.get(registration_number),
+            source_account_id=source_account.pk,
+            destination_account=destination_account_id,
             amount=amount,
-            source_account=source_account,
-            destination_reg_no=registration_number,
-            destination_account=destination_account,
         )
 
     @classmethod
-    def set_status(cls, transaction_id: int, status: enums.TransactionStatus) -> None:
-        ledger = cls.objects.filter(transaction_id=transaction_id)
+    def relay_external_transfers(
+        cls, limit: int = constants.INTERBANK_OUTBOX_BATCH_SIZE
+    ) -> int:
+        """
+        Send up to `limit` transfers from the outbox, oldest first, and
+        delete them. Rows are claimed with SELECT ... FOR UPDATE SKIP LOCKED
+        and a lease of `INTERBANK_OUTBOX_LEASE_SECONDS`, so relays running
+        in parallel take different transfers. The sends run outside any
+        database transaction, and each transfer is finalized and deleted in
+        its own. If a relay dies on the way, its transfers are sent again
+        after the lease with the same reference, and the receiving bank
+        replays its first answer. Transfers the bank failed to take stay in
+        the outbox until their next attempt, see `retry_outbox_transfer`.
+        Returns the number of transfers relayed, transfers that raised are
+        left to be sent again after the lease.
+        """
+        with atomic():
+            transfers = list(
+                OutboxTransfer.objects.select_for_update(skip_locked=True, of=("self",))
+                .filter(
+                    models.Q(claimed_until__isnull=True)
+                    | models.Q(claimed_until__lt=now())
+                )
+                .select_related("registration_number")
+                .order_by("id")[:limit]
+            )
+            OutboxTransfer.objects.filter(
+                pk__in=[transfer.pk for transfer in transfers]
+            ).update(
+                claimed_until=now()
+                + timedelta(seconds=constants.INTERBANK_OUTBOX_LEASE_SECONDS)
+            )
 
-        if ledger is None:
-            raise ValueError("No ledger found")
+        relayed = 0
+        for transfer in transfers:
+            lag = (now() - transfer.created_at).total_seconds()
+            metrics.incr("outbox.lag_seconds", lag)
+            metrics.maximum("outbox.lag_max_seconds", lag)
+            try:
+                status = cls.post_external_transfer(
+                    transfer.registration_number.reg_number,
+                    outgoing_transfers.OutgoingTransfer(
+                        str(transfer.reference),
+                        transfer.source_account_id,
+                        transfer.destination_account,
+                        transfer.amount,
+                        transaction_id=transfer.transaction_id,
+                        attempt=transfer.attempt,
+                    ),
+                )
+                if status is None:
+                    cls.retry_outbox_transfer(transfer)
+                    continue
+                # Finalizing deletes it from the outbox
+                cls.finalize_external_transfer(
+                    transaction_id=transfer.transaction_id, status=status
+                )
+            except Exception:
+                # Left for after the lease, so one transfer cannot hold up the rest
+                metrics.incr("outbox.errors")
+                logger.exception("Relaying outbox transfer %s failed", transfer.pk)
+                continue
+            relayed += 1
 
-        ledger.update(status=status)
+        metrics.incr("outbox.relayed", relayed)
+        return relayed
 
     @classmethod
-    def login_and_get_session(cls, reg_number: Any) -> requests.Session:
-        """Login and get session, we also add retry strategy."""
-        with requests.Session() as session:
-            retries = Retry(
-                total=5,
-                backoff_factor=1,
-                status_forcelist=[500, 502, 503, 504],
+    def enqueue_batched_external_transfer(
+        cls,
+        source_account: Any,
+        registration_number: Any,
+        destination_account: Any,
+        amount: Decimal,
+    ) -> None:
+        """
+        Queue an external transfer in the batch of its bank. The first
+        transfer of a batch schedules the send after the batch window, the
+        transfer that fills the batch sends it right away.
+        """
+        size = outgoing_transfers.push(
+            outgoing_transfers.BATCH,
+            registration_number,
+            outgoing_transfers.OutgoingTransfer(
+                str(uuid4()), source_account.pk, destination_account.pk, amount
+            ),
+        )
+        queue = job_queues.for_bank(registration_number)
+        if size >= constants.INTERBANK_BATCH_SIZE:
+            queue.enqueue(cls.send_external_batches, registration_number)
+        elif size == 1:
+            queue.enqueue_in(
+                timedelta(seconds=constants.INTERBANK_BATCH_WINDOW_SECONDS),
+                cls.send_external_batches,
+                registration_number,
             )
-            session = requests.Session()
-            adapter = HTTPAdapter(max_retries=retries)
-            session.mount("http://", adapter)
-            session.mount("https://", adapter)
-
-            # GET request to fetch CSRF token
-            bank = Bank.objects.get(reg_number=reg_number)
-            login_url = f"{bank.url}/accounts/login/"
-            initial_response = session.get(login_url)
-            initial_response.raise_for_status()
-
-            # Extract CSRF token from cookies
-            csrf_token = session.cookies.get("csrftoken")
-
-            if not csrf_token:
-                raise ValueError("CSRF token not found in initial response")
-
-            # POST request with CSRF token and credentials
-            credentials = {
-                "username": os.environ["USER_NAME"],
-                "password": os.environ["PASSWORD"],
-                "csrfmiddlewaretoken": csrf_token,
-            }
 
-            headers = {
-                "Content-Type": "application/x-www-form-urlencoded",
-                "Referer": login_url,  # Adding the Referer header
-                "X-CSRFToken": csrf_token,
-            }
+    @classmethod
+    def send_external_batches(cls, reg_number: str) -> None:
+        """Book and send the waiting external transfers for a bank."""
+        account_model = cls.account.field.related_model
+
+        # Claims of a sender that died before booking them
+        outgoing_transfers.recover(outgoing_transfers.BATCH, reg_number)
+        while True:
+            if not circuit_breaker.allow(reg_number):
+                # The transfers wait unbooked until the bank may be tried again
+                job_queues.for_bank(reg_number).enqueue_in(
+                    timedelta(seconds=constants.INTERBANK_BREAKER_OPEN_SECONDS),
+                    cls.send_external_batches,
+                    reg_number,
+                )
+                return
 
-            login_response = session.post(
-                url=login_url, data=credentials, headers=headers, allow_redirects=False
+            items = outgoing_transfers.claim(
+                outgoing_transfers.BATCH, reg_number, constants.INTERBANK_BATCH_SIZE
+            )
+            if not items:
+                return
+            sources = account_model.objects.in_bulk(
+                {item.source_account_id for item in items}
             )
 
-            login_response.raise_for_status()
+            booked = []
+            for item in items:
+                try:
+                    transaction_id = cls.transfer_external(
+                        sources[item.source_account_id],
+                        reg_number,
+                        # Only the id travels, the bank itself is credited here
+                        account_model(pk=item.destination_account_id),
+                        item.amount,
+                    )
+                except (ValueError, KeyError) as e:
+                    logger.warning(
+                        "External transfer %s not booked: %r", item.reference, e
+                    )
+                else:
+                    booked.append(replace(item, transaction_id=transaction_id))
+            # Booked ones are in the ledger now, the others are dropped
+            outgoing_transfers.ack(outgoing_transfers.BATCH, reg_number, items)
 
-            # Return the session for subsequent authenticated requests
-            return session
+            if not booked:
+                continue
+            metrics.incr("interbank.batches")
+            metrics.incr("interbank.batched_transfers", len(booked))
+
+            try:
+                results = interbank_batches.send(bank_registry.get(reg_number), booked)
+            except (requests.RequestException, ValueError, Bank.DoesNotExist) as e:
+                # Booked transfers are retried one by one
+                logger.info("Batch to bank %s failed: %s", reg_number, e)
+                circuit_breaker.record_failure(reg_number)
+                for item in booked:
+                    cls.retry_external_transfer(reg_number, item)
+                continue
+
+            circuit_breaker.record_success(reg_number)
+            for item in booked:
+                cls.finalize_external_transfer(
+                    transaction_id=item.transaction_id,
+                    status=(
+                        enums.TransactionStatus.PROCESSED
+                        if results.get(item.reference) == interbank_batches.PROCESSED
+                        else enums.TransactionStatus.REJECTED
+                    ),
+                )
+
+    @classmethod
+    @atomic
+    def set_status(cls, transaction_id: int, status: enums.TransactionStatus) -> None:
+        ledger = cls.objects.filter(transaction_id=transaction_id)
+        entries = list(
+            ledger.select_for_update().values_list(
+                "account_id", "status", "amount", "created_at"
+            )
+        )
+
+        if not entries:
+            raise ValueError("No ledger found")
+
+        ledger.update(status=status)
+
+        # Move each entry from the balance bucket of its old status to the new one
+        deltas: dict[int, tuple[Decimal, Decimal]] = {}
+        for account_id, old_status, amount, _ in entries:
+            old_booked, old_pending = AccountBalance.split(old_status, amount)
+            new_booked, new_pending = AccountBalance.split(status, amount)
+            booked, pending = deltas.get(account_id, (Decimal(0), Decimal(0)))
+            deltas[account_id] = (
+                booked + new_booked - old_booked,
+                pending + new_pending - old_pending,
+            )
+        cls.lock_balances(list(deltas))
+        AccountBalance.apply(deltas)
+
+        # Closing balances from the day of the entries onward no longer hold
+        BalanceCheckpoint.objects.filter(
+            account_id__in=deltas,
+            day__gte=min(localtime(created_at).date() for *_, created_at in entries),
+        ).delete()
+
+    @classmethod
+    def initiate_external_transfer_job(
+        cls,
+        reference: str,
+        source_account_id: int,
+        registration_number: str,
+        destination_account_id: int,
+        amount: str,
+    ) -> None:
+        """RQ job for `initiate_external_transfer`, loading the source account."""
+        account_model = cls.account.field.related_model
+        cls.initiate_external_transfer(
+            source_account=account_model.objects.get(pk=source_account_id),
+            destination_reg_no=registration_number,
+            destination_account=account_model(pk=destination_account_id),
+            amount=Decimal(amount),
+            reference=reference,
+        )
 
     @classmethod
     def initiate_external_transfer(
@@ -206,54 +847,208 @@ class Ledger(base_model.BaseModel):
         destination_reg_no: Any,
         destination_account: Any,
         amount: Decimal,
+        reference: str | None = None,
     ) -> None:
         """Initiate the transfer to the external bank."""
 
-        # form data
-        data = {
-            "source_account": source_account.id,
-            "destination_account": destination_account.id,
-            "registration_number": destination_reg_no,
-            "amount": amount,
-        }
-        session = cls.login_and_get_session(reg_number=destination_reg_no)
-        # URL of the external bank's `transaction_list` view
-        bank = Bank.objects.get(reg_number=destination_reg_no)
-        external_bank_url = f"{bank.url}/external-transfer/"
-        csrf_token = session.cookies.get("csrftoken")
-        idempotency_key = str(uuid4())
+        # Booking credits the bank, so keep the id to send first
+        transfer = outgoing_transfers.OutgoingTransfer(
+            reference or str(uuid4()),
+            source_account.id,
+            destination_account.id,
+            amount,
+        )
+        transaction_id = cls.transfer_external(
+            source_account, destination_reg_no, destination_account, amount
+        )
+        cls.send_external_transfer(
+            destination_reg_no, replace(transfer, transaction_id=transaction_id)
+        )
+
+    @classmethod
+    def post_external_transfer(
+        cls, reg_number: str, transfer: outgoing_transfers.OutgoingTransfer
+    ) -> enums.TransactionStatus | None:
+        """
+        Send a booked external transfer to its bank. Returns the status to
+        finalize it with, or None when it has to be sent again later: the
+        bank could not be reached, its circuit breaker is open or it asked
+        for a retry.
+        """
+        if not circuit_breaker.allow(reg_number):
+            return None
+
+        # The reference is the idempotency key, so a retry is never booked twice
         try:
-            transaction_id = cls.transfer_external(
-                source_account, destination_reg_no, destination_account, amount
+            response = interbank.post(
+                bank_registry.get(reg_number),
+                interbank_batches.TRANSFER_PATH,
+                data={
+                    "source_account": transfer.source_account_id,
+                    "destination_account": transfer.destination_account_id,
+                    "registration_number": reg_number,
+                    "amount": transfer.amount,
+                },
+                headers={"Idempotency-Key": transfer.reference},
             )
-            headers = {
-                "Content-Type": "application/x-www-form-urlencoded",
-                "X-CSRFToken": csrf_token,
-                "Idempotency-Key": idempotency_key,
-            }
+            if response.status_code >= 500:
+                response.raise_for_status()
+        except (requests.RequestException, ValueError, Bank.DoesNotExist) as e:
+            # Failed logins raise ValueError
+            logger.info("External transfer %s failed: %s", transfer.reference, e)
+            circuit_breaker.record_failure(reg_number)
+            return None
 
-            response = session.post(
-                external_bank_url,
-                data=data,
-                headers=headers,
+        # The bank answered, so it does not count against its breaker
+        circuit_breaker.record_success(reg_number)
+        return cls._answered_status(response.status_code)
+
+    @classmethod
+    async def apost_external_transfer(
+        cls, bank: Bank, transfer: outgoing_transfers.OutgoingTransfer
+    ) -> enums.TransactionStatus | None:
+        """Async version of `post_external_transfer`, to a bank already looked up."""
+        if not await circuit_breaker.aallow(bank.reg_number):
+            return None
+
+        try:
+            response = await interbank.apost(
+                bank,
+                interbank_batches.TRANSFER_PATH,
+                data={
+                    "source_account": str(transfer.source_account_id),
+                    "destination_account": str(transfer.destination_account_id),
+                    "registration_number": bank.reg_number,
+                    "amount": str(transfer.amount),
+                },
+                headers={"Idempotency-Key": transfer.reference},
             )
+            if response.status_code >= 500:
+                response.raise_for_status()
+        except (httpx.HTTPError, ValueError) as e:
+            # Failed logins raise ValueError
+            logger.info("External transfer %s failed: %s", transfer.reference, e)
+            await circuit_breaker.arecord_failure(bank.reg_number)
+            return None
 
-            response.raise_for_status()
+        await circuit_breaker.arecord_success(bank.reg_number)
+        return cls._answered_status(response.status_code)
 
-            if response.status_code == 200:
-                cls.finalize_external_transfer(
-                    transaction_id=transaction_id,
-                    status=enums.TransactionStatus.PROCESSED,
-                )
-                return None
+    @staticmethod
+    def _answered_status(status_code: int) -> enums.TransactionStatus | None:
+        """Status of a transfer the bank answered, None to send it again later."""
+        if status_code in interbank.RETRY_STATUSES:
+            return None
+        if status_code == 200:
+            return enums.TransactionStatus.PROCESSED
+        return enums.TransactionStatus.REJECTED
+
+    @classmethod
+    def send_external_transfer(
+        cls, reg_number: str, transfer: outgoing_transfers.OutgoingTransfer
+    ) -> None:
+        """
+        Send a booked external transfer and finalize it with the answer of
+        the bank. When the bank cannot be reached or its circuit breaker is
+        open, the transfer waits in the retry queue instead.
+        """
+        cls.complete_external_transfer(
+            reg_number, transfer, cls.post_external_transfer(reg_number, transfer)
+        )
+
+    @classmethod
+    def complete_external_transfer(
+        cls,
+        reg_number: str,
+        transfer: outgoing_transfers.OutgoingTransfer,
+        status: enums.TransactionStatus | None,
+    ) -> None:
+        """
+        Finalize a sent transfer with the status from the answer of the bank,
+        or park it in the retry queue when there is none.
+        """
+        if status is None:
+            cls.retry_external_transfer(reg_number, transfer)
+            return
 
+        if transfer.attempt:
+            outgoing_transfers.settle(reg_number, transfer)
+        cls.finalize_external_transfer(
+            transaction_id=transfer.transaction_id, status=status
+        )
+
+    @staticmethod
+    def retry_delay(attempt: int) -> int:
+        """Seconds before an attempt, with exponential backoff."""
+        return min(
+            constants.INTERBANK_RETRY_BASE_DELAY_SECONDS * 2 ** (attempt - 1),
+            constants.INTERBANK_RETRY_MAX_DELAY_SECONDS,
+        )
+
+    @classmethod
+    def retry_external_transfer(
+        cls, reg_number: str, transfer: outgoing_transfers.OutgoingTransfer
+    ) -> None:
+        """
+        Park a booked transfer for another attempt with exponential backoff,
+        or reject it once it ran out of attempts.
+        """
+        attempt = transfer.attempt + 1
+        if attempt > constants.INTERBANK_RETRY_ATTEMPTS:
+            metrics.incr("interbank.retries_exhausted")
+            outgoing_transfers.settle(reg_number, transfer)
             cls.finalize_external_transfer(
-                transaction_id=transaction_id,
+                transaction_id=transfer.transaction_id,
                 status=enums.TransactionStatus.REJECTED,
             )
+            return
 
-        except requests.RequestException as e:
-            print(e)
+        metrics.incr("interbank.retries_parked")
+        due = math.ceil(
+            outgoing_transfers.park(
+                reg_number, replace(transfer, attempt=attempt), cls.retry_delay(attempt)
+            )
+        )
+        # One job per bank and second serves every transfer due by then
+        job_queues.for_bank(reg_number).enqueue_at(
+            datetime.fromtimestamp(due).astimezone(),
+            cls.retry_external_transfers,
+            reg_number,
+            job_id=f"interbank-retry-{reg_number}-{due}",
+        )
+
+    @classmethod
+    def retry_outbox_transfer(cls, transfer: OutboxTransfer) -> None:
+        """
+        Keep a transfer the bank failed to take in the outbox until its next
+        attempt, with the backoff of `retry_external_transfer`, or reject it
+        once it ran out of attempts. The outbox row is only deleted when the
+        transfer is finalized, so nothing but the database has to survive
+        until then.
+        """
+        attempt = transfer.attempt + 1
+        if attempt > constants.INTERBANK_RETRY_ATTEMPTS:
+            metrics.incr("interbank.retries_exhausted")
+            cls.finalize_external_transfer(
+                transaction_id=transfer.transaction_id,
+                status=enums.TransactionStatus.REJECTED,
+            )
+            return
+
+        metrics.incr("interbank.retries_parked")
+        OutboxTransfer.objects.filter(pk=transfer.pk).update(
+            attempt=attempt,
+            claimed_until=now() + timedelta(seconds=cls.retry_delay(attempt)),
+        )
+
+    @classmethod
+    def retry_external_transfers(cls, reg_number: str) -> None:
+        """Send the parked transfers for a bank that are due."""
+        while transfers := outgoing_transfers.take_due(
+            reg_number, constants.INTERBANK_BATCH_SIZE
+        ):
+            for transfer in transfers:
+                cls.send_external_transfer(reg_number, transfer)
 
     @classmethod
     @atomic
@@ -270,3 +1065,5 @@ class Ledger(base_model.BaseModel):
             raise ValueError("Transaction not found")
 
         cls.set_status(transaction_id=transaction_id, status=status)
+        # A finalized transfer is done with the outbox
+        OutboxTransfer.objects.filter(transaction_id=transaction_id).delete()
@@ -0,0 +1,35 @@
+from django.db import models
+
+from best_bank_as import enums
+
+
+class LedgerArchive(models.Model):
+    """
+    Model for settled ledger entries moved out of the ledger by the
+    archive_ledger command. Entries keep their ledger id and creation time,
+    the ledger keeps a carried forward opening balance per account instead.
+    """
+
+    id = models.BigIntegerField(primary_key=True)
+    created_at = models.DateTimeField()
+    registration_number = models.ForeignKey(
+        "best_bank_as.Bank", on_delete=models.CASCADE
+    )
+    amount = models.DecimalField(max_digits=15, decimal_places=2)
+    status = models.IntegerField(choices=enums.TransactionStatus.choices)
+    account = models.ForeignKey("Account", on_delete=models.CASCADE, null=True)
+    transaction = models.ForeignKey("Transaction", on_delete=models.CASCADE, null=True)
+    counterpart_account = models.ForeignKey(
+        "Account",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="+",
+    )
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["account", "created_at", "id"])]
+
+    def __str__(self) -> str:
+        return f"Archived ledger {self.pk}: {self.amount} on account {self.account_id}"
@@ -0,0 +1,37 @@
+from uuid import uuid4
+
+from django.db import models
+
+from best_bank_as.db_models.core import base_model
+
+
+class OutboxTransfer(base_model.BaseModel):
+    """
+    Model for booked external transfers waiting to be sent. A row is written
+    in the same database transaction as the pending ledger entries of the
+    transfer and deleted once the transfer is finalized. Transfers the bank
+    failed to take stay until their next attempt, see
+    `Ledger.relay_external_transfers`.
+    """
+
+    # Sent as the idempotency key, so a transfer relayed twice is booked once
+    reference = models.UUIDField(default=uuid4, unique=True)
+    transaction = models.OneToOneField("Transaction", on_delete=models.CASCADE)
+    # A bank with transfers still to send cannot be deleted
+    registration_number = models.ForeignKey(
+        "best_bank_as.Bank", on_delete=models.PROTECT
+    )
+    source_account = models.ForeignKey("Account", on_delete=models.CASCADE)
+    # Account number in the receiving bank
+    destination_account = models.IntegerField()
+    amount = models.DecimalField(max_digits=15, decimal_places=2)
+    # Lease of the relay sending it or the next attempt, relays skip it until then
+    claimed_until = models.DateTimeField(null=True, blank=True)
+    # Attempts the bank failed to take
+    attempt = models.PositiveSmallIntegerField(default=0)
+
+    def __str__(self) -> str:
+        return (
+            f"Outbox transfer {self.reference}: {self.amount} to "
+            f"{self.destination_account} in bank {self.registration_number_id}"
+        )
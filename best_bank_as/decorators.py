@@ -1,28 +1,42 @@
 # noqa
 
+import random
+import time
 from functools import wraps
 from typing import Any, Literal
 
+from asgiref.sync import iscoroutinefunction
 from django.contrib.auth.decorators import login_required
+from django.contrib.auth.views import redirect_to_login
+from django.db import OperationalError, connection
 from django.http import HttpRequest, HttpResponse
 from django.shortcuts import render
 
+from best_bank_as import constants, metrics
+from best_bank_as.async_helpers import aget_user, arender
 
-def group_required(*group_names: Literal["customer", "employee", "supervisor"]) -> Any:
-    """Decorator to check if user is in a group."""
+# PostgreSQL serialization_failure and deadlock_detected
+CONFLICT_PGCODES = {"40001", "40P01"}
+
+
+def group_required(
+    *group_names: Literal["customer", "employee", "supervisor"],
+    peer_banks: bool = False,
+) -> Any:
+    """
+    Decorator to check if user is in a group. With `peer_banks`, requests
+    signed by another bank are let through as well, see
+    InterbankSignatureMiddleware.
+    """
 
     def _decorator(view_func: Any) -> Any:  # Callable
         @wraps(view_func)
         @login_required
-        def _wrapped_view(
-            request: HttpRequest, *args: Any, **kwargs: Any
-        ) -> HttpResponse:
+        def _user_view(request: HttpRequest, *args: Any, **kwargs: Any) -> HttpResponse:
             if request.user.is_staff or request.user.is_superuser:
                 return view_func(request, *args, **kwargs)
 
-            groups = request.user.groups.all()
-
-            if not any(group.name in group_names for group in groups):
+            if request.user.group_names.isdisjoint(group_names):
                 return render(
                     request,
                     "best_bank_as/error_pages/error_page.html",
@@ -30,6 +44,68 @@ def group_required(*group_names: Literal["customer", "employee", "supervisor"])
 
             return view_func(request, *args, **kwargs)
 
+        @wraps(view_func)
+        def _wrapped_view(
+            request: HttpRequest, *args: Any, **kwargs: Any
+        ) -> HttpResponse:
+            if peer_banks and getattr(request, "peer_bank", None) is not None:
+                return view_func(request, *args, **kwargs)
+            return _user_view(request, *args, **kwargs)
+
+        @wraps(view_func)
+        async def _async_wrapped_view(
+            request: HttpRequest, *args: Any, **kwargs: Any
+        ) -> HttpResponse:
+            if peer_banks and getattr(request, "peer_bank", None) is not None:
+                return await view_func(request, *args, **kwargs)
+
+            user = await aget_user(request)
+            if not user.is_authenticated:
+                return redirect_to_login(request.get_full_path())
+
+            if user.is_staff or user.is_superuser:
+                return await view_func(request, *args, **kwargs)
+
+            user_groups = await user.aload_group_names()
+            if not user_groups.isdisjoint(group_names):
+                return await view_func(request, *args, **kwargs)
+
+            return await arender(request, "best_bank_as/error_pages/error_page.html")
+
+        if iscoroutinefunction(view_func):
+            return _async_wrapped_view
         return _wrapped_view
 
     return _decorator
+
+
+def retry_on_conflict(func: Any) -> Any:
+    """
+    Decorator to retry a transaction on serialization failures and deadlocks.
+    Backs off exponentially with jitter and gives up after a bounded number of
+    attempts. Inside an outer transaction the error is raised immediately,
+    since only the outermost block can be retried.
+    """
+
+    @wraps(func)
+    def _wrapped(*args: Any, **kwargs: Any) -> Any:
+        for attempt in range(1, constants.TRANSFER_RETRY_ATTEMPTS + 1):
+            try:
+                return func(*args, **kwargs)
+            except OperationalError as e:
+                pgcode = getattr(e.__cause__, "pgcode", None)
+                if (
+                    pgcode not in CONFLICT_PGCODES
+                    or connection.in_atomic_block
+                    or attempt == constants.TRANSFER_RETRY_ATTEMPTS
+                ):
+                    raise
+
+                metrics.incr("transfer.retries")
+                delay = min(
+                    constants.TRANSFER_RETRY_MAX_DELAY_SECONDS,
+                    constants.TRANSFER_RETRY_BASE_DELAY_SECONDS * 2 ** (attempt - 1),
+                )
+                time.sleep(delay * random.uniform(0.5, 1))
+
+    return _wrapped
@@ -1,9 +1,11 @@
 import os
+from decimal import Decimal
 from typing import Any
 
 from django import forms
 from django.contrib.auth.models import User
 
+from best_bank_as import bank_registry
 from best_bank_as.db_models.account import Account
 from best_bank_as.enums import AccountStatus
 
@@ -15,9 +17,14 @@ class TransferForm(forms.Form):
         queryset=Account.objects.none(), label="Source Account"
     )
 
-    registration_number = forms.CharField(label="Destination Registration Number")
+    registration_number = forms.CharField(
+        label="Destination Registration Number",
+        validators=[bank_registry.validate_registration_number],
+    )
     destination_account = forms.IntegerField(label="Destination Account Number")
-    amount = forms.DecimalField(decimal_places=2, label="Amount to Transfer")
+    amount = forms.DecimalField(
+        decimal_places=2, min_value=Decimal("0.01"), label="Amount to Transfer"
+    )
 
     def __init__(self, user: User, *args: Any, **kwargs: Any) -> None:
         super().__init__(*args, **kwargs)
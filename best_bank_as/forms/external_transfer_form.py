@@ -1,9 +1,13 @@
 from django import forms
 
+from best_bank_as import bank_registry
+
 
 class ExternalTransferForm(forms.Form):
     """Form for external transfer."""
 
     destination_account = forms.IntegerField()
     amount = forms.DecimalField(decimal_places=2)
-    registration_number = forms.CharField()
+    registration_number = forms.CharField(
+        validators=[bank_registry.validate_registration_number]
+    )
@@ -0,0 +1,117 @@
+"""
+Idempotency keys of POST requests, kept in the django-rq Redis so every
+worker process sees the same keys.
+
+A key is claimed with SET NX before the request runs and holds `IN_FLIGHT`
+until the response is stored under it. Retries of a completed request get
+the stored response, retries of one still in flight are refused.
+"""
+
+import base64
+import json
+from typing import Any
+
+from django.http import HttpRequest, HttpResponse, HttpResponseBase
+
+from best_bank_as import constants, metrics, redis_clients
+
+IN_FLIGHT = b"in-flight"
+
+
+def owner(request: HttpRequest, user: Any) -> int | str | None:
+    """Whose keys a request uses, peer banks have their own."""
+    peer_bank = getattr(request, "peer_bank", None)
+    if peer_bank is not None:
+        return f"bank-{peer_bank.reg_number}"
+    return user.pk
+
+
+def redis_key(owner: int | str | None, path: str, idempotency_key: str) -> str:
+    """
+    Keys are scoped to an owner, a user id or a peer bank, and an endpoint,
+    so they cannot replay others.
+    """
+    return f"idempotency:{owner or 0}:{path}:{idempotency_key}"
+
+
+def _claimed(stored: bytes | None) -> bytes | None:
+    if stored is None:
+        metrics.incr("idempotency.claimed")
+    elif stored == IN_FLIGHT:
+        metrics.incr("idempotency.in_flight_conflicts")
+    else:
+        metrics.incr("idempotency.duplicates")
+    return stored
+
+
+def _serialize(response: HttpResponseBase) -> bytes | None:
+    if response.streaming or response.status_code >= 500:
+        # Streams cannot be replayed and server errors should be retried
+        return None
+    return json.dumps(
+        {
+            "status": response.status_code,
+            "headers": dict(response.headers),
+            "body": base64.b64encode(response.content).decode(),
+        }
+    ).encode()
+
+
+def claim(key: str) -> bytes | None:
+    """
+    Claim a key for a new request. Returns None when claimed, otherwise
+    what is stored under the key: `IN_FLIGHT` or a completed response for
+    `replay`.
+    """
+    redis = redis_clients.client()
+    if redis.set(key, IN_FLIGHT, nx=True, ex=constants.IDEMPOTENCY_IN_FLIGHT_SECONDS):
+        return _claimed(None)
+    return _claimed(redis.get(key))
+
+
+async def aclaim(key: str) -> bytes | None:
+    """Async version of `claim`."""
+    redis = redis_clients.async_client()
+    if await redis.set(
+        key, IN_FLIGHT, nx=True, ex=constants.IDEMPOTENCY_IN_FLIGHT_SECONDS
+    ):
+        return _claimed(None)
+    return _claimed(await redis.get(key))
+
+
+def complete(key: str, response: HttpResponseBase) -> None:
+    """Store the response of a claimed request, or release the key."""
+    stored = _serialize(response)
+    if stored is None:
+        release(key)
+        return
+    redis_clients.client().set(key, stored, ex=constants.IDEMPOTENCY_KEY_TTL_SECONDS)
+
+
+async def acomplete(key: str, response: HttpResponseBase) -> None:
+    """Async version of `complete`."""
+    stored = _serialize(response)
+    if stored is None:
+        await arelease(key)
+        return
+    await redis_clients.async_client().set(
+        key, stored, ex=constants.IDEMPOTENCY_KEY_TTL_SECONDS
+    )
+
+
+def release(key: str) -> None:
+    """Drop the claim of a request that failed, so it can be retried."""
+    redis_clients.client().delete(key)
+
+
+async def arelease(key: str) -> None:
+    """Async version of `release`."""
+    await redis_clients.async_client().delete(key)
+
+
+def replay(stored: bytes) -> HttpResponse:
+    """Rebuild a completed response stored by `complete`."""
+    data = json.loads(stored)
+    return HttpResponse(
+        base64.b64decode(data["body"]), status=data["status"], headers=data["headers"]
+    )
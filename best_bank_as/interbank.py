@@ -0,0 +1,323 @@
+"""
+Authenticated HTTP sessions to other banks. One keep-alive session is kept
+per bank for the lifetime of the process, so jobs after the first skip the
+login round trips and the connection handshake. Banks sharing a signing key
+with this bank get signed requests instead and are never logged in to.
+
+Async code, the transfer dispatcher, uses `apost`, with httpx sessions kept
+per event loop, so requests in flight wait on the loop instead of a thread.
+"""
+
+import asyncio
+import os
+import threading
+from typing import Any
+from urllib.parse import urlsplit
+from uuid import uuid4
+from weakref import WeakKeyDictionary
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from best_bank_as import constants, interbank_signing, metrics
+from best_bank_as.db_models.bank import Bank
+
+LOGIN_PATH = "/accounts/login/"
+# Answers to send again later, the request is still in flight at the bank or
+# the bank is overloaded
+RETRY_STATUSES = {409, 429}
+
+_lock = threading.Lock()
+_sessions: dict[str, requests.Session] = {}
+# Threads sharing the session of a bank log in one at a time
+_login_locks: dict[str, threading.Lock] = {}
+# Async sessions are bound to the event loop they were created on, tasks
+# sharing the session of a bank log in one at a time
+_async_sessions: WeakKeyDictionary[
+    asyncio.AbstractEventLoop, dict[str, tuple[httpx.AsyncClient, asyncio.Lock]]
+] = WeakKeyDictionary()
+
+
+def _count(response: requests.Response, *args: Any, **kwargs: Any) -> None:
+    metrics.incr("interbank.requests")
+
+
+def _new_session() -> requests.Session:
+    session = requests.Session()
+    # Short, banks that stay down are left to the retry queue of the ledger
+    retries = Retry(
+        total=constants.INTERBANK_REQUEST_RETRIES,
+        backoff_factor=1,
+        status_forcelist=[500, 502, 503, 504],
+    )
+    adapter = HTTPAdapter(max_retries=retries)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.hooks["response"].append(_count)
+    return session
+
+
+def _csrf_token(session: requests.Session) -> str | None:
+    session.cookies.clear_expired_cookies()
+    return session.cookies.get("csrftoken")
+
+
+def _login(session: requests.Session, bank: Bank) -> None:
+    """Log in to a bank with the credentials of this bank."""
+    metrics.incr("interbank.logins")
+    session.cookies.clear()
+
+    # GET request to fetch CSRF token
+    login_url = f"{bank.url}{LOGIN_PATH}"
+    initial_response = session.get(
+        login_url, timeout=constants.INTERBANK_TIMEOUT_SECONDS
+    )
+    initial_response.raise_for_status()
+
+    csrf_token = _csrf_token(session)
+    if not csrf_token:
+        raise ValueError("CSRF token not found in initial response")
+
+    # POST request with CSRF token and credentials
+    credentials = {
+        "username": os.environ["USER_NAME"],
+        "password": os.environ["PASSWORD"],
+        "csrfmiddlewaretoken": csrf_token,
+    }
+    headers = {
+        "Content-Type": "application/x-www-form-urlencoded",
+        "Referer": login_url,
+        "X-CSRFToken": csrf_token,
+    }
+    login_response = session.post(
+        url=login_url,
+        data=credentials,
+        headers=headers,
+        allow_redirects=False,
+        timeout=constants.INTERBANK_TIMEOUT_SECONDS,
+    )
+    login_response.raise_for_status()
+
+
+def _rejected(response: requests.Response | httpx.Response) -> bool:
+    """Check if a bank refused the session of a request."""
+    if response.status_code in (401, 403):
+        return True
+    # Django sends requests without a valid session to the login page
+    return response.is_redirect and LOGIN_PATH in response.headers.get("Location", "")
+
+
+def _session(bank: Bank) -> requests.Session:
+    with _lock:
+        session = _sessions.get(bank.reg_number)
+        if session is None:
+            session = _sessions[bank.reg_number] = _new_session()
+            _login_locks[bank.reg_number] = threading.Lock()
+        return session
+
+
+def connect(bank: Bank) -> requests.Session:
+    """Return the session for a bank, logging in if it has none yet."""
+    session = _session(bank)
+    with _login_locks[bank.reg_number]:
+        if _csrf_token(session) is None:
+            _login(session, bank)
+    return session
+
+
+def post(
+    bank: Bank,
+    path: str,
+    data: dict[str, Any] | None = None,
+    json: Any = None,
+    headers: dict[str, str] | None = None,
+) -> requests.Response:
+    """
+    POST form `data` or a `json` body to a bank. When the bank rejects the
+    session or its CSRF cookie expired, log in again and repeat the request
+    once. Requests to banks with a signing key are signed instead.
+    """
+    if bank.signing_key:
+        return _signed_post(bank, path, data, json, headers or {})
+
+    session = connect(bank)
+    for attempt in range(2):
+        if attempt:
+            metrics.incr("interbank.rejected_sessions")
+            with _login_locks[bank.reg_number]:
+                _login(session, bank)
+        response = session.post(
+            f"{bank.url}{path}",
+            data=data,
+            json=json,
+            headers={"X-CSRFToken": _csrf_token(session) or "", **(headers or {})},
+            allow_redirects=False,
+            timeout=constants.INTERBANK_TIMEOUT_SECONDS,
+        )
+        if not _rejected(response):
+            break
+    return response
+
+
+def _signed_post(
+    bank: Bank,
+    path: str,
+    data: dict[str, Any] | None,
+    json: Any,
+    headers: dict[str, str],
+) -> requests.Response:
+    session = _session(bank)
+    request = session.prepare_request(
+        requests.Request(
+            "POST", f"{bank.url}{path}", data=data, json=json, headers=headers
+        )
+    )
+    body = request.body or b""
+    request.headers.update(
+        interbank_signing.sign(
+            bank.signing_key,
+            "POST",
+            urlsplit(request.url).path,
+            headers.get(interbank_signing.NONCE_HEADER) or str(uuid4()),
+            body.encode() if isinstance(body, str) else body,
+        )
+    )
+    return session.send(
+        request, allow_redirects=False, timeout=constants.INTERBANK_TIMEOUT_SECONDS
+    )
+
+
+def close() -> None:
+    """Close the sessions of all banks."""
+    with _lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+        _login_locks.clear()
+    for session in sessions:
+        session.close()
+
+
+async def _acount(response: httpx.Response) -> None:
+    metrics.incr("interbank.requests")
+
+
+def _new_async_session() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        # Connection failures only, like the retries of the sync sessions
+        transport=httpx.AsyncHTTPTransport(
+            retries=constants.INTERBANK_REQUEST_RETRIES,
+            # The dispatcher limits the requests in flight per bank
+            limits=httpx.Limits(max_connections=None, max_keepalive_connections=None),
+        ),
+        timeout=constants.INTERBANK_TIMEOUT_SECONDS,
+        event_hooks={"response": [_acount]},
+    )
+
+
+def _acsrf_token(session: httpx.AsyncClient) -> str | None:
+    session.cookies.jar.clear_expired_cookies()
+    return session.cookies.get("csrftoken")
+
+
+async def _alogin(session: httpx.AsyncClient, bank: Bank) -> None:
+    """Async version of `_login`."""
+    metrics.incr("interbank.logins")
+    session.cookies.clear()
+
+    login_url = f"{bank.url}{LOGIN_PATH}"
+    initial_response = await session.get(login_url)
+    initial_response.raise_for_status()
+
+    csrf_token = _acsrf_token(session)
+    if not csrf_token:
+        raise ValueError("CSRF token not found in initial response")
+
+    login_response = await session.post(
+        login_url,
+        data={
+            "username": os.environ["USER_NAME"],
+            "password": os.environ["PASSWORD"],
+            "csrfmiddlewaretoken": csrf_token,
+        },
+        headers={"Referer": login_url, "X-CSRFToken": csrf_token},
+    )
+    # httpx counts the redirect after logging in as a failure
+    if login_response.is_error:
+        login_response.raise_for_status()
+
+
+def _async_session(bank: Bank) -> tuple[httpx.AsyncClient, asyncio.Lock]:
+    sessions = _async_sessions.setdefault(asyncio.get_running_loop(), {})
+    if bank.reg_number not in sessions:
+        sessions[bank.reg_number] = (_new_async_session(), asyncio.Lock())
+    return sessions[bank.reg_number]
+
+
+async def aconnect(bank: Bank) -> httpx.AsyncClient:
+    """Async version of `connect`."""
+    session, login_lock = _async_session(bank)
+    async with login_lock:
+        if _acsrf_token(session) is None:
+            await _alogin(session, bank)
+    return session
+
+
+async def apost(
+    bank: Bank,
+    path: str,
+    data: dict[str, str] | None = None,
+    json: Any = None,
+    headers: dict[str, str] | None = None,
+) -> httpx.Response:
+    """Async version of `post`."""
+    if bank.signing_key:
+        return await _asigned_post(bank, path, data, json, headers or {})
+
+    session = await aconnect(bank)
+    _, login_lock = _async_session(bank)
+    for attempt in range(2):
+        if attempt:
+            metrics.incr("interbank.rejected_sessions")
+            async with login_lock:
+                await _alogin(session, bank)
+        response = await session.post(
+            f"{bank.url}{path}",
+            data=data,
+            json=json,
+            headers={"X-CSRFToken": _acsrf_token(session) or "", **(headers or {})},
+        )
+        if not _rejected(response):
+            break
+    return response
+
+
+async def _asigned_post(
+    bank: Bank,
+    path: str,
+    data: dict[str, str] | None,
+    json: Any,
+    headers: dict[str, str],
+) -> httpx.Response:
+    session, _ = _async_session(bank)
+    request = session.build_request(
+        "POST", f"{bank.url}{path}", data=data, json=json, headers=headers
+    )
+    request.headers.update(
+        interbank_signing.sign(
+            bank.signing_key,
+            "POST",
+            request.url.path,
+            headers.get(interbank_signing.NONCE_HEADER) or str(uuid4()),
+            request.read(),
+        )
+    )
+    return await session.send(request)
+
+
+async def aclose() -> None:
+    """Close the async sessions of the current event loop."""
+    sessions = _async_sessions.pop(asyncio.get_running_loop(), {})
+    for session, _ in sessions.values():
+        await session.aclose()
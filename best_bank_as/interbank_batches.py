@@ -0,0 +1,102 @@
+"""
+Batched external transfers. Outgoing transfers to the same bank wait in
+their `outgoing_transfers` queue and are sent together by
+`Ledger.send_external_batches`. The receiving bank applies a batch in one
+database transaction and answers per transfer.
+
+Wire format, POSTed as JSON to `BATCH_PATH`:
+
+    {"transfers": [{"reference": "...", "destination_account": 7, "amount": "10.00"}]}
+
+and answered with
+
+    {"results": [{"reference": "...", "status": "processed", "error": null}]}
+
+where the status is "processed" or "rejected". Each transfer is also kept
+under the idempotency key it is sent again under on its own, its
+reference at `TRANSFER_PATH`. A transfer of a batch that timed out is so
+never credited twice, and a batch holding a transfer still in flight is
+answered with 409.
+"""
+
+import json
+from decimal import Decimal, InvalidOperation
+from uuid import uuid4
+
+from django.http import HttpResponse
+
+from best_bank_as import constants, idempotency, interbank
+from best_bank_as.db_models.bank import Bank
+from best_bank_as.outgoing_transfers import OutgoingTransfer
+
+BATCH_PATH = "/external-transfer/batch/"
+TRANSFER_PATH = "/external-transfer/"
+PROCESSED = "processed"
+REJECTED = "rejected"
+
+
+def parse_batch(body: bytes) -> list[tuple[str, int, Decimal]]:
+    """
+    Parse a received batch into (reference, destination account, amount).
+    Raises ValueError for anything but a well formed batch.
+    """
+    try:
+        transfers = json.loads(body)["transfers"]
+        items = [
+            (
+                str(transfer["reference"]),
+                int(transfer["destination_account"]),
+                Decimal(str(transfer["amount"])),
+            )
+            for transfer in transfers
+        ]
+    except (ValueError, TypeError, KeyError, InvalidOperation) as e:
+        raise ValueError(f"Malformed transfer batch: {e!r}") from e
+
+    if not 0 < len(items) <= constants.INTERBANK_BATCH_SIZE:
+        raise ValueError(
+            f"A batch holds 1 to {constants.INTERBANK_BATCH_SIZE} transfers."
+        )
+    if any(not amount.is_finite() for *_, amount in items):
+        raise ValueError("Malformed transfer batch: amount is not a number")
+    if len({reference for reference, *_ in items}) != len(items):
+        raise ValueError("Malformed transfer batch: references repeat")
+    return items
+
+
+def transfer_key(owner: int | str | None, reference: str) -> str:
+    """Idempotency key of a received transfer, shared with single transfers."""
+    return idempotency.redis_key(owner, TRANSFER_PATH, reference)
+
+
+def complete(key: str, processed: bool) -> None:
+    """Store the outcome of a received transfer, as a single transfer would."""
+    idempotency.complete(key, HttpResponse(status=200 if processed else 400))
+
+
+def stored_status(stored: bytes) -> str:
+    """Status of a transfer received before, from its stored outcome."""
+    return PROCESSED if idempotency.replay(stored).status_code == 200 else REJECTED
+
+
+def send(bank: Bank, items: list[OutgoingTransfer]) -> dict[str, str]:
+    """POST a batch, returns the status of each transfer by reference."""
+    response = interbank.post(
+        bank,
+        BATCH_PATH,
+        json={
+            "transfers": [
+                {
+                    "reference": item.reference,
+                    "destination_account": item.destination_account_id,
+                    "amount": str(item.amount),
+                }
+                for item in items
+            ]
+        },
+        headers={"Idempotency-Key": str(uuid4())},
+    )
+    response.raise_for_status()
+    return {
+        result["reference"]: result["status"] for result in response.json()["results"]
+    }
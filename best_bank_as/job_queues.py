@@ -0,0 +1,24 @@
+"""
+RQ queues of the app, see RQ_QUEUES in the settings. Jobs carry ids and
+amounts only and load what they need when they run.
+
+There is no shared priority queue: the sends customers wait on would stand
+behind a slow bank there. They go to the front of the queue of their bank
+instead, ahead of its retries and batches.
+"""
+
+import django_rq
+from django.conf import settings
+from rq import Queue
+
+DEFAULT = "default"
+INTERBANK = "interbank"
+
+
+def for_bank(reg_number: str) -> Queue:
+    """
+    Queue for the transfers, retries and batches of a bank, its own one if
+    it has one, so a backlog for one bank does not hold up the others.
+    """
+    name = f"{INTERBANK}-{reg_number}"
+    return django_rq.get_queue(name if name in settings.RQ_QUEUES else INTERBANK)
@@ -0,0 +1,87 @@
+"""Monthly range partitions of the ledger table on `created_at`."""
+
+from datetime import UTC, date, datetime, time
+from typing import Any
+
+from best_bank_as import constants
+
+TABLE = "best_bank_as_ledger"
+DEFAULT_PARTITION = f"{TABLE}_default"
+
+
+def month_start(day: date) -> date:
+    """First day of the month of a date."""
+    return day.replace(day=1)
+
+
+def next_month(month: date) -> date:
+    """First day of the following month."""
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def months(first: date, last: date) -> list[date]:
+    """Months from the month of `first` through the month of `last`."""
+    month, last = month_start(first), month_start(last)
+    result = []
+    while month <= last:
+        result.append(month)
+        month = next_month(month)
+    return result
+
+
+def months_ahead(today: date) -> list[date]:
+    """Months that should have a partition, from this month on."""
+    last = month_start(today)
+    for _ in range(constants.LEDGER_PARTITION_MONTHS_AHEAD):
+        last = next_month(last)
+    return months(today, last)
+
+
+def partition_name(month: date) -> str:
+    """Table name of the partition holding a month."""
+    return f"{TABLE}_y{month.year}m{month.month:02d}"
+
+
+def is_partitioned(cursor: Any) -> bool:
+    """Check if the ledger table is partitioned."""
+    cursor.execute(
+        "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)",
+        [TABLE],
+    )
+    return cursor.fetchone() is not None
+
+
+def create_partition(cursor: Any, month: date) -> bool:
+    """
+    Create the partition for a month, returns False if it already exists.
+    Rows of that month that landed in the default partition are moved into
+    the new partition before it is attached.
+    """
+    name = partition_name(month)
+    cursor.execute("SELECT to_regclass(%s), to_regclass(%s)", [name, DEFAULT_PARTITION])
+    existing, default = cursor.fetchone()
+    if existing is not None:
+        return False
+
+    bounds = [
+        datetime.combine(day, time.min, tzinfo=UTC)
+        for day in (month, next_month(month))
+    ]
+    cursor.execute(f"CREATE TABLE {name} (LIKE {TABLE} INCLUDING DEFAULTS)")
+    if default is not None:
+        cursor.execute(
+            f"""
+            WITH moved AS (
+                DELETE FROM {DEFAULT_PARTITION}
+                WHERE created_at >= %s AND created_at < %s
+                RETURNING *
+            )
+            INSERT INTO {name} SELECT * FROM moved
+            """,
+            bounds,
+        )
+    cursor.execute(
+        f"ALTER TABLE {TABLE} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)",
+        bounds,
+    )
+    return True
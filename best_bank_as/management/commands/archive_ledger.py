@@ -0,0 +1,76 @@
+import time
+from datetime import date, datetime
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+from django.utils.timezone import localdate, make_aware
+
+from best_bank_as import constants, enums
+from best_bank_as.db_models.ledger import Ledger
+
+
+def archivable_accounts(before: datetime, after: int, limit: int) -> list[int]:
+    """Next accounts after `after` with settled entries older than `before`."""
+    return list(
+        Ledger.objects.filter(
+            account_id__gt=after, created_at__lt=before, carried_forward=False
+        )
+        .exclude(status=enums.TransactionStatus.PENDING)
+        .order_by("account_id")
+        .values_list("account_id", flat=True)
+        .distinct()[:limit]
+    )
+
+
+class Command(BaseCommand):
+    """Command for moving old settled ledger entries to the archive."""
+
+    help = (
+        "Move settled ledger entries created before a date to the ledger "
+        "archive, carrying each account's total forward as an opening balance. "
+        "Runs in short per-batch transactions and can be resumed with --after."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "--before",
+            type=date.fromisoformat,
+            required=True,
+            help="Archive entries created before this day (YYYY-MM-DD).",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=constants.ARCHIVE_BATCH_ACCOUNTS,
+            help="Accounts archived per transaction.",
+        )
+        parser.add_argument(
+            "--after",
+            type=int,
+            default=0,
+            help="Resume after this account number.",
+        )
+
+    def handle(self, **options: Any) -> None:
+        """Handle command."""
+        if options["before"] > localdate():
+            raise CommandError("--before cannot be in the future.")
+
+        before = make_aware(datetime.combine(options["before"], datetime.min.time()))
+        after, total = options["after"], 0
+        started = time.monotonic()
+
+        while account_ids := archivable_accounts(before, after, options["batch_size"]):
+            total += Ledger.archive(account_ids, before)
+            after = account_ids[-1]
+            elapsed = time.monotonic() - started
+            print(
+                f"Archived {total} entries through account {after} "
+                f"({total / elapsed:.1f} rows/s)"
+            )
+
+        elapsed = time.monotonic() - started
+        print(
+            f"Done: {total} entries in {elapsed:.3f}s "
+            f"({total / elapsed if elapsed else 0:.1f} rows/s)"
+        )
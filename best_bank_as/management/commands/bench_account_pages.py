@@ -0,0 +1,122 @@
+import asyncio
+import time
+from collections.abc import Callable
+from functools import wraps
+from typing import Any
+
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+from django.test import AsyncClient
+from django.test.utils import override_settings
+from django.urls import URLPattern, include, path
+
+from best_bank_as import urls
+from best_bank_as.db_models.customer import Customer
+
+
+def synchronous(view: Callable[..., Any]) -> Callable[..., Any]:
+    """
+    Turn an async view back into a sync one. Under ASGI Django runs sync
+    views one at a time on a single thread, which is how the account pages
+    were served before they were async.
+    """
+    if not iscoroutinefunction(view):
+        return view
+
+    @wraps(view)
+    def _wrapped_view(*args: Any, **kwargs: Any) -> Any:
+        return async_to_sync(view)(*args, **kwargs)
+
+    return _wrapped_view
+
+
+# The project URLs with the sync versions of the async views, used as the baseline
+urlpatterns = [
+    path("accounts/", include("django.contrib.auth.urls")),
+    path(
+        "",
+        include(
+            (
+                [
+                    URLPattern(
+                        pattern.pattern,
+                        synchronous(pattern.callback),
+                        pattern.default_args,
+                        pattern.name,
+                    )
+                    for pattern in urls.urlpatterns
+                ],
+                urls.app_name,
+            )
+        ),
+    ),
+]
+
+
+async def drive(
+    client: AsyncClient, paths: list[str], requests: int, concurrency: int
+) -> tuple[float, list[float]]:
+    """Request the paths round robin, returns the elapsed time and latencies."""
+    latencies: list[float] = []
+    remaining = iter(range(requests))
+
+    async def worker() -> None:
+        for n in remaining:
+            started = time.monotonic()
+            response = await client.get(paths[n % len(paths)])
+            if response.status_code != 200:
+                raise CommandError(f"{paths[n % len(paths)]}: {response.status_code}")
+            latencies.append(time.monotonic() - started)
+
+    started = time.monotonic()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return time.monotonic() - started, latencies
+
+
+class Command(BaseCommand):
+    """Benchmark the account pages served by sync and by async views."""
+
+    help = (
+        "Drive the ASGI application with concurrent requests for the account "
+        "pages of one customer, once with the views run synchronously and "
+        "once with the async views."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("--requests", type=int, default=2000)
+        parser.add_argument("--concurrency", type=int, default=50)
+
+    def handle(self, **options: Any) -> None:
+        """Handle command."""
+        customer = (
+            Customer.objects.filter(account__isnull=False)
+            .select_related("user")
+            .first()
+        )
+        if customer is None:
+            raise CommandError("No customer with accounts to browse as.")
+
+        account = customer.account_set.first()
+        paths = ["/profile/", "/accounts/", f"/accounts/{account.pk}/"]
+
+        for asynchronous in (False, True):
+            client = AsyncClient()
+            client.force_login(customer.user)
+            urlconf = settings.ROOT_URLCONF if asynchronous else __name__
+            with override_settings(
+                ROOT_URLCONF=urlconf,
+                ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"],
+            ):
+                elapsed, latencies = async_to_sync(drive)(
+                    client, paths, options["requests"], options["concurrency"]
+                )
+
+            latencies.sort()
+            p50 = latencies[len(latencies) // 2] * 1000
+            p95 = latencies[int(len(latencies) * 0.95)] * 1000
+            print(
+                f"{'async' if asynchronous else 'sync'} views: "
+                f"{options['requests'] / elapsed:.1f} requests/s at concurrency "
+                f"{options['concurrency']}, p50 {p50:.1f}ms, p95 {p95:.1f}ms"
+            )
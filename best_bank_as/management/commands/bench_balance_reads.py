@@ -0,0 +1,45 @@
+import time
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandParser
+from django.test.utils import override_settings
+
+from best_bank_as import metrics
+from best_bank_as.db_models.account import Account
+
+
+class Command(BaseCommand):
+    """Benchmark balance reads with and without the balance cache."""
+
+    help = "Measure Account.get_balance reads per second with the cache off and on."
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("--reads", type=int, default=5000)
+        parser.add_argument("--accounts", type=int, default=100)
+
+    def handle(self, **options: Any) -> None:
+        """Handle command."""
+        accounts = list(
+            Account.objects.filter(parent=None, customer__isnull=False).order_by("pk")[
+                : options["accounts"]
+            ]
+        )
+        if not accounts:
+            print("No customer accounts to read.")
+            return
+
+        for enabled in (False, True):
+            metrics.reset()
+            with override_settings(BALANCE_CACHE_ENABLED=enabled):
+                started = time.monotonic()
+                for read in range(options["reads"]):
+                    accounts[read % len(accounts)].get_balance()
+                elapsed = time.monotonic() - started
+
+            counters = metrics.snapshot()
+            print(
+                f"cache {'on' if enabled else 'off'}: {options['reads']} reads in "
+                f"{elapsed:.3f}s ({options['reads'] / elapsed:.1f} reads/s, "
+                f"{counters.get('balance_cache.hits', 0):.0f} hits, "
+                f"{counters.get('balance_cache.misses', 0):.0f} misses)"
+            )
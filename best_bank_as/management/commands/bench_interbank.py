@@ -0,0 +1,87 @@
+import secrets
+import time
+from decimal import Decimal
+from typing import Any
+from uuid import uuid4
+
+from django.core.management.base import BaseCommand, CommandParser
+
+from best_bank_as import enums, interbank, metrics, outgoing_transfers
+from best_bank_as.db_models.account import Account
+from best_bank_as.db_models.ledger import Ledger
+from best_bank_as.management.commands.rebalance_house_account import get_house_account
+from best_bank_as.stand_in_bank import STAND_IN_REG_NUMBER, StandInBank
+
+
+class Command(BaseCommand):
+    """
+    Benchmark external transfers with fresh sessions, pooled, batched and
+    signed.
+    """
+
+    help = (
+        "Send external transfers to a local stand-in bank and report HTTP round "
+        "trips and connections per transfer. Writes real ledger entries."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("--transfers", type=int, default=200)
+
+    def handle(self, **options: Any) -> None:
+        """Handle command."""
+        bank = StandInBank()
+        bank.register()
+        source = Account.objects.create(account_status=enums.AccountStatus.ACTIVE)
+        destination = Account.objects.create(account_status=enums.AccountStatus.ACTIVE)
+        house_account = get_house_account()
+        funds = Decimal(4 * options["transfers"])
+        Ledger.transfer(house_account.pick_shard(funds), source, funds)
+
+        def send(mode: str) -> None:
+            if mode == "batched":
+                for _ in range(options["transfers"]):
+                    outgoing_transfers.push(
+                        outgoing_transfers.BATCH,
+                        STAND_IN_REG_NUMBER,
+                        outgoing_transfers.OutgoingTransfer(
+                            str(uuid4()), source.pk, destination.pk, Decimal(1)
+                        ),
+                    )
+                Ledger.send_external_batches(STAND_IN_REG_NUMBER)
+                return
+
+            for _ in range(options["transfers"]):
+                if mode == "fresh":
+                    # A new session for every job, as before the pool
+                    interbank.close()
+                Ledger.initiate_external_transfer(
+                    source_account=source,
+                    destination_reg_no=STAND_IN_REG_NUMBER,
+                    destination_account=destination,
+                    amount=Decimal(1),
+                )
+
+        try:
+            for mode in ("fresh", "pooled", "batched", "signed"):
+                if mode == "signed":
+                    bank.signing_key = secrets.token_hex(32)
+                    bank.register()
+                interbank.close()
+                metrics.reset()
+                requests, connections = bank.requests, bank.connections
+                started = time.monotonic()
+                send(mode)
+                elapsed = time.monotonic() - started
+
+                transfers = options["transfers"]
+                print(
+                    f"{mode}: "
+                    f"{(bank.requests - requests) / transfers:.2f} round trips and "
+                    f"{(bank.connections - connections) / transfers:.2f} "
+                    f"connections per transfer, "
+                    f"{metrics.snapshot().get('interbank.logins', 0):.0f} logins, "
+                    f"{transfers / elapsed:.1f} transfers/s"
+                )
+        finally:
+            interbank.close()
+            bank.stop()
@@ -0,0 +1,67 @@
+import time
+from decimal import Decimal
+from typing import Any
+from uuid import uuid4
+
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+from rq import Queue
+
+from best_bank_as import redis_clients
+from best_bank_as.db_models.account import Account
+from best_bank_as.db_models.ledger import Ledger
+
+
+class Command(BaseCommand):
+    """Benchmark the size and enqueue latency of external transfer jobs."""
+
+    help = (
+        "Enqueue external transfer jobs carrying model instances, as before, "
+        "and carrying ids, to a scratch queue no worker serves. Reports the "
+        "serialized job size and the enqueue latency."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("--jobs", type=int, default=1000)
+
+    def handle(self, **options: Any) -> None:
+        """Handle command."""
+        # Loaded like the accounts of the transfer view
+        accounts = list(Account.objects.filter(customer__isnull=False)[:2])
+        if len(accounts) < 2:
+            raise CommandError("Two customer accounts are needed.")
+        source, destination = accounts
+        amount = Decimal("100.00")
+
+        modes = {
+            "instances": lambda queue: queue.enqueue(
+                Ledger.initiate_external_transfer,
+                amount=amount,
+                source_account=source,
+                destination_reg_no="6666",
+                destination_account=destination,
+            ),
+            "ids": lambda queue: queue.enqueue(
+                Ledger.initiate_external_transfer_job,
+                str(uuid4()),
+                source.pk,
+                "6666",
+                destination.pk,
+                str(amount),
+            ),
+        }
+
+        for mode, enqueue in modes.items():
+            queue = Queue(
+                f"bench-job-payloads-{mode}", connection=redis_clients.client()
+            )
+            try:
+                started = time.monotonic()
+                jobs = [enqueue(queue) for _ in range(options["jobs"])]
+                elapsed = time.monotonic() - started
+                print(
+                    f"{mode}: {len(jobs[0].data)} bytes per job, "
+                    f"{elapsed / options['jobs'] * 1000:.3f}ms per enqueue"
+                )
+            finally:
+                queue.empty()
+                queue.delete(delete_jobs=True)
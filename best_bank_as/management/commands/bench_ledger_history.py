@@ -0,0 +1,118 @@
+import re
+import time
+from collections.abc import Callable
+from datetime import timedelta
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandParser
+from django.db import connection
+from django.db.models import QuerySet, Sum
+from django.db.transaction import atomic, set_rollback
+from django.utils.timezone import now
+
+from best_bank_as import enums
+from best_bank_as.db_models.account import Account
+from best_bank_as.db_models.bank import Bank
+from best_bank_as.db_models.ledger import Ledger
+from best_bank_as.ledger_partitions import create_partition, is_partitioned, months
+
+
+def scanned_tables(queryset: QuerySet) -> int:
+    """Number of tables or partitions scanned in the query plan."""
+    plan = queryset.explain(format="json")
+    return len(set(re.findall(r'"Relation Name": "(\w+)"', plan)))
+
+
+def seed(accounts: int, rows: int, days: int) -> list[int]:
+    """Insert ledger rows for new accounts, spread over the last `days` days."""
+    account_ids = [
+        account.pk
+        for account in Account.objects.bulk_create(
+            Account(account_status=enums.AccountStatus.ACTIVE) for _ in range(accounts)
+        )
+    ]
+    with connection.cursor() as cursor:
+        if is_partitioned(cursor):
+            for month in months(now().date() - timedelta(days=days), now().date()):
+                create_partition(cursor, month)
+        cursor.execute(
+            """
+            INSERT INTO best_bank_as_ledger
+                (created_at, status, amount, account_id, registration_number_id,
+                carried_forward)
+            SELECT
+                now() - random() * %s * interval '1 day',
+                %s,
+                1,
+                (%s::bigint[])[1 + floor(random() * %s)::int],
+                %s,
+                false
+            FROM generate_series(1, %s)
+            """,
+            [
+                days,
+                enums.TransactionStatus.PROCESSED,
+                account_ids,
+                len(account_ids),
+                Bank.objects.values_list("pk", flat=True).first(),
+                rows,
+            ],
+        )
+        cursor.execute("ANALYZE best_bank_as_ledger")
+    return account_ids
+
+
+class Command(BaseCommand):
+    """Benchmark date-bounded ledger history queries."""
+
+    help = (
+        "Time date-bounded history, statement and aggregate queries on seeded "
+        "ledger rows, which are rolled back. Run it before and after "
+        "migrating to 0007_partition_ledger to compare."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("--rows", type=int, default=500_000)
+        parser.add_argument("--accounts", type=int, default=100)
+        parser.add_argument("--days", type=int, default=365)
+        parser.add_argument("--repeat", type=int, default=20)
+
+    @atomic
+    def handle(self, **options: Any) -> None:
+        """Handle command."""
+        account_ids = seed(options["accounts"], options["rows"], options["days"])
+        account = Account.objects.get(pk=account_ids[0])
+        end = now().date() - timedelta(days=options["days"] // 2)
+        start = end - timedelta(days=30)
+
+        history = Ledger.objects.filter(account=account).between(start, end)
+        month = Ledger.objects.between(start, end)
+        queries: list[tuple[str, QuerySet, Callable[[], Any]]] = [
+            (
+                "history page",
+                history.order_by("-created_at", "-id")[:25],
+                lambda: account.get_transaction_page(start=start, end=end),
+            ),
+            (
+                "statement",
+                history.order_by("created_at", "id"),
+                lambda: list(account.iter_statement(start, end)),
+            ),
+            ("month total", month, lambda: month.aggregate(Sum("amount"))),
+        ]
+
+        with connection.cursor() as cursor:
+            layout = "partitioned" if is_partitioned(cursor) else "plain"
+        print(f"{layout} ledger, {options['rows']} rows, {start} to {end}:")
+
+        for name, queryset, run in queries:
+            started = time.monotonic()
+            for _ in range(options["repeat"]):
+                run()
+            elapsed = (time.monotonic() - started) / options["repeat"]
+            print(
+                f"  {name}: {elapsed * 1000:.2f} ms, "
+                f"{scanned_tables(queryset)} table(s) scanned"
+            )
+
+        set_rollback(True)
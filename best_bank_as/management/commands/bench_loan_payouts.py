@@ -0,0 +1,86 @@
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+from typing import Any
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandParser
+from django.db import connections
+
+from best_bank_as import enums, metrics
+from best_bank_as.db_models.account import Account
+from best_bank_as.db_models.ledger import Ledger
+from best_bank_as.management.commands.rebalance_house_account import get_house_account
+
+
+def pay_out(
+    house_account: Account, loan_account: Account, count: int, amount: Decimal
+) -> dict[str, float]:
+    """Pay out `count` loans to `loan_account`, like `Customer.create_loan`."""
+    metrics.reset()
+    try:
+        for _ in range(count):
+            Ledger.transfer(house_account.pick_shard(amount), loan_account, amount)
+    finally:
+        connections.close_all()
+    return metrics.snapshot()
+
+
+class Command(BaseCommand):
+    """Benchmark loan payouts from the house account."""
+
+    help = (
+        "Measure concurrent loan payout throughput from the house account "
+        "for different shard counts. Writes real ledger entries."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("--shards", type=int, nargs="+", default=[1, 8])
+        parser.add_argument("--payouts", type=int, default=400)
+        parser.add_argument("--workers", type=int, default=8)
+        parser.add_argument("--amount", type=Decimal, default=Decimal(1))
+
+    def handle(self, **options: Any) -> None:
+        """Handle command."""
+        house_account = get_house_account()
+        per_worker = options["payouts"] // options["workers"]
+
+        for shard_count in options["shards"]:
+            house_account.rebalance_shards(shard_count)
+            loan_accounts = [
+                Account.objects.create(
+                    account_type=enums.AccountType.LOAN,
+                    account_status=enums.AccountStatus.ACTIVE,
+                )
+                for _ in range(options["workers"])
+            ]
+
+            # Worker processes must not share the parent's connection
+            connections.close_all()
+            started = time.monotonic()
+            with ProcessPoolExecutor(
+                max_workers=options["workers"],
+                mp_context=multiprocessing.get_context("fork"),
+            ) as pool:
+                results = list(
+                    pool.map(
+                        pay_out,
+                        [house_account] * len(loan_accounts),
+                        loan_accounts,
+                        [per_worker] * len(loan_accounts),
+                        [options["amount"]] * len(loan_accounts),
+                    )
+                )
+            elapsed = time.monotonic() - started
+
+            payouts = per_worker * options["workers"]
+            lock_wait = sum(result["transfer.lock_wait_seconds"] for result in results)
+            retries = sum(result.get("transfer.retries", 0) for result in results)
+            print(
+                f"shards={shard_count} payouts={payouts} "
+                f"payouts/s={payouts / elapsed:.1f} "
+                f"lock_wait_s={lock_wait:.3f} retries={retries:.0f}"
+            )
+
+        house_account.rebalance_shards(settings.HOUSE_ACCOUNT_SHARDS)
@@ -0,0 +1,79 @@
+import time
+from datetime import datetime
+from typing import Any
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+
+from best_bank_as import constants
+from best_bank_as.db_models.customer import Customer
+
+MODES = [
+    ("db, every request", "django.contrib.sessions.backends.db", 0),
+    ("db, throttled", "django.contrib.sessions.backends.db", None),
+    ("cached_db, throttled", "django.contrib.sessions.backends.cached_db", None),
+]
+
+
+class Command(BaseCommand):
+    """Benchmark session reads and writes per request."""
+
+    help = (
+        "Browse as one customer and count the session table statements per "
+        "request, with last_activity saved on every request and throttled."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("--requests", type=int, default=500)
+
+    def handle(self, **options: Any) -> None:
+        """Handle command."""
+        customer = Customer.objects.select_related("user").first()
+        if customer is None:
+            raise CommandError("No customer to browse as.")
+
+        for label, engine, granularity in MODES:
+            reads = writes = 0
+
+            def count(execute: Any, sql: str, *args: Any) -> Any:
+                nonlocal reads, writes
+                if "django_session" in sql:
+                    if sql.startswith("SELECT"):
+                        reads += 1
+                    else:
+                        writes += 1
+                return execute(sql, *args)
+
+            with override_settings(
+                SESSION_ENGINE=engine,
+                SESSION_ACTIVITY_GRANULARITY_SECONDS=(
+                    settings.SESSION_ACTIVITY_GRANULARITY_SECONDS
+                    if granularity is None
+                    else granularity
+                ),
+                ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"],
+            ):
+                client = Client()
+                client.force_login(customer.user)
+                # Track the session, then record its first activity
+                session = client.session
+                session["last_activity"] = datetime.now().strftime(
+                    constants.DATETIME_FORMAT
+                )
+                session.save()
+                client.get("/")
+
+                with connection.execute_wrapper(count):
+                    started = time.monotonic()
+                    for _ in range(options["requests"]):
+                        client.get("/")
+                    elapsed = time.monotonic() - started
+
+            print(
+                f"{label}: {writes / options['requests']:.2f} session writes and "
+                f"{reads / options['requests']:.2f} session reads per request, "
+                f"{options['requests'] / elapsed:.1f} requests/s"
+            )
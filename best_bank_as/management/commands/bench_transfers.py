@@ -0,0 +1,64 @@
+import time
+from decimal import Decimal
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandParser
+from django.db import connection
+from django.test.utils import override_settings
+
+from best_bank_as import enums
+from best_bank_as.db_models.account import Account
+from best_bank_as.db_models.ledger import Ledger
+from best_bank_as.management.commands.rebalance_house_account import get_house_account
+
+
+class Command(BaseCommand):
+    """Benchmark the locked and the single statement transfer paths."""
+
+    help = (
+        "Measure transfers per second and statements per transfer for both "
+        "transfer paths. Writes real ledger entries between two new accounts."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("--transfers", type=int, default=2000)
+
+    def handle(self, **options: Any) -> None:
+        """Handle command."""
+        accounts = [
+            Account.objects.create(account_status=enums.AccountStatus.ACTIVE)
+            for _ in range(2)
+        ]
+        house_account = get_house_account()
+        Ledger.transfer(house_account.pick_shard(Decimal(1)), accounts[0], Decimal(1))
+
+        for single_statement in (False, True):
+            statements = 0
+
+            def count(execute: Any, *args: Any) -> Any:
+                nonlocal statements
+                statements += 1
+                return execute(*args)
+
+            # Leave out the balance cache refresh, which both paths share
+            with override_settings(
+                TRANSFER_SINGLE_STATEMENT=single_statement,
+                BALANCE_CACHE_ENABLED=False,
+            ):
+                with connection.execute_wrapper(count):
+                    started = time.monotonic()
+                    for n in range(options["transfers"]):
+                        # Move the same unit back and forth
+                        source, destination = accounts[n % 2], accounts[1 - n % 2]
+                        Ledger.transfer(source, destination, Decimal(1))
+                    elapsed = time.monotonic() - started
+
+            # BEGIN and COMMIT of the @atomic block are not seen by the wrapper
+            per_transfer = statements / options["transfers"] + (
+                0 if single_statement else 2
+            )
+            print(
+                f"{'single statement' if single_statement else 'locked'}: "
+                f"{options['transfers'] / elapsed:.1f} transfers/s, "
+                f"{per_transfer:.1f} statements per transfer"
+            )
@@ -0,0 +1,91 @@
+import time
+from decimal import Decimal
+from typing import Any
+from uuid import uuid4
+
+from django.core.management.base import BaseCommand, CommandParser
+from django.db import connections
+from rq import Queue, Worker
+from rq.worker_pool import WorkerPool
+
+from best_bank_as import enums, interbank, redis_clients
+from best_bank_as.db_models.account import Account
+from best_bank_as.db_models.ledger import Ledger
+from best_bank_as.management.commands.rebalance_house_account import get_house_account
+from best_bank_as.stand_in_bank import STAND_IN_REG_NUMBER, StandInBank
+from best_bank_as.workers import PreloadedWorker
+
+
+class Command(BaseCommand):
+    """Benchmark RQ workers forking per job against preloaded workers."""
+
+    help = (
+        "Run external transfer jobs to a local stand-in bank with the forking "
+        "RQ worker, the preloaded worker and a pool of preloaded workers, and "
+        "report jobs per second. Writes real ledger entries."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("--jobs", type=int, default=200)
+        parser.add_argument("--pool-workers", type=int, default=4)
+
+    def handle(self, **options: Any) -> None:
+        """Handle command."""
+        bank = StandInBank()
+        bank.register()
+        # A source per pool worker, so the workers do not queue on one account
+        sources = [
+            Account.objects.create(account_status=enums.AccountStatus.ACTIVE)
+            for _ in range(options["pool_workers"])
+        ]
+        destination = Account.objects.create(account_status=enums.AccountStatus.ACTIVE)
+        funds = Decimal(options["jobs"])
+        for source in sources:
+            Ledger.transfer(get_house_account().pick_shard(funds), source, funds)
+
+        redis = redis_clients.client()
+        queue = Queue("bench-workers", connection=redis)
+
+        def run(worker: Any) -> None:
+            if isinstance(worker, WorkerPool):
+                worker.start(burst=True, logging_level="WARNING")
+            else:
+                worker.work(burst=True, logging_level="WARNING")
+
+        modes = {
+            "forking": lambda: Worker([queue], connection=redis),
+            "preloaded": lambda: PreloadedWorker([queue], connection=redis),
+            f"pool of {options['pool_workers']} preloaded": lambda: WorkerPool(
+                [queue],
+                connection=redis,
+                num_workers=options["pool_workers"],
+                worker_class=PreloadedWorker,
+            ),
+        }
+
+        try:
+            for mode, worker in modes.items():
+                for number in range(options["jobs"]):
+                    queue.enqueue(
+                        Ledger.initiate_external_transfer_job,
+                        str(uuid4()),
+                        sources[number % len(sources)].pk,
+                        STAND_IN_REG_NUMBER,
+                        destination.pk,
+                        "1",
+                    )
+                logins = bank.sessions.copy()
+                # Forked workers must not share the connections of this process
+                connections.close_all()
+                interbank.close()
+
+                started = time.monotonic()
+                run(worker())
+                elapsed = time.monotonic() - started
+                print(
+                    f"{mode}: {options['jobs'] / elapsed:.1f} jobs/s, "
+                    f"{len(bank.sessions - logins)} logins"
+                )
+        finally:
+            queue.delete(delete_jobs=True)
+            bank.stop()
@@ -0,0 +1,97 @@
+import csv
+import time
+from decimal import Decimal
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+from django.db.transaction import atomic, set_rollback
+
+from best_bank_as.db_models.account import Account
+from best_bank_as.db_models.ledger import Ledger, TransferInstruction, TransferResult
+
+
+def read_instructions(path: str) -> list[TransferInstruction]:
+    """Read transfers from a CSV with source_account,destination_account,amount."""
+    with open(path, newline="") as csv_file:
+        return [
+            TransferInstruction(
+                source_account_id=int(row["source_account"]),
+                destination_account_id=int(row["destination_account"]),
+                amount=Decimal(row["amount"]),
+            )
+            for row in csv.DictReader(csv_file)
+        ]
+
+
+def transfer_per_item(instructions: list[TransferInstruction]) -> int:
+    """Execute the transfers one by one with `Ledger.transfer`."""
+    accounts = Account.objects.in_bulk(
+        {i.source_account_id for i in instructions}
+        | {i.destination_account_id for i in instructions}
+    )
+    transferred = 0
+    for instruction in instructions:
+        try:
+            Ledger.transfer(
+                accounts[instruction.source_account_id],
+                accounts[instruction.destination_account_id],
+                instruction.amount,
+            )
+            transferred += 1
+        except (KeyError, ValueError):
+            pass
+    return transferred
+
+
+class Command(BaseCommand):
+    """Execute a CSV of transfers as one batch."""
+
+    help = "Execute transfers from a CSV file with Ledger.bulk_transfer."
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("path", help="CSV file with a header row.")
+        parser.add_argument(
+            "--per-item",
+            action="store_true",
+            help="Skip invalid transfers instead of rejecting the whole batch.",
+        )
+        parser.add_argument(
+            "--benchmark",
+            action="store_true",
+            help="Compare rows per second with the per-item path, writes nothing.",
+        )
+
+    def handle(self, **options: Any) -> None:
+        """Handle command."""
+        instructions = read_instructions(options["path"])
+        all_or_nothing = not options["per_item"]
+
+        if options["benchmark"]:
+            with atomic():
+                started = time.monotonic()
+                transferred = transfer_per_item(instructions)
+                self._report("per-item", transferred, time.monotonic() - started)
+                set_rollback(True)
+
+        with atomic():
+            started = time.monotonic()
+            try:
+                results = Ledger.bulk_transfer(instructions, all_or_nothing)
+            except ValueError as e:
+                raise CommandError(str(e)) from e
+            self._report("bulk", sum(r.ok for r in results), time.monotonic() - started)
+            self._print_errors(results)
+            set_rollback(options["benchmark"])
+
+    @staticmethod
+    def _report(path: str, transferred: int, elapsed: float) -> None:
+        print(
+            f"{path}: {transferred} transfers in {elapsed:.3f}s "
+            f"({transferred / elapsed:.1f} rows/s)"
+        )
+
+    @staticmethod
+    def _print_errors(results: list[TransferResult]) -> None:
+        for line, result in enumerate(results, start=2):
+            if not result.ok:
+                print(f"Line {line}: {result.error}")
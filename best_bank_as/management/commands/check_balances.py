@@ -0,0 +1,77 @@
+from decimal import Decimal
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+from django.db.transaction import atomic
+
+from best_bank_as.db_models.account_balance import AccountBalance
+from best_bank_as.db_models.ledger import Ledger
+
+
+def find_drift(
+    account_ids: list[int] | None = None,
+) -> dict[int, tuple[tuple[Decimal, Decimal], tuple[Decimal, Decimal]]]:
+    """
+    Compare the balance projection against the ledger sum per account, of
+    the given accounts or all of them.
+    """
+    totals = Ledger.balance_totals(account_ids)
+    balances = AccountBalance.objects.all()
+    if account_ids is not None:
+        balances = balances.filter(account_id__in=account_ids)
+    projections = {
+        account_id: (booked, pending)
+        for account_id, booked, pending in balances.values_list(
+            "account_id", "booked", "pending"
+        )
+    }
+
+    zero = (Decimal(0), Decimal(0))
+    drift = {}
+    for account_id in totals.keys() | projections.keys():
+        expected = totals.get(account_id, zero)
+        actual = projections.get(account_id, zero)
+        if expected != actual:
+            drift[account_id] = (expected, actual)
+    return drift
+
+
+class Command(BaseCommand):
+    """Check the balance projection against the ledger."""
+
+    help = "Compare materialized account balances with the ledger sum."
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "--repair",
+            action="store_true",
+            help="Overwrite drifted balances with the ledger totals.",
+        )
+
+    @atomic
+    def handle(self, **options: Any) -> None:
+        """Handle command."""
+        drift = find_drift()
+
+        for account_id, (expected, actual) in sorted(drift.items()):
+            print(
+                f"Account {account_id}: ledger booked={expected[0]} "
+                f"pending={expected[1]}, projection booked={actual[0]} "
+                f"pending={actual[1]}"
+            )
+
+        if not drift:
+            print("Balances are consistent with the ledger.")
+            return
+
+        if not options["repair"]:
+            raise CommandError(f"{len(drift)} account balance(s) drifted.")
+
+        # A transfer committing between the two reads looks like drift, so
+        # check again with the balance rows locked before overwriting them
+        Ledger.lock_balances(list(drift))
+        drift = find_drift(list(drift))
+        AccountBalance.rebuild(
+            {account_id: drift[account_id][0] for account_id in drift}
+        )
+        print(f"Repaired {len(drift)} account balance(s).")
@@ -0,0 +1,165 @@
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from itertools import repeat
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+from django.db import connection
+from django.db.models import Max, Min, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils.timezone import localtime, make_aware, now
+
+from best_bank_as import constants, enums
+from best_bank_as.db_models.account import Account
+from best_bank_as.db_models.balance_checkpoint import BalanceCheckpoint
+from best_bank_as.db_models.ledger import Ledger
+from best_bank_as.db_models.ledger_archive import LedgerArchive
+
+
+def start_of(day: date) -> datetime:
+    """First moment of a day in the current timezone."""
+    return make_aware(datetime.combine(day, time.min))
+
+
+def last_closed_day() -> date:
+    """Latest day whose ledger entries have all been committed."""
+    settled = localtime(now() - timedelta(seconds=constants.CHECKPOINT_SETTLE_SECONDS))
+    return settled.date() - timedelta(days=1)
+
+
+def checkpoint_accounts(first_id: int, last_id: int, until: date) -> int:
+    """
+    Write the missing daily checkpoints up to `until` for the accounts with
+    a number between `first_id` and `last_id` (both inclusive). Only ledger
+    entries after the latest checkpoint of each account are summed.
+    Returns the number of checkpoints written.
+    """
+    in_range = Q(account_id__gte=first_id, account_id__lte=last_id)
+    latest = {
+        account_id: (day, closing_balance)
+        for account_id, day, closing_balance in BalanceCheckpoint.objects.filter(
+            in_range
+        )
+        .order_by("account_id", "-day")
+        .distinct("account_id")
+        .values_list("account_id", "day", "closing_balance")
+    }
+
+    # Group accounts by their latest checkpoint so each group is a single
+    # index range scan instead of a scan over the full history
+    since_day: defaultdict[date, list[int]] = defaultdict(list)
+    for account_id, (day, _) in latest.items():
+        since_day[day + timedelta(days=1)].append(account_id)
+
+    fresh = list(
+        Account.objects.filter(pk__gte=first_id, pk__lte=last_id)
+        .exclude(pk__in=list(latest))
+        .values_list("pk", flat=True)
+    )
+    new_entries = Q(account_id__in=fresh)
+    for day, account_ids in since_day.items():
+        if day <= until:
+            new_entries |= Q(account_id__in=account_ids, created_at__gte=start_of(day))
+
+    # Archived entries are summed instead of their carried forward total,
+    # in one statement so an archive batch committing in between is counted
+    # exactly once
+    live, archived = (
+        entries.filter(new_entries, created_at__lt=start_of(until + timedelta(days=1)))
+        .exclude(status=enums.TransactionStatus.REJECTED)
+        .annotate(day=TruncDate("created_at"))
+        .values_list("account_id", "day")
+        .annotate(total=Sum("amount"))
+        .order_by()
+        for entries in (
+            Ledger.objects.filter(carried_forward=False),
+            LedgerArchive.objects.all(),
+        )
+    )
+    daily_totals: defaultdict[tuple[int, date], Decimal] = defaultdict(Decimal)
+    for account_id, day, total in live.union(archived, all=True):
+        daily_totals[account_id, day] += total
+
+    closing = {account_id: balance for account_id, (_, balance) in latest.items()}
+    checkpoints = []
+    for (account_id, day), total in sorted(daily_totals.items()):
+        closing[account_id] = closing.get(account_id, Decimal(0)) + total
+        checkpoints.append(
+            BalanceCheckpoint(
+                account_id=account_id, day=day, closing_balance=closing[account_id]
+            )
+        )
+
+    BalanceCheckpoint.objects.bulk_create(
+        checkpoints, batch_size=constants.BULK_BATCH_SIZE, ignore_conflicts=True
+    )
+    return len(checkpoints)
+
+
+def split_range(first_id: int, last_id: int, parts: int) -> list[tuple[int, int]]:
+    """Split an inclusive range of account numbers into `parts` ranges."""
+    size = max(1, -(-(last_id - first_id + 1) // parts))
+    return [
+        (start, min(start + size - 1, last_id))
+        for start in range(first_id, last_id + 1, size)
+    ]
+
+
+def run(first_id: int, last_id: int, until: date) -> int:
+    """Checkpoint an account range on a worker thread."""
+    try:
+        return checkpoint_accounts(first_id, last_id, until)
+    finally:
+        connection.close()
+
+
+class Command(BaseCommand):
+    """Command for writing daily balance checkpoints."""
+
+    help = (
+        "Write the closing balance per account for each closed day with ledger "
+        "activity. Incremental, so it is safe to run as often as needed."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "--until",
+            type=date.fromisoformat,
+            help="Last day to checkpoint (YYYY-MM-DD), defaults to yesterday.",
+        )
+        parser.add_argument(
+            "--accounts",
+            help="Inclusive range of account numbers (START:END), defaults to all.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Number of account ranges to checkpoint in parallel.",
+        )
+
+    def handle(self, **options: Any) -> None:
+        """Handle command."""
+        until = options["until"] or last_closed_day()
+        if until > last_closed_day():
+            raise CommandError(f"{until} has not been closed yet.")
+
+        if options["accounts"]:
+            try:
+                first_id, last_id = map(int, options["accounts"].split(":"))
+            except ValueError as e:
+                raise CommandError("--accounts must be START:END.") from e
+        else:
+            bounds = Account.objects.aggregate(Min("pk"), Max("pk"))
+            if bounds["pk__min"] is None:
+                return
+            first_id, last_id = bounds["pk__min"], bounds["pk__max"]
+
+        ranges = split_range(first_id, last_id, max(1, options["workers"]))
+        first_ids, last_ids = zip(*ranges, strict=True)
+        with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+            written = sum(executor.map(run, first_ids, last_ids, repeat(until)))
+
+        print(f"Wrote {written} checkpoint(s) up to {until}.")
@@ -0,0 +1,43 @@
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+from django.db import connection
+from django.db.transaction import atomic
+from django.utils.timezone import now
+
+from best_bank_as import constants
+from best_bank_as.ledger_partitions import (
+    create_partition,
+    is_partitioned,
+    months_ahead,
+    partition_name,
+)
+
+
+class Command(BaseCommand):
+    """Command for creating ledger partitions ahead of time."""
+
+    help = (
+        "Create the monthly ledger partitions from this month through "
+        f"{constants.LEDGER_PARTITION_MONTHS_AHEAD} months ahead."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only list the partitions that should exist.",
+        )
+
+    @atomic
+    def handle(self, **options: Any) -> None:
+        """Handle command."""
+        with connection.cursor() as cursor:
+            if not is_partitioned(cursor):
+                raise CommandError("The ledger table is not partitioned.")
+
+            for month in months_ahead(now().date()):
+                if options["dry_run"]:
+                    print(partition_name(month))
+                elif create_partition(cursor, month):
+                    print(f"Created {partition_name(month)}.")
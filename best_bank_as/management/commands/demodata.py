@@ -8,7 +8,7 @@ from django.db.transaction import atomic
 from best_bank_as import enums
 from best_bank_as.db_models.account import Account
 from best_bank_as.db_models.customer import Customer
-from best_bank_as.db_models.ledger import Ledger
+from best_bank_as.db_models.ledger import Ledger, TransferInstruction
 
 User = get_user_model()
 
@@ -67,20 +67,15 @@ class Command(BaseCommand):
 
         bank_account = Account.objects.filter(pk=1)
 
-        Ledger.transfer(
-            source_account=bank_account[0],
-            destination_account=account1,
-            amount=Decimal(value=5000),
-        )
-        Ledger.transfer(
-            source_account=bank_account[0],
-            destination_account=account3,
-            amount=Decimal(value=5000),
-        )
-        Ledger.transfer(
-            source_account=bank_account[0],
-            destination_account=account5,
-            amount=Decimal(value=5000),
+        Ledger.bulk_transfer(
+            [
+                TransferInstruction(
+                    source_account_id=bank_account[0].pk,
+                    destination_account_id=account.pk,
+                    amount=Decimal(value=5000),
+                )
+                for account in (account1, account3, account5)
+            ]
         )
 
         print("Demo data inserted.")
@@ -0,0 +1,224 @@
+import asyncio
+import logging
+import signal
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor
+from dataclasses import replace
+from typing import Any
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+from django.db import close_old_connections
+
+from best_bank_as import (
+    bank_registry,
+    constants,
+    enums,
+    interbank,
+    metrics,
+    outgoing_transfers,
+)
+from best_bank_as.db_models.account import Account
+from best_bank_as.db_models.bank import Bank
+from best_bank_as.db_models.ledger import Ledger
+
+logger = logging.getLogger(__name__)
+
+
+def book(
+    reg_number: str, transfer: outgoing_transfers.OutgoingTransfer
+) -> tuple[Bank, outgoing_transfers.OutgoingTransfer] | None:
+    """
+    Book a claimed transfer and acknowledge its claim, on a database thread.
+    Returns the bank and the booked transfer, None if it cannot be booked.
+    """
+    close_old_connections()
+    try:
+        try:
+            bank = bank_registry.get(reg_number)
+            transaction_id = Ledger.transfer_external(
+                Account.objects.get(pk=transfer.source_account_id),
+                reg_number,
+                # Only the id travels, the bank itself is credited here
+                Account(pk=transfer.destination_account_id),
+                transfer.amount,
+            )
+        except (ValueError, Account.DoesNotExist, Bank.DoesNotExist) as e:
+            metrics.incr("interbank.dispatch_errors")
+            logger.warning("External transfer %s not booked: %r", transfer.reference, e)
+            outgoing_transfers.ack(outgoing_transfers.DISPATCH, reg_number, [transfer])
+            return None
+        # In the ledger now, a crash from here on leaves it pending, not lost
+        outgoing_transfers.ack(outgoing_transfers.DISPATCH, reg_number, [transfer])
+        return bank, replace(transfer, transaction_id=transaction_id)
+    finally:
+        close_old_connections()
+
+
+def complete(
+    reg_number: str,
+    transfer: outgoing_transfers.OutgoingTransfer,
+    status: enums.TransactionStatus | None,
+) -> None:
+    """Finalize or park a sent transfer, on a database thread."""
+    close_old_connections()
+    try:
+        Ledger.complete_external_transfer(reg_number, transfer, status)
+    finally:
+        close_old_connections()
+
+
+async def send(
+    reg_number: str, transfer: outgoing_transfers.OutgoingTransfer, db: Executor
+) -> None:
+    """
+    Book, send and finalize one claimed transfer. The request to the bank is
+    awaited on the event loop, only the bookings take a thread of `db`.
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        booked = await loop.run_in_executor(db, book, reg_number, transfer)
+        if booked is None:
+            return
+        bank, transfer = booked
+        status = await Ledger.apost_external_transfer(bank, transfer)
+        await loop.run_in_executor(db, complete, reg_number, transfer, status)
+        metrics.incr("interbank.dispatched")
+    except Exception:
+        # Claims that were not acknowledged are recovered later
+        metrics.incr("interbank.dispatch_errors")
+        logger.exception("External transfer %s failed", transfer.reference)
+
+
+def registered_banks() -> list[str]:
+    """Registration numbers of the banks to serve."""
+    close_old_connections()
+    try:
+        return bank_registry.reg_numbers()
+    finally:
+        close_old_connections()
+
+
+async def wait(stopping: asyncio.Event, seconds: float) -> None:
+    """Sleep for `seconds`, or until the dispatcher is stopping."""
+    try:
+        await asyncio.wait_for(stopping.wait(), timeout=seconds)
+    except TimeoutError:
+        pass
+
+
+async def serve_bank(
+    reg_number: str,
+    concurrency: int,
+    drain: bool,
+    stopping: asyncio.Event,
+    db: Executor,
+) -> None:
+    """
+    Send the queued transfers of one bank, at most `concurrency` at a time.
+    Each bank has its own limit, so a slow bank only delays itself.
+    When stopping, no more transfers are claimed and those in flight finish.
+    """
+    slots = asyncio.Semaphore(concurrency)
+    in_flight: set[asyncio.Task] = set()
+
+    while not stopping.is_set():
+        await slots.acquire()
+        claimed = await outgoing_transfers.aclaim(
+            outgoing_transfers.DISPATCH, reg_number, 1
+        )
+        if not claimed:
+            slots.release()
+            if drain:
+                break
+            # Claims of a dispatcher that died before booking them
+            await outgoing_transfers.arecover(outgoing_transfers.DISPATCH, reg_number)
+            await wait(stopping, constants.INTERBANK_DISPATCHER_POLL_SECONDS)
+            continue
+
+        task = asyncio.create_task(send(reg_number, claimed[0], db))
+        in_flight.add(task)
+        task.add_done_callback(in_flight.discard)
+        task.add_done_callback(lambda _: slots.release())
+
+    await asyncio.gather(*in_flight)
+
+
+async def dispatch(
+    concurrency: int, drain: bool = False, stopping: asyncio.Event | None = None
+) -> None:
+    """
+    Serve every bank, picking up new banks as they are registered. With
+    `drain`, return once the queues of all banks are empty, otherwise once
+    `stopping` is set and the transfers in flight are done.
+    """
+    stopping = stopping or asyncio.Event()
+    loop = asyncio.get_running_loop()
+    banks: dict[str, asyncio.Task] = {}
+    db = ThreadPoolExecutor(
+        constants.INTERBANK_DISPATCHER_DB_THREADS, thread_name_prefix="dispatcher-db"
+    )
+    try:
+        while not stopping.is_set():
+            for reg_number in await loop.run_in_executor(db, registered_banks):
+                if reg_number not in banks:
+                    banks[reg_number] = asyncio.create_task(
+                        serve_bank(reg_number, concurrency, drain, stopping, db)
+                    )
+
+            if drain:
+                break
+            await wait(stopping, constants.INTERBANK_DISPATCHER_BANK_REFRESH_SECONDS)
+        await asyncio.gather(*banks.values())
+    finally:
+        await interbank.aclose()
+        db.shutdown()
+
+
+async def run(concurrency: int, drain: bool) -> None:
+    """Dispatch until SIGTERM or SIGINT, letting the transfers in flight finish."""
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stopping.set)
+    await dispatch(concurrency, drain, stopping)
+
+
+class Command(BaseCommand):
+    """Send queued external transfers from an asyncio dispatcher."""
+
+    help = (
+        "Send the external transfers queued with INTERBANK_SENDER=dispatcher, "
+        "with a concurrency limit per bank. Requests in flight are awaited, "
+        "only bookings take one of a few database threads."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "--bank-concurrency",
+            type=int,
+            default=constants.INTERBANK_BANK_CONCURRENCY,
+            help="Transfers in flight per bank.",
+        )
+        parser.add_argument(
+            "--drain",
+            action="store_true",
+            help="Exit once every queue is empty instead of waiting for more.",
+        )
+
+    def handle(self, **options: Any) -> None:
+        """Handle command."""
+        # Other senders queue nothing here, what is left can still be drained
+        if settings.INTERBANK_SENDER != "dispatcher" and not options["drain"]:
+            raise CommandError(
+                f"INTERBANK_SENDER is {settings.INTERBANK_SENDER!r}, not 'dispatcher'."
+            )
+
+        started = time.monotonic()
+        asyncio.run(run(options["bank_concurrency"], options["drain"]))
+        counters = metrics.snapshot()
+        print(
+            f"Dispatched {counters.get('interbank.dispatched', 0):.0f} transfer(s), "
+            f"{counters.get('interbank.dispatch_errors', 0):.0f} failed, "
+            f"in {time.monotonic() - started:.1f}s."
+        )
@@ -75,10 +75,15 @@ def create_internal_bank_account() -> Account:
     transaction = Transaction.objects.create()
 
     # Add starting balance
-    Ledger.objects.create(
-        account=account,
-        transaction=transaction,
-        amount=1000000,
+    Ledger.post_entries(
+        [
+            Ledger(
+                account=account,
+                transaction=transaction,
+                amount=1000000,
+                status=enums.TransactionStatus.PROCESSED,
+            )
+        ]
     )
 
     return account
@@ -0,0 +1,43 @@
+from typing import Any
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandParser
+
+from best_bank_as import enums
+from best_bank_as.db_models.account import Account
+
+
+def get_house_account(pk: int | None = None) -> Account:
+    """Get the house account, by default the internal bank account."""
+    if pk is not None:
+        return Account.objects.get(pk=pk)
+    return Account.objects.get(
+        account_type=enums.AccountType.INTERNAL, customer=None, parent=None
+    )
+
+
+class Command(BaseCommand):
+    """Command for sharding the house account."""
+
+    help = "Split the house account into shards and spread its funds evenly."
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("--account", type=int, help="House account number.")
+        parser.add_argument(
+            "--shards",
+            type=int,
+            default=settings.HOUSE_ACCOUNT_SHARDS,
+            help="Number of shards, 1 moves all funds back to the house account.",
+        )
+
+    def handle(self, **options: Any) -> None:
+        """Handle command."""
+        house_account = get_house_account(options["account"])
+        print(f"Rebalancing account {house_account.pk} over {options['shards']}...")
+
+        house_account.rebalance_shards(options["shards"])
+
+        for account in [house_account, *house_account.shards.order_by("pk")]:
+            balance = account.balance_projection.available
+            print(f"Account {account.pk}: {balance}")
+        print(f"Total: {house_account.get_balance()}")
@@ -0,0 +1,68 @@
+import logging
+import time
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandParser
+from django.db import close_old_connections
+
+from best_bank_as import constants, metrics
+from best_bank_as.db_models.ledger import Ledger
+
+logger = logging.getLogger(__name__)
+
+
+def report(counters: dict[str, float], elapsed: float) -> str:
+    """Summarize the relay counters gathered over `elapsed` seconds."""
+    relayed = counters.get("outbox.relayed", 0)
+    average_lag = counters.get("outbox.lag_seconds", 0) / relayed if relayed else 0
+    return (
+        f"Relayed {relayed:.0f} transfer(s), {relayed / elapsed:.1f}/s, "
+        f"lag {average_lag:.2f}s average and "
+        f"{counters.get('outbox.lag_max_seconds', 0):.2f}s max."
+    )
+
+
+class Command(BaseCommand):
+    """Send the external transfers in the outbox."""
+
+    help = (
+        "Send the external transfers booked into the outbox, in batches. "
+        "Several relays can run in parallel."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "--batch-size", type=int, default=constants.INTERBANK_OUTBOX_BATCH_SIZE
+        )
+        parser.add_argument(
+            "--drain",
+            action="store_true",
+            help="Exit once the outbox is empty instead of waiting for more.",
+        )
+
+    def handle(self, **options: Any) -> None:
+        """Handle command."""
+        metrics.reset()
+        started = time.monotonic()
+        while True:
+            close_old_connections()
+            try:
+                relayed = Ledger.relay_external_transfers(options["batch_size"])
+            except Exception:
+                # The database may come back, the relay waits for it
+                metrics.incr("outbox.errors")
+                logger.exception("Relaying the outbox failed")
+                relayed = 0
+
+            elapsed = time.monotonic() - started
+            if elapsed >= constants.INTERBANK_OUTBOX_REPORT_SECONDS or (
+                options["drain"] and not relayed
+            ):
+                print(report(metrics.snapshot(), elapsed))
+                metrics.reset()
+                started = time.monotonic()
+
+            if not relayed:
+                if options["drain"]:
+                    return
+                time.sleep(constants.INTERBANK_OUTBOX_POLL_SECONDS)
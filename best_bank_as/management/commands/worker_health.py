@@ -0,0 +1,43 @@
+import socket
+from datetime import UTC, timedelta
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+from rq import Worker
+from rq.defaults import DEFAULT_WORKER_TTL
+from rq.utils import now
+
+from best_bank_as import redis_clients
+
+
+class Command(BaseCommand):
+    """Health check for the RQ workers of this host."""
+
+    help = (
+        "Exit with an error unless an RQ worker on this host sent a heartbeat "
+        "recently. Meant for container health checks."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        # Idle workers and workers busy with a job heartbeat about this often
+        parser.add_argument(
+            "--max-age",
+            type=int,
+            default=DEFAULT_WORKER_TTL + 60,
+            help="Seconds since the last heartbeat of a live worker.",
+        )
+
+    def handle(self, **options: Any) -> None:
+        """Handle command."""
+        hostname = socket.gethostname()
+        oldest = now() - timedelta(seconds=options["max_age"])
+        live = [
+            worker
+            for worker in Worker.all(connection=redis_clients.client())
+            if worker.hostname == hostname and worker.last_heartbeat is not None
+            # Heartbeats are in UTC, naive in older RQ versions
+            and worker.last_heartbeat.replace(tzinfo=UTC) >= oldest
+        ]
+        if not live:
+            raise CommandError(f"No live RQ worker on {hostname}.")
+        print(f"{len(live)} live RQ worker(s) on {hostname}.")
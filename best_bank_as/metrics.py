@@ -0,0 +1,31 @@
+"""Process-local counters for instrumenting hot paths."""
+
+import threading
+from collections import defaultdict
+
+_lock = threading.Lock()
+_counters: defaultdict[str, float] = defaultdict(float)
+
+
+def incr(name: str, value: float = 1) -> None:
+    """Add a value to a counter."""
+    with _lock:
+        _counters[name] += value
+
+
+def maximum(name: str, value: float) -> None:
+    """Keep the highest value seen for a counter."""
+    with _lock:
+        _counters[name] = max(_counters[name], value)
+
+
+def snapshot() -> dict[str, float]:
+    """Return a copy of all counters."""
+    with _lock:
+        return dict(_counters)
+
+
+def reset() -> None:
+    """Clear all counters."""
+    with _lock:
+        _counters.clear()
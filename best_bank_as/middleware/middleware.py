@@ -1,125 +1,316 @@
+from abc import ABC, abstractmethod
 from collections.abc import Callable
 from datetime import datetime
+from typing import Any
 
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
 from django.contrib.auth import logout
-from django.core.cache import cache
 from django.http import (
     HttpRequest,
     HttpResponse,
-    HttpResponseBadRequest,
+    HttpResponseForbidden,
     HttpResponseNotFound,
     QueryDict,
 )
 from django.shortcuts import render
+from redis.exceptions import RedisError
 
-from best_bank_as import constants
+from best_bank_as import (
+    constants,
+    idempotency,
+    interbank_signing,
+    metrics,
+    session_activity,
+)
+from best_bank_as.async_helpers import aget_user, arender
 
 
-class NotFoundMiddleware:
-    """Prevents the standard error page when visiting invalid URL."""
+class AsyncCapableMiddleware(ABC):
+    """
+    Base for middleware that runs natively in both the sync (WSGI) and the
+    async (ASGI) handler, so Django never adapts the chain between the two.
+    """
+
+    sync_capable = True
+    async_capable = True
 
-    def __init__(
-        self,
-        get_response: Callable[[HttpRequest], HttpResponse],
-    ):
+    def __init__(self, get_response: Callable[[HttpRequest], Any]) -> None:
         self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request: HttpRequest) -> Any:
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.handle(request)
+
+    @abstractmethod
+    def handle(self, request: HttpRequest) -> HttpResponse:
+        """Handle a request in the sync handler."""
+
+    @abstractmethod
+    async def __acall__(self, request: HttpRequest) -> HttpResponse:
+        """Handle a request in the async handler."""
+
+
+class NotFoundMiddleware(AsyncCapableMiddleware):
+    """Prevents the standard error page when visiting invalid URL."""
 
-    def __call__(self, request: HttpRequest) -> HttpResponse:
+    template_name = "best_bank_as/error_pages/404_not_found.html"
+
+    def handle(self, request: HttpRequest) -> HttpResponse:
         response = self.get_response(request)
-        if response is None:
-            return HttpResponseNotFound(
-                render(request, "best_bank_as/error_pages/404_not_found.html")
-            )
-        if response.status_code == 404:
-            return HttpResponseNotFound(
-                render(request, "best_bank_as/error_pages/404_not_found.html")
-            )
+        if response is None or response.status_code == 404:
+            # Only the content, wrapping the response would close it, which
+            # sends request_finished and closes the database connection
+            return HttpResponseNotFound(render(request, self.template_name).content)
+        return response
+
+    async def __acall__(self, request: HttpRequest) -> HttpResponse:
+        response = await self.get_response(request)
+        if response is None or response.status_code == 404:
+            page = await arender(request, self.template_name)
+            return HttpResponseNotFound(page.content)
         return response
 
 
-class RequestMethodDictionaryMiddleware:
+class RequestMethodDictionaryMiddleware(AsyncCapableMiddleware):
     """Middleware for handling PUT requests."""
 
-    def __init__(self, get_response: HttpResponse) -> None:
-        """Init method."""
-        self.get_response = get_response
-
-    def __call__(self, request: HttpRequest) -> None:
-        """Handles the PUT request."""
+    @staticmethod
+    def parse_put(request: HttpRequest) -> None:
+        """Parse the body of a PUT request into `request.PUT`."""
         if request.method == "PUT":
             request.PUT = QueryDict(request.body)
 
-        response = self.get_response(request)
-        return response
+    def handle(self, request: HttpRequest) -> HttpResponse:
+        """Handles the PUT request."""
+        self.parse_put(request)
+        return self.get_response(request)
 
+    async def __acall__(self, request: HttpRequest) -> HttpResponse:
+        self.parse_put(request)
+        return await self.get_response(request)
 
-class SessionTimeoutMiddleware:
-    """Middleware for session timeout."""
 
-    def __init__(self, get_response: HttpResponse):  # type : ignore
-        """Init method for session timeout middleware."""
-        self.get_response = get_response
+class SessionTimeoutMiddleware(AsyncCapableMiddleware):
+    """Middleware for session timeout."""
 
-    def __call__(self, request: HttpRequest) -> HttpResponse:
-        """Call method for session timeout middleware."""
+    @staticmethod
+    def tracked(request: HttpRequest) -> bool:
+        """Check if the activity of a request is tracked for expiry."""
+        return bool(
+            request.user.is_authenticated and request.session.get("last_activity")
+        )
 
-        response = self.get_response(request)
-        if not request.user.is_authenticated:
-            return response
+    @staticmethod
+    def session_expired(
+        request: HttpRequest, current_time: datetime, latest: bytes | None
+    ) -> bool:
+        """
+        Record the activity of an authenticated user, True if it expired.
+        The session is only written when its `last_activity` is more than
+        `SESSION_ACTIVITY_GRANULARITY_SECONDS` old, expiry is measured from
+        the latest request kept in session_activity when that is later.
+        """
+        recorded = datetime.strptime(
+            request.session["last_activity"], constants.DATETIME_FORMAT
+        )
+        last_activity = recorded
+        if latest:
+            last_activity = max(
+                recorded, datetime.strptime(latest.decode(), constants.DATETIME_FORMAT)
+            )
 
-        last_activity = request.session.get("last_activity", None)
+        dt = current_time - last_activity
+        if dt.total_seconds() > constants.SESSION_TIMEOUT_SECONDS:
+            return True
 
-        if not last_activity:
-            return response
+        dt = current_time - recorded
+        if dt.total_seconds() >= settings.SESSION_ACTIVITY_GRANULARITY_SECONDS:
+            request.session["last_activity"] = current_time.strftime(
+                constants.DATETIME_FORMAT
+            )
+        return False
 
-        current_time = datetime.now()
+    @classmethod
+    def untracked_expired(cls, request: HttpRequest, current_time: datetime) -> bool:
+        """
+        `session_expired` while Redis is unavailable, measured from the
+        session alone, which then saves every activity of a live session.
+        """
+        metrics.incr("session_activity.errors")
+        if cls.session_expired(request, current_time, None):
+            return True
         request.session["last_activity"] = current_time.strftime(
             constants.DATETIME_FORMAT
         )
+        return False
+
+    def handle(self, request: HttpRequest) -> HttpResponse:
+        """Call method for session timeout middleware."""
+        response = self.get_response(request)
+        if not self.tracked(request):
+            return response
 
-        dt = current_time - datetime.strptime(last_activity, constants.DATETIME_FORMAT)
-        session_expired = dt.seconds > constants.SESSION_TIMEOUT_SECONDS
+        current_time = datetime.now()
+        try:
+            latest = session_activity.record(
+                request.session.session_key,
+                current_time.strftime(constants.DATETIME_FORMAT),
+            )
+        except RedisError:
+            expired = self.untracked_expired(request, current_time)
+        else:
+            expired = self.session_expired(request, current_time, latest)
 
-        if session_expired:
+        if expired:
             print("********** SESSION EXPIRED **********")
             logout(request)
+        return response
+
+    async def __acall__(self, request: HttpRequest) -> HttpResponse:
+        response = await self.get_response(request)
+        # Loading the user also loads the session, the rest runs in memory
+        await aget_user(request)
+        if not self.tracked(request):
+            return response
 
+        current_time = datetime.now()
+        try:
+            latest = await session_activity.arecord(
+                request.session.session_key,
+                current_time.strftime(constants.DATETIME_FORMAT),
+            )
+        except RedisError:
+            expired = self.untracked_expired(request, current_time)
+        else:
+            expired = self.session_expired(request, current_time, latest)
+
+        if expired:
+            print("********** SESSION EXPIRED **********")
+            await sync_to_async(logout)(request)
         return response
 
 
-class IdempotencyMiddleware:
-    """Middleware for idempotent behavior."""
+class InterbankSignatureMiddleware(AsyncCapableMiddleware):
+    """
+    Authenticates requests signed by another bank, see interbank_signing.
+    A valid signature sets `request.peer_bank` and skips the CSRF check,
+    without a session or a password. Unsigned requests pass untouched.
+    """
 
-    def __init__(self, get_response: Callable[[HttpRequest], HttpResponse]):
-        self.get_response = get_response
+    @staticmethod
+    def signed(request: HttpRequest) -> bool:
+        """Check if a request carries a signature."""
+        return interbank_signing.SIGNATURE_HEADER in request.headers
+
+    @staticmethod
+    def authenticate(request: HttpRequest) -> HttpResponse | None:
+        """Verify the signature of a signed request, a 403 response if it fails."""
+        try:
+            request.peer_bank = interbank_signing.verify(
+                request.headers, request.method, request.path, request.body
+            )
+        except interbank_signing.SignatureError as e:
+            return HttpResponseForbidden(str(e))
+        # CSRF guards session cookies, a signature cannot be sent by a browser
+        request._dont_enforce_csrf_checks = True
+        return None
+
+    def handle(self, request: HttpRequest) -> HttpResponse:
+        if self.signed(request) and (refused := self.authenticate(request)):
+            return refused
+        return self.get_response(request)
+
+    async def __acall__(self, request: HttpRequest) -> HttpResponse:
+        # The key of the bank may have to be loaded from the database, so only
+        # signed requests go to a thread
+        if self.signed(request) and (
+            refused := await sync_to_async(self.authenticate)(request)
+        ):
+            return refused
+        return await self.get_response(request)
 
-    def __call__(self, request: HttpRequest) -> HttpResponse:
-        if request.method == "POST" and request.path in [
-            "/external-transfer/",
-            "/transfer/",
-        ]:
-            idempotency_key = request.headers.get("Idempotency-Key")
-
-            if not idempotency_key:
-                # Render the error page for missing idempotency key
-                response_content = render(
-                    request, "best_bank_as/error_pages/idempotency_key_missing.html"
-                ).content
-                return HttpResponseBadRequest(
-                    response_content, content_type="text/html"
-                )
-
-            if cache.get(idempotency_key):
-                # Render the error page for request already processed
-                response_content = render(
-                    request, "best_bank_as/error_pages/request_already_processed.html"
-                ).content
-                print(response_content)
-                return HttpResponseBadRequest(
-                    response_content, content_type="text/html"
-                )
-
-            cache.set(idempotency_key, "processed", 86400)  # 24 hours
+
+class IdempotencyMiddleware(AsyncCapableMiddleware):
+    """
+    Middleware for idempotent behavior. Runs each POST to the protected
+    paths once per Idempotency-Key and replays the response for retries.
+    """
+
+    paths = ["/external-transfer/", "/external-transfer/batch/", "/transfer/"]
+    missing_template = "best_bank_as/error_pages/idempotency_key_missing.html"
+    in_progress_template = "best_bank_as/error_pages/request_in_progress.html"
+    unavailable_template = "best_bank_as/error_pages/error_page.html"
+
+    def protects(self, request: HttpRequest) -> bool:
+        """Check if a request needs an idempotency key."""
+        return request.method == "POST" and request.path in self.paths
+
+    def handle(self, request: HttpRequest) -> HttpResponse:
+        if not self.protects(request):
+            return self.get_response(request)
+
+        idempotency_key = request.headers.get("Idempotency-Key")
+        if not idempotency_key:
+            # Render the error page for missing idempotency key
+            return self.error(render(request, self.missing_template))
+
+        key = idempotency.redis_key(
+            idempotency.owner(request, request.user), request.path, idempotency_key
+        )
+        try:
+            stored = idempotency.claim(key)
+        except RedisError:
+            metrics.incr("idempotency.errors")
+            return self.error(render(request, self.unavailable_template), 503)
+
+        if stored == idempotency.IN_FLIGHT:
+            return self.error(render(request, self.in_progress_template), 409)
+        if stored is not None:
+            return idempotency.replay(stored)
 
         response = self.get_response(request)
+        try:
+            idempotency.complete(key, response)
+        except RedisError:
+            # The claim expires, retries after that run the request again
+            metrics.incr("idempotency.errors")
         return response
+
+    async def __acall__(self, request: HttpRequest) -> HttpResponse:
+        if not self.protects(request):
+            return await self.get_response(request)
+
+        idempotency_key = request.headers.get("Idempotency-Key")
+        if not idempotency_key:
+            return self.error(await arender(request, self.missing_template))
+
+        user = await aget_user(request)
+        key = idempotency.redis_key(
+            idempotency.owner(request, user), request.path, idempotency_key
+        )
+        try:
+            stored = await idempotency.aclaim(key)
+        except RedisError:
+            metrics.incr("idempotency.errors")
+            return self.error(await arender(request, self.unavailable_template), 503)
+
+        if stored == idempotency.IN_FLIGHT:
+            return self.error(await arender(request, self.in_progress_template), 409)
+        if stored is not None:
+            return idempotency.replay(stored)
+
+        response = await self.get_response(request)
+        try:
+            await idempotency.acomplete(key, response)
+        except RedisError:
+            metrics.incr("idempotency.errors")
+        return response
+
+    @staticmethod
+    def error(page: HttpResponse, status: int = 400) -> HttpResponse:
+        """Return an error page with the given status, a bad request by default."""
+        return HttpResponse(page.content, content_type="text/html", status=status)
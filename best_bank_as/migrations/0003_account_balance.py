@@ -0,0 +1,66 @@
+# Generated by Django 4.2.5 on 2026-10-18 13:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_balances(apps, schema_editor):
+    """Build the balance projection from the existing ledger."""
+    Ledger = apps.get_model("best_bank_as", "Ledger")
+    AccountBalance = apps.get_model("best_bank_as", "AccountBalance")
+
+    balances = {}
+    rows = (
+        Ledger.objects.exclude(status=3)
+        .filter(account__isnull=False)
+        .values("account_id", "status")
+        .annotate(total=models.Sum("amount"))
+    )
+    for row in rows:
+        balance = balances.setdefault(
+            row["account_id"], AccountBalance(account_id=row["account_id"])
+        )
+        if row["status"] == 2:
+            balance.booked += row["total"]
+        else:
+            balance.pending += row["total"]
+
+    AccountBalance.objects.bulk_create(balances.values())
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("best_bank_as", "0002_alter_ledger_status"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AccountBalance",
+            fields=[
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "account",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="balance_projection",
+                        serialize=False,
+                        to="best_bank_as.account",
+                    ),
+                ),
+                (
+                    "booked",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=15),
+                ),
+                (
+                    "pending",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=15),
+                ),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "abstract": False,
+            },
+        ),
+        migrations.RunPython(backfill_balances, migrations.RunPython.noop),
+    ]
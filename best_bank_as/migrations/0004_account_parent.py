@@ -0,0 +1,24 @@
+# Generated by Django 4.2.5 on 2026-10-18 13:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("best_bank_as", "0003_account_balance"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="account",
+            name="parent",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="shards",
+                to="best_bank_as.account",
+            ),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.5 on 2026-10-18 13:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("best_bank_as", "0004_account_parent"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="ledger",
+            name="counterpart_account",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+",
+                to="best_bank_as.account",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="ledger",
+            index=models.Index(
+                fields=["account", "created_at", "id"],
+                name="best_bank_a_account_636c20_idx",
+            ),
+        ),
+        migrations.RunSQL(
+            """
+            UPDATE best_bank_as_ledger AS ledger
+            SET counterpart_account_id = other.account_id
+            FROM best_bank_as_ledger AS other
+            WHERE other.transaction_id = ledger.transaction_id
+            AND other.account_id <> ledger.account_id
+            """,
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,140 @@
+import re
+from datetime import UTC, date, datetime, time
+from typing import Any
+
+from django.db import migrations
+from django.utils.timezone import now
+
+# Frozen copies of `best_bank_as.ledger_partitions` as of this migration, so
+# later changes to the app code do not change what it does
+TABLE = "best_bank_as_ledger"
+DEFAULT_PARTITION = f"{TABLE}_default"
+MONTHS_AHEAD = 3
+
+
+def next_month(month: date) -> date:
+    """First day of the following month."""
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def months(first: date, last: date) -> list[date]:
+    """Months from the month of `first` through the month of `last`."""
+    month, last = first.replace(day=1), last.replace(day=1)
+    result = []
+    while month <= last:
+        result.append(month)
+        month = next_month(month)
+    return result
+
+
+def months_ahead(today: date) -> list[date]:
+    """Months that should have a partition, from this month on."""
+    last = today.replace(day=1)
+    for _ in range(MONTHS_AHEAD):
+        last = next_month(last)
+    return months(today, last)
+
+
+def create_partition(cursor: Any, month: date) -> None:
+    """Create and attach the partition for a month."""
+    bounds = [
+        datetime.combine(day, time.min, tzinfo=UTC)
+        for day in (month, next_month(month))
+    ]
+    name = f"{TABLE}_y{month.year}m{month.month:02d}"
+    cursor.execute(f"CREATE TABLE {name} (LIKE {TABLE} INCLUDING DEFAULTS)")
+    cursor.execute(
+        f"ALTER TABLE {TABLE} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)",
+        bounds,
+    )
+
+
+OLD_TABLE = f"{TABLE}_old"
+
+
+def rebuild_ledger(schema_editor: Any, partitioned: bool) -> None:
+    """
+    Copy the ledger into a new table, partitioned by month or plain, and
+    recreate its sequence, primary key, indexes and foreign keys. A
+    partitioned table needs `created_at` in its primary key.
+    """
+    execute = schema_editor.execute
+    execute(f"LOCK TABLE {TABLE} IN ACCESS EXCLUSIVE MODE")
+    execute(f"ALTER TABLE {TABLE} RENAME TO {OLD_TABLE}")
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT pg_get_indexdef(indexrelid) FROM pg_index
+            WHERE indrelid = %s::regclass AND NOT indisprimary
+            """,
+            [OLD_TABLE],
+        )
+        indexes = [
+            re.sub(rf"ON (ONLY )?(\S+\.)?{OLD_TABLE} ", f"ON {TABLE} ", definition)
+            for definition, in cursor.fetchall()
+        ]
+        cursor.execute(
+            """
+            SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+            WHERE conrelid = %s::regclass AND contype = 'f'
+            """,
+            [OLD_TABLE],
+        )
+        foreign_keys = cursor.fetchall()
+        cursor.execute(f"SELECT min(created_at), max(id) FROM {OLD_TABLE}")
+        first_created_at, max_id = cursor.fetchone()
+
+        if partitioned:
+            execute(
+                f"CREATE TABLE {TABLE} (LIKE {OLD_TABLE}) PARTITION BY RANGE (created_at)"
+            )
+            today = now().date()
+            first: date = first_created_at.date() if first_created_at else today
+            for month in sorted(set(months(first, today) + months_ahead(today))):
+                create_partition(cursor, month)
+            execute(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {TABLE} DEFAULT")
+        else:
+            execute(f"CREATE TABLE {TABLE} (LIKE {OLD_TABLE})")
+
+    execute(f"INSERT INTO {TABLE} SELECT * FROM {OLD_TABLE}")
+    execute(f"DROP TABLE {OLD_TABLE}")
+
+    if partitioned:
+        execute(f"CREATE SEQUENCE {TABLE}_id_seq OWNED BY {TABLE}.id")
+        execute(
+            f"ALTER TABLE {TABLE} ALTER COLUMN id SET DEFAULT nextval('{TABLE}_id_seq')"
+        )
+        execute(f"ALTER TABLE {TABLE} ADD PRIMARY KEY (id, created_at)")
+    else:
+        execute(
+            f"ALTER TABLE {TABLE} ALTER COLUMN id ADD GENERATED BY DEFAULT AS IDENTITY"
+        )
+        execute(f"ALTER TABLE {TABLE} ADD PRIMARY KEY (id)")
+    execute(
+        f"SELECT setval(pg_get_serial_sequence('{TABLE}', 'id'), %s, %s)",
+        [max_id or 1, max_id is not None],
+    )
+
+    for definition in indexes:
+        execute(definition)
+    for name, definition in foreign_keys:
+        execute(f"ALTER TABLE {TABLE} ADD CONSTRAINT {name} {definition}")
+
+
+def partition_ledger(apps: Any, schema_editor: Any) -> None:
+    rebuild_ledger(schema_editor, partitioned=True)
+
+
+def unpartition_ledger(apps: Any, schema_editor: Any) -> None:
+    rebuild_ledger(schema_editor, partitioned=False)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("best_bank_as", "0006_balance_checkpoint"),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_ledger, unpartition_ledger),
+    ]
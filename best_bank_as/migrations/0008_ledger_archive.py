@@ -0,0 +1,74 @@
+# Generated by Django 4.2.5 on 2026-10-18 13:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("best_bank_as", "0007_partition_ledger"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="ledger",
+            name="carried_forward",
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name="LedgerArchive",
+            fields=[
+                ("id", models.BigIntegerField(primary_key=True, serialize=False)),
+                ("created_at", models.DateTimeField()),
+                ("amount", models.DecimalField(decimal_places=2, max_digits=15)),
+                (
+                    "status",
+                    models.IntegerField(
+                        choices=[(1, "Pending"), (2, "Processed"), (3, "Rejected")]
+                    ),
+                ),
+                ("archived_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "account",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="best_bank_as.account",
+                    ),
+                ),
+                (
+                    "counterpart_account",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to="best_bank_as.account",
+                    ),
+                ),
+                (
+                    "registration_number",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="best_bank_as.bank",
+                    ),
+                ),
+                (
+                    "transaction",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="best_bank_as.transaction",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["account", "created_at", "id"],
+                        name="best_bank_a_account_912c59_idx",
+                    )
+                ],
+            },
+        ),
+    ]
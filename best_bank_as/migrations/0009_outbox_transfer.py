@@ -0,0 +1,57 @@
+# Generated by Django 4.2.5 on 2026-10-18 14:23
+
+import uuid
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("best_bank_as", "0008_ledger_archive"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OutboxTransfer",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("reference", models.UUIDField(default=uuid.uuid4, unique=True)),
+                ("destination_account", models.IntegerField()),
+                ("amount", models.DecimalField(decimal_places=2, max_digits=15)),
+                (
+                    "registration_number",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="best_bank_as.bank",
+                    ),
+                ),
+                (
+                    "source_account",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="best_bank_as.account",
+                    ),
+                ),
+                (
+                    "transaction",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="best_bank_as.transaction",
+                    ),
+                ),
+            ],
+            options={
+                "abstract": False,
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.5 on 2026-10-18 14:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("best_bank_as", "0009_outbox_transfer"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="bank",
+            name="signing_key",
+            field=models.CharField(blank=True, default="", max_length=128),
+        ),
+    ]
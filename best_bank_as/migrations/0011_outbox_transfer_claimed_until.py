@@ -0,0 +1,17 @@
+# Generated by Django 4.2.5 on 2026-10-18 14:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("best_bank_as", "0010_bank_signing_key"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="outboxtransfer",
+            name="claimed_until",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
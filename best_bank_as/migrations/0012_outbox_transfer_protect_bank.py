@@ -0,0 +1,20 @@
+# Generated by Django 4.2.5 on 2026-10-18 14:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("best_bank_as", "0011_outbox_transfer_claimed_until"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="outboxtransfer",
+            name="registration_number",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.PROTECT, to="best_bank_as.bank"
+            ),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.5 on 2026-10-18 15:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("best_bank_as", "0012_outbox_transfer_protect_bank"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="outboxtransfer",
+            name="attempt",
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+    ]
@@ -1,5 +1,8 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.utils.functional import cached_property
+
+from best_bank_as import roles
 
 
 class CustomUser(AbstractUser):
@@ -27,9 +30,25 @@ class CustomUser(AbstractUser):
     @property
     def is_customer(self) -> bool:
         """Check if user is a customer."""
-        return hasattr(self, "customer")
+        return "customer" in self.group_names
+
+    @cached_property
+    def group_names(self) -> frozenset[str]:
+        """Names of the groups of the user, resolved once per user object."""
+        return roles.resolve(self.pk)
+
+    async def aload_group_names(self) -> frozenset[str]:
+        """Load `group_names` without blocking the event loop."""
+        if "group_names" not in self.__dict__:
+            self.__dict__["group_names"] = await roles.aresolve(self.pk)
+        return self.group_names
 
     @property
     def is_employee(self) -> bool:
         """Check if the user is an employee or a supervisor."""
-        return self.groups.filter(name__in=["employee", "supervisor"]).exists()
+        return not self.group_names.isdisjoint({"employee", "supervisor"})
+
+    @property
+    def is_supervisor(self) -> bool:
+        """Check if the user is a supervisor."""
+        return "supervisor" in self.group_names
@@ -0,0 +1,170 @@
+"""
+Queues of external transfers waiting to be sent, one Redis list per bank
+and sender in the django-rq Redis.
+
+Transfers are claimed from a queue into its processing set, scored by when
+they were claimed, and acknowledged once booked. Claims older than
+`INTERBANK_QUEUE_CLAIM_SECONDS` belong to a process that died before
+booking and are given back to the queue by `recover`.
+
+Booked transfers a bank failed to take wait for their next attempt in the
+retry queue of the bank, a sorted set scored by when they are due.
+"""
+
+import json
+import time
+from dataclasses import asdict, dataclass
+from decimal import Decimal
+
+from best_bank_as import constants, redis_clients
+
+BATCH = "batch"
+DISPATCH = "dispatch"
+RETRY = "retry"
+
+# Moves up to ARGV[1] transfers from the queue to the processing set
+_CLAIM = """
+local payloads = redis.call('LPOP', KEYS[1], ARGV[1])
+if not payloads then
+    return {}
+end
+for _, payload in ipairs(payloads) do
+    redis.call('ZADD', KEYS[2], ARGV[2], payload)
+end
+return payloads
+"""
+
+# Moves transfers claimed before ARGV[1] back to the head of the queue
+_RECOVER = """
+local payloads = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1])
+for i = #payloads, 1, -1 do
+    redis.call('LPUSH', KEYS[1], payloads[i])
+    redis.call('ZREM', KEYS[2], payloads[i])
+end
+return #payloads
+"""
+
+
+@dataclass(frozen=True)
+class OutgoingTransfer:
+    """An external transfer waiting to be booked and sent."""
+
+    reference: str
+    source_account_id: int
+    destination_account_id: int
+    amount: Decimal
+    # Set once booked, the attempts count the failed sends
+    transaction_id: int | None = None
+    attempt: int = 0
+
+
+def encode(transfer: OutgoingTransfer) -> str:
+    """Serialize a transfer for a queue."""
+    return json.dumps({**asdict(transfer), "amount": str(transfer.amount)})
+
+
+def decode(payload: bytes | str) -> OutgoingTransfer:
+    """Read a transfer serialized by `encode`."""
+    data = json.loads(payload)
+    return OutgoingTransfer(**{**data, "amount": Decimal(data["amount"])})
+
+
+def queue_key(sender: str, reg_number: str) -> str:
+    """Key of the list holding the transfers for a bank and sender."""
+    return f"interbank:{sender}:{reg_number}"
+
+
+def push(sender: str, reg_number: str, transfer: OutgoingTransfer) -> int:
+    """Add a transfer to the queue of a bank, returns the queue length."""
+    return redis_clients.client().rpush(queue_key(sender, reg_number), encode(transfer))
+
+
+def processing_key(sender: str, reg_number: str) -> str:
+    """Key of the set holding the claimed transfers for a bank and sender."""
+    return f"{queue_key(sender, reg_number)}:processing"
+
+
+def claim(sender: str, reg_number: str, count: int) -> list[OutgoingTransfer]:
+    """Claim up to `count` waiting transfers for a bank, see `ack`."""
+    redis = redis_clients.client()
+    payloads = redis.register_script(_CLAIM)(
+        keys=[queue_key(sender, reg_number), processing_key(sender, reg_number)],
+        args=[count, time.time()],
+    )
+    return [decode(payload) for payload in payloads]
+
+
+async def aclaim(sender: str, reg_number: str, count: int) -> list[OutgoingTransfer]:
+    """Async version of `claim`."""
+    redis = redis_clients.async_client()
+    payloads = await redis.register_script(_CLAIM)(
+        keys=[queue_key(sender, reg_number), processing_key(sender, reg_number)],
+        args=[count, time.time()],
+    )
+    return [decode(payload) for payload in payloads]
+
+
+def ack(sender: str, reg_number: str, transfers: list[OutgoingTransfer]) -> None:
+    """Drop claimed transfers once they are booked, or given up on."""
+    if transfers:
+        redis_clients.client().zrem(
+            processing_key(sender, reg_number), *map(encode, transfers)
+        )
+
+
+def recover(sender: str, reg_number: str) -> int:
+    """Give claims too old to be booked back to the queue, returns how many."""
+    redis = redis_clients.client()
+    return redis.register_script(_RECOVER)(
+        keys=[queue_key(sender, reg_number), processing_key(sender, reg_number)],
+        args=[time.time() - constants.INTERBANK_QUEUE_CLAIM_SECONDS],
+    )
+
+
+async def arecover(sender: str, reg_number: str) -> int:
+    """Async version of `recover`."""
+    redis = redis_clients.async_client()
+    return await redis.register_script(_RECOVER)(
+        keys=[queue_key(sender, reg_number), processing_key(sender, reg_number)],
+        args=[time.time() - constants.INTERBANK_QUEUE_CLAIM_SECONDS],
+    )
+
+
+def _waiting_since_key(reg_number: str) -> str:
+    return f"{queue_key(RETRY, reg_number)}:since"
+
+
+def park(reg_number: str, transfer: OutgoingTransfer, delay: float) -> float:
+    """Queue a transfer for another attempt in `delay` seconds, returns when."""
+    due = time.time() + delay
+    pipe = redis_clients.client().pipeline()
+    pipe.zadd(queue_key(RETRY, reg_number), {encode(transfer): due})
+    # Ages count from the first failure, not the latest
+    pipe.zadd(
+        _waiting_since_key(reg_number), {transfer.reference: time.time()}, nx=True
+    )
+    pipe.execute()
+    return due
+
+
+def take_due(reg_number: str, count: int) -> list[OutgoingTransfer]:
+    """Take up to `count` parked transfers whose next attempt is due."""
+    redis = redis_clients.client()
+    key = queue_key(RETRY, reg_number)
+    payloads = redis.zrangebyscore(key, "-inf", time.time(), start=0, num=count)
+    # Only the worker whose ZREM removes a transfer gets it
+    return [decode(payload) for payload in payloads if redis.zrem(key, payload)]
+
+
+def settle(reg_number: str, transfer: OutgoingTransfer) -> None:
+    """Stop counting the age of a transfer that was sent or given up on."""
+    redis_clients.client().zrem(_waiting_since_key(reg_number), transfer.reference)
+
+
+def retry_stats(reg_number: str) -> tuple[int, float | None]:
+    """Transfers in the retry queue of a bank and seconds the oldest has waited."""
+    pipe = redis_clients.client().pipeline()
+    pipe.zcard(queue_key(RETRY, reg_number))
+    pipe.zrange(_waiting_since_key(reg_number), 0, 0, withscores=True)
+    depth, oldest = pipe.execute()
+    return depth, time.time() - oldest[0][1] if oldest else None
@@ -0,0 +1,36 @@
+"""Clients for the django-rq Redis, shared by everything that keeps state in it."""
+
+import asyncio
+from functools import cache
+from weakref import WeakKeyDictionary
+
+import django_rq
+from django.conf import settings
+from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
+
+_async_clients: WeakKeyDictionary[
+    asyncio.AbstractEventLoop, AsyncRedis
+] = WeakKeyDictionary()
+
+
+@cache
+def client() -> Redis:
+    """Client for sync code."""
+    # django_rq builds a new client and connection pool on every call
+    return django_rq.get_connection("default")
+
+
+def async_client() -> AsyncRedis:
+    """Client for async code running on the current event loop."""
+    # Async clients are bound to the event loop they were created on
+    loop = asyncio.get_running_loop()
+    if loop not in _async_clients:
+        queue = settings.RQ_QUEUES["default"]
+        _async_clients[loop] = AsyncRedis(
+            host=queue["HOST"],
+            port=queue["PORT"],
+            db=queue["DB"],
+            password=queue.get("PASSWORD"),
+        )
+    return _async_clients[loop]
@@ -0,0 +1,120 @@
+"""
+Roles of users, the names of their groups, cached in-process across
+requests. A version counter in the django-rq Redis is bumped whenever group
+membership changes, which drops the cached roles in every process at once.
+"""
+
+import threading
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from redis.exceptions import RedisError
+
+from best_bank_as import constants, metrics, redis_clients
+
+VERSION_KEY = "roles:version"
+
+_lock = threading.Lock()
+_roles: dict[int, tuple[int, frozenset[str]]] = {}
+
+
+def _cached(user_id: int, version: int | None) -> frozenset[str] | None:
+    with _lock:
+        cached = _roles.get(user_id)
+    if version is not None and cached is not None and cached[0] == version:
+        metrics.incr("roles.hits")
+        return cached[1]
+    metrics.incr("roles.misses")
+    return None
+
+
+def _remember(user_id: int, version: int | None, roles: frozenset[str]) -> None:
+    if version is None:
+        return
+    with _lock:
+        if len(_roles) >= constants.ROLE_CACHE_MAX_USERS:
+            _roles.clear()
+        _roles[user_id] = (version, roles)
+
+
+def _query(user_id: int) -> object:
+    return Group.objects.filter(custom_user=user_id).values_list("name", flat=True)
+
+
+def _version() -> int | None:
+    try:
+        return int(redis_clients.client().get(VERSION_KEY) or 0)
+    except RedisError:
+        # Without a version nothing can be trusted, so always read the database
+        metrics.incr("roles.errors")
+        return None
+
+
+async def _aversion() -> int | None:
+    try:
+        return int(await redis_clients.async_client().get(VERSION_KEY) or 0)
+    except RedisError:
+        metrics.incr("roles.errors")
+        return None
+
+
+def resolve(user_id: int) -> frozenset[str]:
+    """Names of the groups of a user."""
+    version = _version()
+    roles = _cached(user_id, version)
+    if roles is None:
+        roles = frozenset(_query(user_id))
+        _remember(user_id, version, roles)
+    return roles
+
+
+async def aresolve(user_id: int) -> frozenset[str]:
+    """Async version of `resolve`."""
+    version = await _aversion()
+    roles = _cached(user_id, version)
+    if roles is None:
+        roles = frozenset([name async for name in _query(user_id)])
+        _remember(user_id, version, roles)
+    return roles
+
+
+def clear() -> None:
+    """Drop the roles cached in this process."""
+    with _lock:
+        _roles.clear()
+
+
+def invalidate() -> None:
+    """Bump the version, so every process reloads the roles it cached."""
+    try:
+        redis_clients.client().incr(VERSION_KEY)
+    except RedisError:
+        metrics.incr("roles.errors")
+
+
+def invalidate_on_commit() -> None:
+    """
+    Invalidate now and again once the current transaction commits. Roles
+    read by other processes before the commit see the old groups, and are
+    dropped by the second bump.
+    """
+    invalidate()
+    transaction.on_commit(invalidate)
+
+
+def _membership_changed(action: str, **kwargs: object) -> None:
+    if action in ("post_add", "post_remove", "post_clear"):
+        invalidate_on_commit()
+
+
+def _group_changed(**kwargs: object) -> None:
+    invalidate_on_commit()
+
+
+def connect_signals() -> None:
+    """Invalidate cached roles whenever groups or memberships change."""
+    m2m_changed.connect(_membership_changed, sender=get_user_model().groups.through)
+    post_save.connect(_group_changed, sender=Group)
+    post_delete.connect(_group_changed, sender=Group)
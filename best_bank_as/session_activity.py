@@ -0,0 +1,34 @@
+"""
+Latest activity of sessions, kept in the django-rq Redis on every request.
+
+The session itself only saves `last_activity` once per
+`SESSION_ACTIVITY_GRANULARITY_SECONDS`, so it can lag the latest request by
+that much. Expiry is measured from the later of the two.
+"""
+
+from best_bank_as import constants, redis_clients
+
+
+def redis_key(session_key: str) -> str:
+    """Key holding the latest activity of a session."""
+    return f"session-activity:{session_key}"
+
+
+def record(session_key: str, activity: str) -> bytes | None:
+    """Record the activity of a request, returns the previous one."""
+    return redis_clients.client().set(
+        redis_key(session_key),
+        activity,
+        ex=constants.SESSION_TIMEOUT_SECONDS,
+        get=True,
+    )
+
+
+async def arecord(session_key: str, activity: str) -> bytes | None:
+    """Async version of `record`."""
+    return await redis_clients.async_client().set(
+        redis_key(session_key),
+        activity,
+        ex=constants.SESSION_TIMEOUT_SECONDS,
+        get=True,
+    )
@@ -0,0 +1,233 @@
+"""
+A local stand-in for a remote bank, for the tests and the interbank benchmarks.
+
+It speaks the login, signed and batched external transfer protocols from a
+thread of the calling process and counts what it was sent.
+"""
+
+import hmac
+import json
+import secrets
+import threading
+import time
+from http.cookies import SimpleCookie
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+from urllib.parse import parse_qs
+
+from best_bank_as import (
+    circuit_breaker,
+    interbank,
+    interbank_batches,
+    interbank_signing,
+    job_queues,
+    outgoing_transfers,
+    redis_clients,
+)
+from best_bank_as.db_models.bank import Bank
+
+STAND_IN_REG_NUMBER = "0999"
+# Batched transfers to this account are rejected by the stand-in bank
+REJECTING_ACCOUNT = 0
+
+
+class StandInBankHandler(BaseHTTPRequestHandler):
+    """Speaks the login and external transfer protocol of a remote bank."""
+
+    protocol_version = "HTTP/1.1"
+    server: "StandInBank"
+
+    def log_message(self, *args: Any) -> None:
+        pass
+
+    def cookies(self) -> dict[str, str]:
+        cookie = SimpleCookie(self.headers.get("Cookie", ""))
+        return {name: morsel.value for name, morsel in cookie.items()}
+
+    def reply(self, status: int, headers: dict[str, str] | None = None) -> None:
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def reply_json(self, data: Any) -> None:
+        body = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def signed(self, body: bytes) -> bool:
+        """Check a request signed with the key shared with this bank."""
+        expected = interbank_signing.signature(
+            self.server.signing_key,
+            "POST",
+            self.path,
+            self.headers.get(interbank_signing.TIMESTAMP_HEADER, ""),
+            self.headers.get(interbank_signing.NONCE_HEADER, ""),
+            body,
+        )
+        return bool(self.server.signing_key) and hmac.compare_digest(
+            expected, self.headers[interbank_signing.SIGNATURE_HEADER]
+        )
+
+    def do_GET(self) -> None:
+        self.server.requests += 1
+        if self.path != interbank.LOGIN_PATH:
+            self.reply(404)
+            return
+        self.reply(200, {"Set-Cookie": f"csrftoken={secrets.token_hex(16)}; Path=/"})
+
+    def do_POST(self) -> None:
+        self.server.requests += 1
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        form = parse_qs(body.decode())
+        cookies = self.cookies()
+        csrf_token = cookies.get("csrftoken")
+        signed = interbank_signing.SIGNATURE_HEADER in self.headers
+        if signed and not self.signed(body):
+            self.reply(403)
+            return
+        if not signed and (
+            not csrf_token or self.headers.get("X-CSRFToken") != csrf_token
+        ):
+            self.reply(403)
+            return
+
+        if self.path == interbank.LOGIN_PATH:
+            session_id = secrets.token_hex(16)
+            self.server.sessions.add(session_id)
+            self.reply(
+                302, {"Location": "/", "Set-Cookie": f"sessionid={session_id}; Path=/"}
+            )
+        elif not signed and cookies.get("sessionid") not in self.server.sessions:
+            self.reply(302, {"Location": f"{interbank.LOGIN_PATH}?next=/"})
+        elif self.path == "/external-transfer/" and self.server.down:
+            self.server.refused += 1
+            self.reply(503)
+        elif self.path == "/external-transfer/" and self.server.busy:
+            self.server.refused += 1
+            self.reply(409)
+        elif self.path == "/external-transfer/":
+            with self.server.lock:
+                self.server.in_flight += 1
+                self.server.peak_in_flight = max(
+                    self.server.peak_in_flight, self.server.in_flight
+                )
+            time.sleep(self.server.delay)
+            with self.server.lock:
+                self.server.in_flight -= 1
+                self.server.transfers.append(form)
+            self.reply(200)
+        elif self.path == interbank_batches.BATCH_PATH:
+            self.server.batches += 1
+            results = []
+            for reference, destination_account, amount in interbank_batches.parse_batch(
+                body
+            ):
+                accepted = destination_account != REJECTING_ACCOUNT
+                if accepted:
+                    self.server.transfers.append(
+                        {
+                            "destination_account": [str(destination_account)],
+                            "amount": [str(amount)],
+                        }
+                    )
+                results.append(
+                    {
+                        "reference": reference,
+                        "status": (
+                            interbank_batches.PROCESSED
+                            if accepted
+                            else interbank_batches.REJECTED
+                        ),
+                        "error": None if accepted else "Account does not exist.",
+                    }
+                )
+            self.reply_json({"results": results})
+        else:
+            self.reply(404)
+
+
+class StandInBank(ThreadingHTTPServer):
+    """A local bank to send external transfers to, serving from a thread."""
+
+    daemon_threads = True
+
+    def __init__(self, delay: float = 0, signing_key: str = "") -> None:
+        super().__init__(("127.0.0.1", 0), StandInBankHandler)
+        # Seconds each single transfer takes, to stand in for a slow bank
+        self.delay = delay
+        # Shared with this bank when set, signed requests need no login
+        self.signing_key = signing_key
+        # While down, single transfers are answered with 503
+        self.down = False
+        # While busy, they are answered with 409 as if already in flight
+        self.busy = False
+        self.refused = 0
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.requests = 0
+        self.connections = 0
+        self.batches = 0
+        self.sessions: set[str] = set()
+        self.transfers: list[dict[str, list[str]]] = []
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def process_request(self, request: Any, client_address: Any) -> None:
+        self.connections += 1
+        super().process_request(request, client_address)
+
+    @property
+    def url(self) -> str:
+        """Base URL of the bank."""
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def register(self) -> Bank:
+        """Point the stand-in registration number at this server."""
+        bank, _ = Bank.objects.update_or_create(
+            reg_number=STAND_IN_REG_NUMBER,
+            defaults={
+                "bank_name": "Stand-in bank",
+                "branch_name": "Local",
+                "url": self.url,
+                "signing_key": self.signing_key,
+            },
+        )
+        return bank
+
+    def expire_sessions(self) -> None:
+        """Forget every login, as if the sessions timed out."""
+        self.sessions.clear()
+
+    def stop(self) -> None:
+        """Stop serving, close the socket and forget the queues of the bank."""
+        self.shutdown()
+        self.server_close()
+
+        circuit_breaker.record_success(STAND_IN_REG_NUMBER)
+        redis = redis_clients.client()
+        retries = outgoing_transfers.queue_key(
+            outgoing_transfers.RETRY, STAND_IN_REG_NUMBER
+        )
+        redis.delete(
+            retries,
+            f"{retries}:since",
+            *[
+                key(sender, STAND_IN_REG_NUMBER)
+                for sender in (outgoing_transfers.BATCH, outgoing_transfers.DISPATCH)
+                for key in (
+                    outgoing_transfers.queue_key,
+                    outgoing_transfers.processing_key,
+                )
+            ],
+        )
+        registry = job_queues.for_bank(STAND_IN_REG_NUMBER).scheduled_job_registry
+        for job_id in registry.get_job_ids():
+            if job_id.startswith(f"interbank-retry-{STAND_IN_REG_NUMBER}-"):
+                registry.remove(job_id, delete_job=True)
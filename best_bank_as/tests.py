@@ -1,21 +1,87 @@
+import asyncio
+import json
+import os
+import time
+import tracemalloc
 import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 from decimal import Decimal
+from typing import Any
+from unittest import mock
 
+import django_rq
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib.auth.models import Group
+from django.core.cache import caches
 from django.core.management import call_command
-from django.test import Client, TestCase
+from django.db import connection
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import localdate, now
+from redis.exceptions import RedisError
+from rq import Queue
 
+from best_bank_as import (
+    bank_registry,
+    circuit_breaker,
+    constants,
+    idempotency,
+    interbank,
+    interbank_signing,
+    job_queues,
+    metrics,
+    outgoing_transfers,
+    redis_clients,
+    roles,
+    session_activity,
+)
 from best_bank_as.db_models.account import Account
+from best_bank_as.db_models.account_balance import AccountBalance
+from best_bank_as.db_models.bank import Bank
 from best_bank_as.db_models.customer import Customer
-from best_bank_as.db_models.ledger import Ledger
+from best_bank_as.db_models.ledger import Ledger, TransferInstruction
 from best_bank_as.db_models.loan_application import LoanApplication
-from best_bank_as.enums import AccountStatus, AccountType, CustomerRank
+from best_bank_as.db_models.outbox_transfer import OutboxTransfer
+from best_bank_as.enums import (
+    AccountStatus,
+    AccountType,
+    CustomerRank,
+    TransactionStatus,
+)
+from best_bank_as.forms.external_transfer_form import ExternalTransferForm
+from best_bank_as.ledger_partitions import create_partition, partition_name
+from best_bank_as.management.commands.checkpoint_balances import checkpoint_accounts
+from best_bank_as.management.commands.dispatch_external_transfers import dispatch
 from best_bank_as.models import CustomUser
+from best_bank_as.stand_in_bank import (
+    REJECTING_ACCOUNT,
+    STAND_IN_REG_NUMBER,
+    StandInBank,
+)
+from best_bank_as.workers import PreloadedWorker
+
+
+def flush_redis() -> None:
+    """
+    Empty the Redis databases of the test runner, see RQ_REDIS_DB in the
+    settings, and drop the roles cached against the version kept there.
+    """
+    if not settings.TESTING:
+        raise RuntimeError("Only the test runner's Redis databases are flushed.")
+    redis_clients.client().flushdb()
+    caches[settings.SESSION_CACHE_ALIAS].clear()
+    roles.clear()
 
 
 class CustomerTestCase(TestCase):
     """Test case for customer model."""
 
+    def setUp(self) -> None:
+        flush_redis()
+        self.addCleanup(flush_redis)
+
     @classmethod
     def setUpTestData(cls) -> None:
         call_command("provision")
@@ -123,3 +189,1014 @@ class CustomerTestCase(TestCase):
         )
 
         assert response.status_code == 200
+
+    def test_idempotency_key_replays_completed_transfer(self) -> None:
+        """Retries should get the first response without transferring again."""
+        self.client.force_login(self.user)
+        headers = {"host": "localhost", "Idempotency-Key": str(uuid.uuid4())}
+        data = {
+            "source_account": self.account1.pk,
+            "destination_account": self.account2.pk,
+            "registration_number": os.environ["BANK_REGISTRATION_NUMBER"],
+            "amount": 100,
+        }
+        metrics.reset()
+
+        first = self.client.post("/transfer/", data, headers=headers)
+        retry = self.client.post("/transfer/", data, headers=headers)
+        self.assertEqual(retry.status_code, first.status_code)
+        self.assertEqual(retry["HX-Redirect"], first["HX-Redirect"])
+        self.assertEqual(self.account2.get_balance(), 100)
+
+        key = idempotency.redis_key(self.user.pk, "/transfer/", "in-flight")
+        redis_clients.client().set(key, idempotency.IN_FLIGHT, ex=60)
+        self.addCleanup(redis_clients.client().delete, key)
+        response = self.client.post(
+            "/transfer/", data, headers={**headers, "Idempotency-Key": "in-flight"}
+        )
+        self.assertEqual(response.status_code, 409)
+
+        counters = metrics.snapshot()
+        self.assertEqual(counters["idempotency.claimed"], 1)
+        self.assertEqual(counters["idempotency.duplicates"], 1)
+        self.assertEqual(counters["idempotency.in_flight_conflicts"], 1)
+
+    def test_transfer_over_balance_is_a_form_error(self) -> None:
+        """A transfer the ledger refuses should be shown on the form."""
+        self.client.force_login(self.user)
+
+        for registration_number in (os.environ["BANK_REGISTRATION_NUMBER"], "6666"):
+            response = self.client.post(
+                "/transfer/",
+                {
+                    "source_account": self.account1.pk,
+                    "destination_account": self.account2.pk,
+                    "registration_number": registration_number,
+                    "amount": 5000,
+                },
+                headers={"host": "localhost", "Idempotency-Key": str(uuid.uuid4())},
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(
+                response.context["form"].errors["amount"],
+                ["Amount cannot be less than balance"],
+            )
+        self.assertEqual(self.account1.get_balance(), 1000)
+
+    def test_internal_account_pages_are_not_found(self) -> None:
+        """Accounts without a customer should not have transaction pages."""
+        self.client.force_login(self.employee_user)
+        internal_account = Account.objects.get(account_type=AccountType.INTERNAL)
+
+        for page in ("transactions", "statement"):
+            response = self.client.get(
+                f"/accounts/{internal_account.pk}/{page}/",
+                headers={"host": "localhost"},
+            )
+            self.assertEqual(response.status_code, 404)
+
+    def test_session_activity_is_throttled(self) -> None:
+        """last_activity should be saved once per granularity and still expire."""
+        self.client.force_login(self.user)
+        headers = {"host": "localhost"}
+
+        def set_last_activity(seconds_ago: int) -> None:
+            session = self.client.session
+            session["last_activity"] = (
+                datetime.now() - timedelta(seconds=seconds_ago)
+            ).strftime(constants.DATETIME_FORMAT)
+            session.save()
+
+        # Sessions without a last_activity are not tracked
+        self.client.get("/", headers=headers)
+        self.assertNotIn("last_activity", self.client.session)
+
+        set_last_activity(0)
+        last_activity = self.client.session["last_activity"]
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get("/", headers=headers)
+        self.assertFalse([q for q in queries if "django_session" in q["sql"]])
+        self.assertEqual(self.client.session["last_activity"], last_activity)
+
+        # The request above is later than the saved activity, it still counts
+        set_last_activity(constants.SESSION_TIMEOUT_SECONDS + 1)
+        last_activity = self.client.session["last_activity"]
+        self.client.get("/", headers=headers)
+        self.assertIn("_auth_user_id", self.client.session)
+        self.assertNotEqual(self.client.session["last_activity"], last_activity)
+
+        set_last_activity(constants.SESSION_TIMEOUT_SECONDS + 1)
+        redis_clients.client().delete(
+            session_activity.redis_key(self.client.session.session_key)
+        )
+        self.client.get("/", headers=headers)
+        self.assertNotIn("_auth_user_id", self.client.session)
+
+    def test_session_expires_while_redis_is_unavailable(self) -> None:
+        """Without Redis, expiry should be measured from the session alone."""
+        self.client.force_login(self.user)
+        headers = {"host": "localhost"}
+
+        def set_last_activity(seconds_ago: int) -> str:
+            session = self.client.session
+            session["last_activity"] = (
+                datetime.now() - timedelta(seconds=seconds_ago)
+            ).strftime(constants.DATETIME_FORMAT)
+            session.save()
+            return session["last_activity"]
+
+        with mock.patch.object(
+            session_activity, "record", side_effect=RedisError("down")
+        ):
+            # A live session saves every activity
+            last_activity = set_last_activity(1)
+            self.client.get("/", headers=headers)
+            self.assertIn("_auth_user_id", self.client.session)
+            self.assertNotEqual(self.client.session["last_activity"], last_activity)
+
+            set_last_activity(constants.SESSION_TIMEOUT_SECONDS + 1)
+            self.client.get("/", headers=headers)
+            self.assertNotIn("_auth_user_id", self.client.session)
+
+    def test_roles_are_resolved_once(self) -> None:
+        """Role checks should not query once a user's groups are cached."""
+        self.assertTrue(CustomUser.objects.get(pk=self.employee_user.pk).is_employee)
+
+        with self.assertNumQueries(0):
+            user = CustomUser(pk=self.employee_user.pk)
+            self.assertTrue(user.is_employee)
+            self.assertFalse(user.is_supervisor)
+            self.assertFalse(user.is_customer)
+
+        self.employee_user.groups.add(Group.objects.get(name="supervisor"))
+        self.assertTrue(CustomUser(pk=self.employee_user.pk).is_supervisor)
+
+    def test_banks_are_loaded_once(self) -> None:
+        """Bank lookups and form validation should not query once banks are loaded."""
+        bank_registry.get("6666")
+
+        with self.assertNumQueries(0):
+            self.assertEqual(bank_registry.get("6666").bank_name, "Malthe Bank")
+            with self.assertRaises(Bank.DoesNotExist):
+                bank_registry.get("0000")
+            form = ExternalTransferForm(
+                data={
+                    "destination_account": 1,
+                    "amount": 1,
+                    "registration_number": "0000",
+                }
+            )
+            self.assertIn("registration_number", form.errors)
+
+        Bank.objects.create(reg_number="0998", bank_name="New bank", url="")
+        self.assertEqual(bank_registry.get("0998").bank_name, "New bank")
+
+        # A change in another process arrives as a message
+        bank_registry.get("6666")
+        misses = metrics.snapshot().get("banks.misses", 0)
+        redis_clients.client().publish(bank_registry.CHANNEL, "changed")
+        deadline = time.monotonic() + 5
+        while metrics.snapshot().get("banks.misses", 0) == misses:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+            bank_registry.get("6666")
+
+    def test_interbank_sessions_are_reused(self) -> None:
+        """External transfers should log in once and again only when rejected."""
+        bank = StandInBank()
+        self.addCleanup(bank.stop)
+        self.addCleanup(interbank.close)
+        bank.register()
+
+        def transfer() -> int:
+            requests = bank.requests
+            Ledger.initiate_external_transfer(
+                source_account=self.account1,
+                destination_reg_no=STAND_IN_REG_NUMBER,
+                destination_account=Account.objects.get(pk=self.account2.pk),
+                amount=Decimal(10),
+            )
+            return bank.requests - requests
+
+        self.assertEqual(transfer(), 3)
+        self.assertEqual(transfer(), 1)
+        bank.expire_sessions()
+        self.assertEqual(transfer(), 4)
+        self.assertEqual(len(bank.transfers), 3)
+        self.assertEqual(self.account1.get_balance(), 970)
+
+    @override_settings(INTERBANK_SENDER="jobs")
+    def test_external_transfer_jobs_carry_ids(self) -> None:
+        """Transfer jobs should hold primitive values and load the accounts."""
+        bank = StandInBank()
+        self.addCleanup(bank.stop)
+        self.addCleanup(interbank.close)
+        bank.register()
+
+        Ledger.enqueue_external_transfer(
+            source_account=self.account1,
+            registration_number=STAND_IN_REG_NUMBER,
+            destination_account=self.account2,
+            amount=Decimal(10),
+        )
+        # Ahead of the retries and batches of the bank
+        queue = job_queues.for_bank(STAND_IN_REG_NUMBER)
+        job = queue.fetch_job(queue.get_job_ids()[0])
+        job.delete()
+
+        self.assertEqual(job.func, Ledger.initiate_external_transfer_job)
+        self.assertTrue(all(isinstance(arg, int | str) for arg in job.args), job.args)
+        job.func(*job.args)
+        self.assertEqual(
+            bank.transfers[0]["destination_account"], [str(self.account2.pk)]
+        )
+        self.assertEqual(self.account1.get_balance(), 990)
+
+    def test_failing_bank_opens_breaker_and_parks_transfers(self) -> None:
+        """Transfers to a failing bank should wait in the retry queue, not fail."""
+        bank = StandInBank()
+        self.addCleanup(bank.stop)
+        self.addCleanup(interbank.close)
+        bank.register()
+        bank.down = True
+
+        for _ in range(constants.INTERBANK_BREAKER_FAILURES + 1):
+            Ledger.initiate_external_transfer(
+                source_account=self.account1,
+                destination_reg_no=STAND_IN_REG_NUMBER,
+                destination_account=Account.objects.get(pk=self.account2.pk),
+                amount=Decimal(10),
+            )
+
+        # The open breaker kept the last transfer from being sent
+        self.assertEqual(bank.refused, constants.INTERBANK_BREAKER_FAILURES)
+        self.client.force_login(self.employee_user)
+        response = self.client.get(
+            "/staff/metrics/interbank/", headers={"host": "localhost"}
+        )
+        stats = response.json()[STAND_IN_REG_NUMBER]
+        self.assertEqual(stats["breaker"], circuit_breaker.OPEN)
+        self.assertEqual(stats["retry_queue_depth"], 6)
+        self.assertGreaterEqual(stats["oldest_pending_seconds"], 0)
+        self.assertEqual(self.account1.get_balance(), 940)
+
+        # The bank recovers and the parked transfers come due
+        bank.down = False
+        circuit_breaker.record_success(STAND_IN_REG_NUMBER)
+        retries = outgoing_transfers.queue_key(
+            outgoing_transfers.RETRY, STAND_IN_REG_NUMBER
+        )
+        redis = redis_clients.client()
+        redis.zadd(retries, dict.fromkeys(redis.zrange(retries, 0, -1), 0))
+        Ledger.retry_external_transfers(STAND_IN_REG_NUMBER)
+
+        self.assertEqual(len(bank.transfers), 6)
+        self.assertEqual(outgoing_transfers.retry_stats(STAND_IN_REG_NUMBER), (0, None))
+        statuses = Ledger.objects.filter(account=self.account1, amount=-10).values_list(
+            "status", flat=True
+        )
+        self.assertEqual(list(statuses), [TransactionStatus.PROCESSED] * 6)
+
+    def test_transfer_in_flight_at_bank_is_parked(self) -> None:
+        """A 409 from the bank should park the transfer, not reject it."""
+        bank = StandInBank()
+        self.addCleanup(bank.stop)
+        self.addCleanup(interbank.close)
+        bank.register()
+        bank.busy = True
+
+        Ledger.initiate_external_transfer(
+            source_account=self.account1,
+            destination_reg_no=STAND_IN_REG_NUMBER,
+            destination_account=Account.objects.get(pk=self.account2.pk),
+            amount=Decimal(10),
+        )
+
+        self.assertEqual(bank.refused, 1)
+        self.assertEqual(outgoing_transfers.retry_stats(STAND_IN_REG_NUMBER)[0], 1)
+        self.assertEqual(
+            circuit_breaker.state(STAND_IN_REG_NUMBER), circuit_breaker.CLOSED
+        )
+        self.assertEqual(
+            Ledger.objects.get(account=self.account1, amount=-10).status,
+            TransactionStatus.PENDING,
+        )
+
+    def test_transfer_out_of_retries_is_rejected(self) -> None:
+        """A transfer that failed every attempt should release its funds."""
+        bank = StandInBank()
+        self.addCleanup(bank.stop)
+        self.addCleanup(interbank.close)
+        bank.register()
+        bank.down = True
+
+        transaction_id = Ledger.transfer_external(
+            self.account1, STAND_IN_REG_NUMBER, Account(pk=self.account2.pk), 10
+        )
+        Ledger.send_external_transfer(
+            STAND_IN_REG_NUMBER,
+            outgoing_transfers.OutgoingTransfer(
+                str(uuid.uuid4()),
+                self.account1.pk,
+                self.account2.pk,
+                Decimal(10),
+                transaction_id=transaction_id,
+                attempt=constants.INTERBANK_RETRY_ATTEMPTS,
+            ),
+        )
+
+        self.assertEqual(bank.refused, 1)
+        self.assertEqual(
+            Ledger.objects.get(account=self.account1, amount=-10).status,
+            TransactionStatus.REJECTED,
+        )
+        self.assertEqual(self.account1.get_balance(), 1000)
+
+    def test_external_transfer_batch_reports_each_transfer(self) -> None:
+        """A received batch should apply the valid transfers and reject the rest."""
+        self.client.force_login(self.user)
+        references = [str(uuid.uuid4()) for _ in range(3)]
+        batch = [
+            {"reference": references[0], "destination_account": self.account2.pk},
+            {"reference": references[1], "destination_account": 0},
+            {"reference": references[2], "destination_account": self.account2.pk},
+        ]
+        for transfer, amount in zip(batch, ["5", "5", "-1"], strict=True):
+            transfer["amount"] = amount
+
+        def post(path: str, data: Any) -> Any:
+            return self.client.post(
+                path,
+                data,
+                content_type="application/json",
+                headers={"host": "localhost", "Idempotency-Key": str(uuid.uuid4())},
+            )
+
+        response = post("/external-transfer/batch/", {"transfers": batch})
+        statuses = [result["status"] for result in response.json()["results"]]
+        self.assertEqual(statuses, ["processed", "rejected", "rejected"])
+        self.assertEqual(self.account2.get_balance(), 5)
+
+        # Sent again in a new batch or on its own, a transfer is not applied again
+        response = post("/external-transfer/batch/", {"transfers": batch[:1]})
+        self.assertEqual(response.json()["results"][0]["status"], "processed")
+        response = self.client.post(
+            "/external-transfer/",
+            {"destination_account": self.account2.pk, "amount": "5"},
+            headers={"host": "localhost", "Idempotency-Key": references[0]},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.account2.get_balance(), 5)
+
+    def test_signed_batch_needs_no_session(self) -> None:
+        """A batch signed by a peer bank should run once, without a login."""
+        Bank.objects.create(
+            reg_number="0998",
+            bank_name="Peer bank",
+            branch_name="Local",
+            url="http://localhost",
+            signing_key="shared-secret",
+        )
+        client = Client(enforce_csrf_checks=True)
+        body = json.dumps(
+            {
+                "transfers": [
+                    {
+                        "reference": str(uuid.uuid4()),
+                        "destination_account": self.account2.pk,
+                        "amount": "5",
+                    }
+                ]
+            }
+        ).encode()
+
+        nonce = str(uuid.uuid4())
+
+        def post(key: str, **headers: str) -> int:
+            with mock.patch.dict(os.environ, {"BANK_REGISTRATION_NUMBER": "0998"}):
+                signed = interbank_signing.sign(
+                    key, "POST", "/external-transfer/batch/", nonce, body
+                )
+            response = client.post(
+                "/external-transfer/batch/",
+                body,
+                content_type="application/json",
+                headers={"host": "localhost", **signed, **headers},
+            )
+            return response.status_code
+
+        self.assertEqual(post("wrong-secret"), 403)
+        stale = str(
+            int(time.time()) - constants.INTERBANK_SIGNATURE_MAX_AGE_SECONDS - 1
+        )
+        self.assertEqual(
+            post("shared-secret", **{interbank_signing.TIMESTAMP_HEADER: stale}), 403
+        )
+        self.assertEqual(post("shared-secret"), 200)
+        # A replayed nonce gets the stored answer
+        self.assertEqual(post("shared-secret"), 200)
+        self.assertEqual(self.account2.get_balance(), 5)
+        self.assertNotIn("sessionid", client.cookies)
+
+    def test_signed_transfers_skip_login(self) -> None:
+        """External transfers to a bank with a signing key should not log in."""
+        bank = StandInBank(signing_key="shared-secret")
+        self.addCleanup(bank.stop)
+        self.addCleanup(interbank.close)
+        bank.register()
+
+        for _ in range(2):
+            Ledger.initiate_external_transfer(
+                source_account=self.account1,
+                destination_reg_no=STAND_IN_REG_NUMBER,
+                destination_account=Account.objects.get(pk=self.account2.pk),
+                amount=Decimal(10),
+            )
+        self.assertEqual(bank.requests, 2)
+        self.assertEqual(bank.sessions, set())
+        self.assertEqual(self.account1.get_balance(), 980)
+
+    def test_external_transfers_are_sent_in_batches(self) -> None:
+        """Queued transfers for one bank should be sent in a single request."""
+        bank = StandInBank()
+        self.addCleanup(bank.stop)
+        self.addCleanup(interbank.close)
+        bank.register()
+
+        for destination_account in (7, REJECTING_ACCOUNT, 8):
+            outgoing_transfers.push(
+                outgoing_transfers.BATCH,
+                STAND_IN_REG_NUMBER,
+                outgoing_transfers.OutgoingTransfer(
+                    str(uuid.uuid4()),
+                    self.account1.pk,
+                    destination_account,
+                    Decimal(10),
+                ),
+            )
+        # A sender claimed the first one and died before booking it
+        outgoing_transfers.claim(outgoing_transfers.BATCH, STAND_IN_REG_NUMBER, 1)
+        with mock.patch.object(constants, "INTERBANK_QUEUE_CLAIM_SECONDS", -1):
+            Ledger.send_external_batches(STAND_IN_REG_NUMBER)
+
+        self.assertEqual(bank.batches, 1)
+        self.assertEqual(len(bank.transfers), 2)
+        statuses = Ledger.objects.filter(account=self.account1, amount=-10).values_list(
+            "status", flat=True
+        )
+        self.assertEqual(
+            sorted(statuses),
+            [TransactionStatus.PROCESSED] * 2 + [TransactionStatus.REJECTED],
+        )
+        self.assertEqual(self.account1.get_balance(), 980)
+        self.assertFalse(
+            redis_clients.client().exists(
+                outgoing_transfers.processing_key(
+                    outgoing_transfers.BATCH, STAND_IN_REG_NUMBER
+                )
+            )
+        )
+
+    def test_account_list_query_count_is_constant(self) -> None:
+        """Listing accounts should not run a query per account."""
+        self.client.force_login(self.user)
+        # The first request caches the roles of the user
+        self.client.get("/", headers={"host": "localhost"})
+
+        for _ in range(2):
+            with self.assertNumQueries(3):
+                response = self.client.get("/accounts/", headers={"host": "localhost"})
+            Account.objects.bulk_create(
+                Account(customer=self.customer, account_status=AccountStatus.ACTIVE)
+                for _ in range(10)
+            )
+
+        accounts = {account.pk: account for account in response.context["accounts"]}
+        self.assertEqual(accounts[self.account1.pk].booked, 1000)
+        self.assertEqual(
+            accounts[self.account1.pk].available, self.account1.get_balance()
+        )
+
+    async def test_async_account_pages(self) -> None:
+        """Account pages should be served by the async views."""
+        client = self.async_client
+        await sync_to_async(client.force_login)(self.user)
+
+        response = await client.get(f"/accounts/{self.account1.pk}/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["balance"], 1000)
+        self.assertEqual(len(response.context["transactions"]), 1)
+
+        response = await client.get("/accounts/")
+        self.assertEqual(len(response.context["accounts"]), 2)
+
+        other = (
+            await Account.objects.exclude(customer=self.customer)
+            .filter(customer__isnull=False)
+            .afirst()
+        )
+        response = await client.get(f"/accounts/{other.pk}/")
+        self.assertEqual(response.status_code, 403)
+
+        await sync_to_async(client.force_login)(self.employee_user)
+        response = await client.get("/staff/customers", {"query": "testuser"})
+        customers = response.context["customers"]
+        self.assertEqual(len(customers[0].account_set.all()), 2)
+
+    @override_settings(BALANCE_CACHE_ENABLED=True)
+    def test_balance_cache_follows_ledger_writes(self) -> None:
+        """Cached balances should be replaced when a transfer commits."""
+        redis = django_rq.get_connection("default")
+        keys = [
+            f"balance:{account.pk}{suffix}"
+            for account in (self.account1, self.account2)
+            for suffix in ("", ":version")
+        ]
+        redis.delete(*keys)
+        self.addCleanup(redis.delete, *keys)
+        metrics.reset()
+
+        self.assertEqual(self.account1.get_balance(), 1000)
+        with self.captureOnCommitCallbacks(execute=True):
+            Ledger.transfer(self.account1, self.account2, Decimal(100))
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.account1.get_balance(), 900)
+            self.assertEqual(self.account2.get_balance(), 100)
+        counters = metrics.snapshot()
+        self.assertEqual(counters["balance_cache.misses"], 1)
+        self.assertEqual(counters["balance_cache.hits"], 2)
+
+    @override_settings(TRANSFER_SINGLE_STATEMENT=True)
+    def test_single_statement_transfer(self) -> None:
+        """The single statement path should write the same as the locked one."""
+        new_account = Account.objects.create(account_status=AccountStatus.ACTIVE)
+
+        with self.assertNumQueries(1):
+            Ledger.transfer(self.account1, new_account, Decimal(100))
+        with self.assertRaises(ValueError):
+            Ledger.transfer(self.account1, self.account2, Decimal(901))
+
+        self.assertEqual(self.account1.get_balance(), 900)
+        self.assertEqual(new_account.get_balance(), 100)
+        self.assertEqual(
+            new_account.get_transactions()[0]["counterpart_account_number"],
+            self.account1.pk,
+        )
+        call_command("check_balances")
+
+    def test_balance_follows_external_transfer_status(self) -> None:
+        """Pending external transfers count until they are rejected."""
+        transaction_id = Ledger.transfer_external(
+            self.account1, "6666", Account(), Decimal(100)
+        )
+        self.assertEqual(self.account1.get_balance(), 900)
+
+        Ledger.finalize_external_transfer(transaction_id, TransactionStatus.REJECTED)
+        self.assertEqual(self.account1.get_balance(), 1000)
+
+    def test_balances_match_ledger(self) -> None:
+        """The balance projection should agree with the ledger sum."""
+        transaction_id = Ledger.transfer_external(
+            self.account1, "6666", Account(), Decimal(50)
+        )
+        Ledger.set_status(transaction_id, TransactionStatus.PROCESSED)
+
+        call_command("check_balances")
+        for account_id, (booked, pending) in Ledger.balance_totals().items():
+            balance = AccountBalance.objects.get(account_id=account_id)
+            self.assertEqual((balance.booked, balance.pending), (booked, pending))
+
+    def test_balance_repair_checks_drift_under_lock(self) -> None:
+        """Drift seen before locking should not overwrite a correct balance."""
+        balance_totals = Ledger.balance_totals
+        stale = {self.account1.pk: (Decimal(900), Decimal(0))}
+
+        def first_read_stale(account_ids: list[int] | None = None) -> dict:
+            if account_ids is None:
+                return {**balance_totals(), **stale}
+            return balance_totals(account_ids)
+
+        with mock.patch.object(Ledger, "balance_totals", first_read_stale):
+            call_command("check_balances", repair=True)
+        self.assertEqual(self.account1.get_balance(), 1000)
+        call_command("check_balances")
+
+    def test_house_account_shards_keep_total_balance(self) -> None:
+        """Sharding the house account should spread but not change its funds."""
+        house_account = Account.objects.get(
+            account_type=AccountType.INTERNAL, parent=None
+        )
+        total = house_account.get_balance()
+
+        shards = house_account.rebalance_shards(3)
+        self.assertEqual(house_account.get_balance(), total)
+        listed = Account.objects.with_balances().get(pk=house_account.pk)
+        self.assertEqual(listed.available, total)
+        self.assertEqual(len({shard.get_balance() for shard in shards}), 1)
+        self.assertIn(house_account.pick_shard(Decimal(100)), shards)
+
+        house_account.rebalance_shards(1)
+        self.assertEqual(
+            house_account.balance_projection.available, house_account.get_balance()
+        )
+
+    def test_bulk_transfer_all_or_nothing(self) -> None:
+        """An invalid instruction should reject the whole batch."""
+        instructions = [
+            TransferInstruction(self.account1.pk, self.account2.pk, Decimal(600)),
+            TransferInstruction(self.account1.pk, self.account2.pk, Decimal(600)),
+        ]
+
+        with self.assertRaises(ValueError):
+            Ledger.bulk_transfer(instructions)
+        self.assertEqual(self.account1.get_balance(), 1000)
+
+        results = Ledger.bulk_transfer(instructions, all_or_nothing=False)
+        self.assertEqual([result.ok for result in results], [True, False])
+        self.assertEqual(self.account1.get_balance(), 400)
+        self.assertEqual(self.account2.get_balance(), 600)
+        call_command("check_balances")
+
+    def test_transaction_pages_cover_history(self) -> None:
+        """Paging through the history should return every entry exactly once."""
+        Ledger.bulk_transfer(
+            [
+                TransferInstruction(self.account1.pk, self.account2.pk, Decimal(1))
+                for _ in range(30)
+            ]
+        )
+
+        seen, cursor = [], None
+        while True:
+            page, cursor = self.account1.get_transaction_page(cursor, limit=7)
+            seen += page
+            if cursor is None:
+                break
+
+        self.assertEqual(len(seen), 31)
+        self.assertEqual(len({entry["id"] for entry in seen}), 31)
+        self.assertEqual(seen[0]["counterpart_account_number"], self.account2.pk)
+        self.assertEqual(
+            sorted(entry["transaction_id"] for entry in seen),
+            [entry["transaction_id"] for entry in self.account1.get_transactions()],
+        )
+
+    def test_history_between_dates_prunes_partitions(self) -> None:
+        """Date-bounded history should only read the partitions of those dates."""
+        today = localdate()
+        last_month = today.replace(day=1) - timedelta(days=1)
+        with connection.cursor() as cursor:
+            create_partition(cursor, last_month.replace(day=1))
+        Ledger.objects.filter(account=self.account1).update(
+            created_at=now() - timedelta(days=today.day)
+        )
+        Ledger.transfer(self.account1, self.account2, Decimal(1))
+
+        page, _ = self.account1.get_transaction_page(start=today, end=today)
+        self.assertEqual([entry["amount"] for entry in page], [Decimal(-1)])
+
+        plan = (
+            Ledger.objects.filter(account=self.account1)
+            .between(today, today)
+            .explain(format="json")
+        )
+        self.assertIn(partition_name(today), plan)
+        self.assertNotIn(partition_name(last_month), plan)
+
+    def test_archive_keeps_balances_and_transactions(self) -> None:
+        """Archiving old entries should not change what an account reports."""
+        Ledger.transfer(self.account1, self.account2, Decimal(100))
+        Ledger.transfer_external(self.account1, "6666", Account(), Decimal(50))
+        transactions = self.account1.get_transactions()
+        balance = self.account1.get_balance()
+
+        archived = Ledger.archive([self.account1.pk], now())
+        self.assertEqual(archived, 2)
+        self.assertEqual(Ledger.archive([self.account1.pk], now()), 0)
+
+        # Only the opening balance and the pending transfer stay in the ledger
+        self.assertEqual(Ledger.objects.filter(account=self.account1).count(), 2)
+        self.assertEqual(self.account1.get_transactions(), transactions)
+        self.assertEqual(self.account1.get_balance(), balance)
+        self.assertEqual(self.account1.get_balance(localdate()), balance)
+        call_command("check_balances")
+
+    async def test_statement_export_streams_in_constant_memory(self) -> None:
+        """Exporting a large account should not hold the history in memory."""
+        rows = 30_000
+        await Ledger.objects.abulk_create(
+            Ledger(account=self.account2, amount=Decimal(1)) for _ in range(rows)
+        )
+        client = self.async_client
+        await sync_to_async(client.force_login)(self.employee_user)
+
+        response = await client.get(
+            f"/accounts/{self.account2.pk}/statement/?format=ndjson"
+        )
+        self.assertEqual(response.status_code, 200)
+        # A sync iterator would be collected into a list by the ASGI handler
+        self.assertTrue(response.is_async)
+
+        exported_bytes, exported_rows = 0, 0
+        tracemalloc.start()
+        async for chunk in response.streaming_content:
+            exported_bytes += len(chunk)
+            exported_rows += chunk.count(b"\n")
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        # The export is bigger than the cap, so it cannot have been buffered
+        memory_cap = 2 * 1024 * 1024
+        self.assertEqual(exported_rows, rows)
+        self.assertGreater(exported_bytes, memory_cap)
+        self.assertLess(peak, memory_cap)
+
+    def test_balance_as_of_reads_checkpoints(self) -> None:
+        """Past balances should match the ledger with and without checkpoints."""
+        Ledger.objects.update(created_at=now() - timedelta(days=3))
+        Ledger.transfer(self.account1, self.account2, Decimal(100))
+        Ledger.objects.filter(created_at__date=localdate()).update(
+            created_at=now() - timedelta(days=2)
+        )
+        transaction_id = Ledger.transfer_external(
+            self.account1, "6666", Account(), Decimal(50)
+        )
+        Ledger.objects.filter(transaction_id=transaction_id).update(
+            created_at=now() - timedelta(days=1)
+        )
+
+        days = [localdate() - timedelta(days=days) for days in (3, 2, 1)]
+        expected = [Decimal(1000), Decimal(900), Decimal(850)]
+        last_id = Account.objects.order_by("-pk").first().pk
+        for _ in range(2):
+            self.assertEqual([self.account1.get_balance(day) for day in days], expected)
+            checkpoint_accounts(1, last_id, days[-1])
+        self.assertEqual(checkpoint_accounts(1, last_id, days[-1]), 0)
+        self.assertEqual(self.account1.get_balance(localdate()), 850)
+
+        # Rejecting the transfer invalidates the checkpoints it contributed to
+        Ledger.set_status(transaction_id, TransactionStatus.REJECTED)
+        self.assertEqual(self.account1.get_balance(days[-1]), 900)
+        checkpoint_accounts(1, last_id, days[-1])
+        self.assertEqual(self.account1.get_balance(days[-1]), 900)
+
+
+class ConcurrentTransferTestCase(TransactionTestCase):
+    """Test case for transfers racing on the same account."""
+
+    reset_sequences = True
+
+    def setUp(self) -> None:
+        flush_redis()
+        self.addCleanup(flush_redis)
+        Bank.objects.create(
+            reg_number="6666",
+            bank_name="Malthe Bank",
+            branch_name="Malthe branch",
+            url="https://malthegram.dk",
+        )
+        self.source = Account.objects.create(account_status=AccountStatus.ACTIVE)
+        self.destination = Account.objects.create(account_status=AccountStatus.ACTIVE)
+        Ledger.post_entries(
+            [
+                Ledger(
+                    account=self.source,
+                    amount=Decimal(100),
+                    status=TransactionStatus.PROCESSED,
+                )
+            ]
+        )
+
+    def test_concurrent_transfers_cannot_overdraw(self) -> None:
+        """Racing transfers from one account should never overspend it."""
+
+        def transfer(_: int) -> bool:
+            try:
+                Ledger.transfer(self.source, self.destination, Decimal(20))
+                return True
+            except ValueError:
+                return False
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=10) as pool:
+            results = list(pool.map(transfer, range(10)))
+
+        self.assertEqual(results.count(True), 5)
+        self.assertEqual(self.source.get_balance(), 0)
+        self.assertEqual(self.destination.get_balance(), 100)
+        call_command("check_balances")
+
+    @override_settings(TRANSFER_SINGLE_STATEMENT=True)
+    def test_concurrent_single_statement_transfers_cannot_overdraw(self) -> None:
+        """The single statement path should lock the balances the same way."""
+        self.test_concurrent_transfers_cannot_overdraw()
+
+    def test_dispatcher_sends_transfers_concurrently(self) -> None:
+        """A slow bank should get several transfers in flight, each finalized."""
+        bank = StandInBank(delay=0.2)
+        self.addCleanup(bank.stop)
+        self.addCleanup(interbank.close)
+        bank.register()
+        # External transfers credit account 1, which is self.source here
+        source = Account.objects.create(account_status=AccountStatus.ACTIVE)
+        Ledger.transfer(self.source, source, Decimal(100))
+
+        for _ in range(8):
+            outgoing_transfers.push(
+                outgoing_transfers.DISPATCH,
+                STAND_IN_REG_NUMBER,
+                outgoing_transfers.OutgoingTransfer(
+                    str(uuid.uuid4()), source.pk, 7, Decimal(5)
+                ),
+            )
+        # Requests in flight are awaited, they do not take a database thread
+        with mock.patch.object(constants, "INTERBANK_DISPATCHER_DB_THREADS", 1):
+            asyncio.run(dispatch(concurrency=4, drain=True))
+
+        self.assertEqual(len(bank.transfers), 8)
+        self.assertFalse(
+            redis_clients.client().exists(
+                outgoing_transfers.processing_key(
+                    outgoing_transfers.DISPATCH, STAND_IN_REG_NUMBER
+                )
+            )
+        )
+        self.assertEqual(bank.peak_in_flight, 4)
+        statuses = Ledger.objects.filter(account=source, amount=-5).values_list(
+            "status", flat=True
+        )
+        self.assertEqual(list(statuses), [TransactionStatus.PROCESSED] * 8)
+        self.assertEqual(source.get_balance(), 60)
+
+    def test_dispatcher_signs_requests_to_banks_with_a_key(self) -> None:
+        """The async sessions should sign requests instead of logging in."""
+        bank = StandInBank(signing_key="shared-secret")
+        self.addCleanup(bank.stop)
+        self.addCleanup(interbank.close)
+        bank.register()
+        # External transfers credit account 1, which is self.source here
+        source = Account.objects.create(account_status=AccountStatus.ACTIVE)
+        Ledger.transfer(self.source, source, Decimal(100))
+
+        outgoing_transfers.push(
+            outgoing_transfers.DISPATCH,
+            STAND_IN_REG_NUMBER,
+            outgoing_transfers.OutgoingTransfer(
+                str(uuid.uuid4()), source.pk, 7, Decimal(5)
+            ),
+        )
+        asyncio.run(dispatch(concurrency=4, drain=True))
+
+        self.assertEqual(bank.requests, 1)
+        self.assertEqual(bank.sessions, set())
+        self.assertEqual(
+            Ledger.objects.get(account=source, amount=-5).status,
+            TransactionStatus.PROCESSED,
+        )
+
+    def test_outbox_relays_each_transfer_once(self) -> None:
+        """Parallel relays should send every booked transfer exactly once."""
+        bank = StandInBank()
+        self.addCleanup(bank.stop)
+        self.addCleanup(interbank.close)
+        bank.register()
+        # External transfers credit account 1, which is self.source here
+        source = Account.objects.create(account_status=AccountStatus.ACTIVE)
+        Ledger.transfer(self.source, source, Decimal(100))
+
+        for _ in range(20):
+            Ledger.enqueue_external_transfer(
+                source_account=source,
+                registration_number=STAND_IN_REG_NUMBER,
+                destination_account=Account(pk=7),
+                amount=Decimal(5),
+            )
+        # The funds leave with the request, before anything is sent
+        self.assertEqual(source.get_balance(), 0)
+        self.assertEqual(OutboxTransfer.objects.count(), 20)
+
+        def relay(_: int) -> int:
+            try:
+                relayed = 0
+                while count := Ledger.relay_external_transfers(limit=3):
+                    relayed += count
+                return relayed
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            relayed = list(pool.map(relay, range(3)))
+
+        self.assertEqual(sum(relayed), 20)
+        self.assertEqual(len(bank.transfers), 20)
+        self.assertFalse(OutboxTransfer.objects.exists())
+        statuses = Ledger.objects.filter(account=source, amount=-5).values_list(
+            "status", flat=True
+        )
+        self.assertEqual(list(statuses), [TransactionStatus.PROCESSED] * 20)
+
+    def test_outbox_relay_sends_outside_transactions(self) -> None:
+        """Bookings should not wait for a relay sending to a slow bank."""
+        bank = StandInBank(delay=1)
+        self.addCleanup(bank.stop)
+        self.addCleanup(interbank.close)
+        bank.register()
+        # External transfers credit account 1, which is self.source here
+        source = Account.objects.create(account_status=AccountStatus.ACTIVE)
+        Ledger.transfer(self.source, source, Decimal(100))
+
+        def book() -> None:
+            Ledger.book_external_transfer(
+                source, STAND_IN_REG_NUMBER, Account(pk=7), Decimal(5)
+            )
+
+        book()
+        book()
+
+        def relay() -> int:
+            try:
+                return Ledger.relay_external_transfers()
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            relayed = pool.submit(relay)
+            # The first transfer is finalized and the second one in flight
+            while not (bank.transfers and bank.in_flight):
+                time.sleep(0.01)
+            started = time.monotonic()
+            book()
+            self.assertLess(time.monotonic() - started, 0.5)
+            self.assertEqual(relayed.result(), 2)
+
+        # The transfer booked while sending waits for the next relay
+        self.assertEqual(OutboxTransfer.objects.count(), 1)
+        self.assertEqual(Ledger.relay_external_transfers(), 1)
+        self.assertEqual(len(bank.transfers), 3)
+
+    def test_outbox_keeps_transfers_the_bank_failed_to_take(self) -> None:
+        """Failed relays should wait in the outbox, not in Redis."""
+        bank = StandInBank()
+        self.addCleanup(bank.stop)
+        self.addCleanup(interbank.close)
+        bank.register()
+        bank.down = True
+        # External transfers credit account 1, which is self.source here
+        source = Account.objects.create(account_status=AccountStatus.ACTIVE)
+        Ledger.transfer(self.source, source, Decimal(100))
+        Ledger.book_external_transfer(
+            source, STAND_IN_REG_NUMBER, Account(pk=7), Decimal(5)
+        )
+
+        self.assertEqual(Ledger.relay_external_transfers(), 0)
+        transfer = OutboxTransfer.objects.get()
+        self.assertEqual(transfer.attempt, 1)
+        self.assertGreater(transfer.claimed_until, now())
+        self.assertEqual(outgoing_transfers.retry_stats(STAND_IN_REG_NUMBER), (0, None))
+        # Not due yet
+        self.assertEqual(Ledger.relay_external_transfers(), 0)
+        self.assertEqual(bank.refused, 1)
+
+        bank.down = False
+        circuit_breaker.record_success(STAND_IN_REG_NUMBER)
+        OutboxTransfer.objects.update(claimed_until=now())
+        self.assertEqual(Ledger.relay_external_transfers(), 1)
+        self.assertFalse(OutboxTransfer.objects.exists())
+        self.assertEqual(
+            Ledger.objects.get(account=source, amount=-5).status,
+            TransactionStatus.PROCESSED,
+        )
+
+    def test_preloaded_worker_keeps_sessions_between_jobs(self) -> None:
+        """Jobs run in the worker process, sharing its interbank session."""
+        bank = StandInBank()
+        self.addCleanup(bank.stop)
+        self.addCleanup(interbank.close)
+        bank.register()
+        # External transfers credit account 1, which is self.source here
+        source = Account.objects.create(account_status=AccountStatus.ACTIVE)
+        Ledger.transfer(self.source, source, Decimal(100))
+
+        queue = Queue("test-preloaded-worker", connection=redis_clients.client())
+        self.addCleanup(queue.delete, delete_jobs=True)
+        jobs = [
+            queue.enqueue(
+                Ledger.initiate_external_transfer_job,
+                str(uuid.uuid4()),
+                source.pk,
+                STAND_IN_REG_NUMBER,
+                7,
+                "10",
+            )
+            for _ in range(3)
+        ]
+        PreloadedWorker([queue], connection=queue.connection).work(
+            burst=True, logging_level="WARNING"
+        )
+
+        self.assertTrue(all(job.get_status(refresh=True) == "finished" for job in jobs))
+        self.assertEqual(len(bank.sessions), 1)
+        self.assertEqual(len(bank.transfers), 3)
+        self.assertEqual(source.get_balance(), 70)
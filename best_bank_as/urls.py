@@ -9,12 +9,28 @@ urlpatterns = [
     path("profile/", views.profile, name="profile"),
     path("accounts/", views.account_list, name="account_list"),
     path("accounts/<int:pk>/", views.account_details, name="account_details"),
+    path(
+        "accounts/<int:pk>/transactions/",
+        views.account_transactions,
+        name="account_transactions",
+    ),
+    path(
+        "accounts/<int:pk>/statement/",
+        views.account_statement,
+        name="account_statement",
+    ),
     path(
         "staff/accounts/<int:pk>",
         views.staff_account_list,
         name="staff_account_list",
     ),
     path("staff/", views.staff_page, name="staff_page"),
+    path("staff/metrics/", views.staff_metrics, name="staff_metrics"),
+    path(
+        "staff/metrics/interbank/",
+        views.staff_interbank_metrics,
+        name="staff_interbank_metrics",
+    ),
     path("staff/customers", views.staff_customer_list, name="staff_customer_list"),
     path(
         "staff/customers/approve",
@@ -54,4 +70,9 @@ urlpatterns = [
     # Transfers
     path("transfer/", views.transaction_list, name="transfer_money"),
     path("external-transfer/", views.external_transfer, name="external-transfer"),
+    path(
+        "external-transfer/batch/",
+        views.external_transfer_batch,
+        name="external-transfer-batch",
+    ),
 ]
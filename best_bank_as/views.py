@@ -1,24 +1,47 @@
+import csv
+import json
 import os
 import uuid
+from collections.abc import AsyncIterator
+from datetime import date
+from typing import Any
 
+from asgiref.sync import sync_to_async
 from django.contrib import messages
 from django.core.mail import send_mail
-from django.db.models import Q
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count, Min, Q
 from django.http import (
     HttpRequest,
     HttpResponse,
     HttpResponseBadRequest,
     HttpResponseForbidden,
+    JsonResponse,
+    StreamingHttpResponse,
 )
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
 from django.utils.crypto import get_random_string
-
-from best_bank_as import decorators
+from django.utils.dateparse import parse_date
+from django.utils.http import urlencode
+from django.utils.timezone import now
+
+from best_bank_as import (
+    bank_registry,
+    circuit_breaker,
+    constants,
+    decorators,
+    idempotency,
+    interbank_batches,
+    metrics,
+    outgoing_transfers,
+)
+from best_bank_as.async_helpers import aget_object_or_404, aget_user, arender
 from best_bank_as.db_models.account import Account
 from best_bank_as.db_models.customer import Customer
-from best_bank_as.db_models.ledger import Ledger
+from best_bank_as.db_models.ledger import Ledger, TransferInstruction
 from best_bank_as.db_models.loan_application import LoanApplication
+from best_bank_as.db_models.outbox_transfer import OutboxTransfer
 from best_bank_as.enums import (
     AccountStatus,
     ApplicationStatus,
@@ -48,101 +71,248 @@ def index(request: HttpRequest) -> HttpResponse:
 
 
 @decorators.group_required("customer")
-def profile(request: HttpRequest) -> HttpResponse:
+async def profile(request: HttpRequest) -> HttpResponse:
     """View for a user's profile page."""
-
-    customer = get_object_or_404(Customer, user=request.user)
+    user = await aget_user(request)
+    customer = await aget_object_or_404(
+        Customer.objects.select_related("user"), user=user
+    )
     context = {"customer": customer}
 
-    return render(request, "best_bank_as/profile.html", context)
+    return await arender(request, "best_bank_as/profile.html", context)
 
 
 @decorators.group_required("customer", "employee", "supervisor")
-def account_list(request: HttpRequest) -> HttpResponse:
+async def account_list(request: HttpRequest) -> HttpResponse:
     """Retrieve all accounts for a given user."""
     if request.method == "GET":
-        customer = get_object_or_404(Customer, user=request.user)
-        accounts = customer.get_accounts()
+        user = await aget_user(request)
+        customer = await aget_object_or_404(Customer, user=user)
+        accounts = [account async for account in customer.get_accounts()]
         context = {
             "accounts": accounts,
             "status_list": status_list,
         }
-        return render(request, "best_bank_as/accounts/account_list.html", context)
+        return await arender(
+            request, "best_bank_as/accounts/account_list.html", context
+        )
 
     if request.method == "POST":
-        form = NewAccountRequestForm(request.POST)
-        if form.is_valid():
-            request_status = request.POST.get("account_status")
-
-            status = (
-                AccountStatus.ACTIVE
-                if request_status == AccountStatus.ACTIVE
-                else AccountStatus.PENDING
-            )
-            pk = request.POST.get("customer_pk")
-
-            if pk is None:
-                customer = request.user.customer
-            else:
-                customer = get_object_or_404(Customer, pk=pk)
-
-            try:
-                new_account = Account.request_new_account(
-                    customer=customer, status=status  # type: ignore
-                )
-                status_label = new_account.get_account_status_display()
-            except Exception as e:
-                context = {"error": str(e)}
-                return render(
-                    request, "best_bank_as/error_pages/error_page.html", context
-                )
-
-            response_text = (
-                f"Status: {status_label},"
-                f" Account number: {new_account.account_number}"
-            )
-            context = {"data": response_text}
-            return render(
-                request, "best_bank_as/accounts/request_account_partial.html", context
-            )
+        response = await sync_to_async(request_account)(request)
+        if response is not None:
+            return response
 
     # Default context for GET request if not returned inside the IF block
     context = {}
-    return render(request, "best_bank_as/accounts/account_list.html", context)
+    return await arender(request, "best_bank_as/accounts/account_list.html", context)
+
+
+def request_account(request: HttpRequest) -> HttpResponse | None:
+    """Open a new account from the POST of `account_list`."""
+    form = NewAccountRequestForm(request.POST)
+    if not form.is_valid():
+        return None
+
+    request_status = request.POST.get("account_status")
+
+    status = (
+        AccountStatus.ACTIVE
+        if request_status == AccountStatus.ACTIVE
+        else AccountStatus.PENDING
+    )
+    pk = request.POST.get("customer_pk")
+
+    if pk is None:
+        customer = request.user.customer
+    else:
+        customer = get_object_or_404(Customer, pk=pk)
+
+    try:
+        new_account = Account.request_new_account(
+            customer=customer, status=status  # type: ignore
+        )
+        status_label = new_account.get_account_status_display()
+    except Exception as e:
+        context = {"error": str(e)}
+        return render(request, "best_bank_as/error_pages/error_page.html", context)
+
+    response_text = (
+        f"Status: {status_label}, Account number: {new_account.account_number}"
+    )
+    context = {"data": response_text}
+    return render(
+        request, "best_bank_as/accounts/request_account_partial.html", context
+    )
 
 
 @decorators.group_required("customer", "employee", "supervisor")
-def account_details(request: HttpRequest, pk: int) -> HttpResponse:
+async def account_details(request: HttpRequest, pk: int) -> HttpResponse:
     """Retrieve information for a given account."""
-    account = get_object_or_404(Account, pk=pk)
+    account = await aget_object_or_404(
+        Account.objects.select_related("customer__user"), pk=pk
+    )
 
     context = {"account": account, "status_list": status_list}
 
+    user = await aget_user(request)
+    await user.aload_group_names()
+    if user != account.customer.user and not user.is_employee:
+        return HttpResponseForbidden(
+            await arender(request, "best_bank_as/error_pages/error_page.html")
+        )
+
+    if request.method == "GET":
+        balance = await account.aget_balance()
+        transactions, next_cursor = await account.aget_transaction_page()
+
+        context = {
+            "account": account,
+            "balance": balance,
+            "transactions": transactions,
+            "next_cursor": next_cursor,
+        }
+
+    if request.method == "PUT" and user.is_employee:
+        await sync_to_async(update_account_status)(request, account)
+        return await arender(
+            request, "best_bank_as/accounts/account_status_partial.html", context
+        )
+    return await arender(request, "best_bank_as/accounts/account_details.html", context)
+
+
+def update_account_status(request: HttpRequest, account: Account) -> None:
+    """Apply the PUT of `account_details` and report it as a message."""
+    value = request.PUT.get("account_status")
+    try:
+        account.update_account_status(value)
+        account.refresh_from_db()
+        messages.success(request, "Account status was successfully updated.")
+    except Exception:  # TODO: Find more specific error
+        messages.error(request, "Something went wrong. Please try again.")
+
+
+@decorators.group_required("customer", "employee", "supervisor")
+def account_transactions(request: HttpRequest, pk: int) -> HttpResponse:
+    """Retrieve the next page of transactions for a given account."""
+    # Internal accounts, the house account and its shards, have no customer
+    account = get_object_or_404(
+        Account.objects.select_related("customer__user"),
+        pk=pk,
+        customer__isnull=False,
+    )
+
     if request.user != account.customer.user and not request.user.is_employee:
         return HttpResponseForbidden(
             render(request, "best_bank_as/error_pages/error_page.html")
         )
 
-    if request.method == "GET":
-        balance = account.get_balance()
-        transactions = account.get_transactions()
+    dates = statement_dates(request)
+    try:
+        if dates is None:
+            raise ValueError("Invalid dates.")
+        transactions, next_cursor = account.get_transaction_page(
+            cursor=request.GET.get("cursor"),
+            limit=int(request.GET.get("limit", constants.TRANSACTIONS_PAGE_SIZE)),
+            **dates,
+        )
+    except ValueError:
+        return HttpResponseBadRequest(
+            render(request, "best_bank_as/error_pages/error_page.html")
+        )
 
-        context = {"balance": balance, "transactions": transactions}
+    context = {
+        "account": account,
+        "transactions": transactions,
+        "next_cursor": next_cursor,
+        "period": urlencode(
+            {
+                param: request.GET[param]
+                for param in ("from", "to")
+                if param in request.GET
+            }
+        ),
+    }
+    return render(
+        request, "best_bank_as/accounts/transaction_rows_partial.html", context
+    )
 
-    if request.method == "PUT" and request.user.is_employee:
-        data = request.PUT
-        value = data.get("account_status")
+
+class Echo:
+    """Pseudo buffer that returns what is written, for streaming a csv writer."""
+
+    def write(self, value: str) -> str:
+        return value
+
+
+async def statement_rows(
+    account: Account, file_format: str, **dates: Any
+) -> AsyncIterator[str]:
+    """
+    Render the account statement line by line. The rows are async, so the
+    ASGI handler streams them instead of collecting them in a thread.
+    """
+    rows = account.aiter_statement(**dates)
+
+    if file_format == "ndjson":
+        async for row in rows:
+            yield json.dumps(row, cls=DjangoJSONEncoder) + "\n"
+        return
+
+    writer = csv.writer(Echo())
+    columns = ["transaction_id", "counterpart_account_number", "amount", "status"]
+    yield writer.writerow(columns + ["date"])
+    async for row in rows:
+        yield writer.writerow([row[column] for column in columns] + [row["date"]])
+
+
+def statement_dates(request: HttpRequest) -> dict[str, date] | None:
+    """Parse the optional from/to dates of a statement, None if invalid."""
+    dates = {}
+    for key, param in (("start", "from"), ("end", "to")):
+        if not request.GET.get(param):
+            continue
         try:
-            account.update_account_status(value)
-            account.refresh_from_db()
-            messages.success(request, "Account status was successfully updated.")
-        except Exception:  # TODO: Find more specific error
-            messages.error(request, "Something went wrong. Please try again.")
+            dates[key] = parse_date(request.GET[param])
+        except ValueError:
+            return None
+        if dates[key] is None:
+            return None
+    return dates
 
-        return render(
-            request, "best_bank_as/accounts/account_status_partial.html", context
+
+@decorators.group_required("customer", "employee", "supervisor")
+async def account_statement(request: HttpRequest, pk: int) -> HttpResponse:
+    """Export the transactions of a given account as CSV or NDJSON."""
+    # Internal accounts, the house account and its shards, have no customer
+    account = await aget_object_or_404(
+        Account.objects.select_related("customer__user"),
+        pk=pk,
+        customer__isnull=False,
+    )
+
+    user = await aget_user(request)
+    await user.aload_group_names()
+    if user != account.customer.user and not user.is_employee:
+        return HttpResponseForbidden(
+            await arender(request, "best_bank_as/error_pages/error_page.html")
         )
-    return render(request, "best_bank_as/accounts/account_details.html", context)
+
+    file_format = request.GET.get("format", "csv")
+    dates = statement_dates(request)
+
+    if file_format not in ("csv", "ndjson") or dates is None:
+        return HttpResponseBadRequest(
+            await arender(request, "best_bank_as/error_pages/error_page.html")
+        )
+
+    content_type = "text/csv" if file_format == "csv" else "application/x-ndjson"
+    response = StreamingHttpResponse(
+        statement_rows(account, file_format, **dates), content_type=content_type
+    )
+    response[
+        "Content-Disposition"
+    ] = f'attachment; filename="statement-{account.account_number}.{file_format}"'
+    return response
 
 
 @decorators.group_required("employee", "supervisor")
@@ -154,18 +324,19 @@ def staff_page(request: HttpRequest) -> HttpResponse:
 
 
 @decorators.group_required("employee", "supervisor")
-def staff_customer_list(request: HttpRequest) -> HttpResponse:
+async def staff_customer_list(request: HttpRequest) -> HttpResponse:
     """View for searching customers."""
     query = request.GET.get("query", "")
 
-    customers = (
-        Customer.objects.filter(
+    customers = [
+        customer
+        async for customer in Customer.objects.filter(
             Q(phone_number__icontains=query) | Q(user__username__icontains=query)
         )
         .distinct()
         .select_related("user")  # join
-        # .prefetch_related(Prefetch("account_set"))
-    )
+        .prefetch_related("account_set")
+    ]
 
     context = {
         "customers": customers,
@@ -175,7 +346,7 @@ def staff_customer_list(request: HttpRequest) -> HttpResponse:
         "updateForm": UserUpdateForm,
         "updateCustomerForm": CustomerUpdateForm,
     }
-    return render(
+    return await arender(
         request,
         "best_bank_as/customers/customers_detail.html",
         context,
@@ -295,8 +466,8 @@ def staff_loan_application_details(request: HttpRequest, pk: int) -> HttpRespons
     user = request.user
 
     if request.method == "PUT":
-        is_employee = not user.groups.filter(name="supervisor").exists()
-        is_supervisor = not is_employee
+        is_supervisor = user.is_supervisor
+        is_employee = not is_supervisor
 
         print(is_employee, is_supervisor)
 
@@ -356,28 +527,38 @@ def transaction_list(request: HttpRequest) -> HttpResponse:  # TODO: Transaction
     amount = form.cleaned_data["amount"]
     destination_account_instance = Account.objects.get(pk=destination_account)
 
-    if registration_number != os.environ["BANK_REGISTRATION_NUMBER"]:
-        Ledger.enqueue_external_transfer(
-            source_account=source_account,
-            destination_account=destination_account_instance,
-            amount=amount,
-            registration_number=registration_number,
-        )
-        messages.success(request, "External transfer initiated successfully.")
-    else:
-        Ledger.transfer(
-            source_account=source_account,
-            destination_account=destination_account_instance,
-            amount=amount,
+    try:
+        if registration_number != os.environ["BANK_REGISTRATION_NUMBER"]:
+            # Booked right away with the outbox sender
+            Ledger.enqueue_external_transfer(
+                source_account=source_account,
+                destination_account=destination_account_instance,
+                amount=amount,
+                registration_number=registration_number,
+            )
+            messages.success(request, "External transfer initiated successfully.")
+        else:
+            Ledger.transfer(
+                source_account=source_account,
+                destination_account=destination_account_instance,
+                amount=amount,
+            )
+            messages.success(request, "Internal transfer completed successfully.")
+    except ValueError as e:
+        # The balance is only known once the ledger locks it
+        form.add_error("amount", str(e))
+        return render(
+            request,
+            "best_bank_as/handle_funds/transfer-money.html",
+            {"form": form, "idempotency_key": idempotency_key},
         )
-        messages.success(request, "Internal transfer completed successfully.")
 
     response = HttpResponse()
     response["HX-Redirect"] = request.build_absolute_uri(reverse("best_bank_as:index"))
     return response
 
 
-@decorators.group_required("customer")
+@decorators.group_required("customer", peer_banks=True)
 def external_transfer(request: HttpRequest) -> HttpResponse:
     """View to handle incoming external money transfers."""
 
@@ -402,7 +583,7 @@ def external_transfer(request: HttpRequest) -> HttpResponse:
         destination_account_id = form.cleaned_data["destination_account"]
         amount = form.cleaned_data["amount"]
 
-        source_account = Account.objects.get(pk=source_account_id)
+        source_account = Account.objects.get(pk=source_account_id).pick_shard(amount)
         destination_account = Account.objects.get(pk=destination_account_id)
 
         Ledger.transfer(
@@ -422,6 +603,73 @@ def external_transfer(request: HttpRequest) -> HttpResponse:
         )
 
 
+@decorators.group_required("customer", peer_banks=True)
+def external_transfer_batch(request: HttpRequest) -> HttpResponse:
+    """View to handle a batch of incoming external money transfers."""
+    if request.method != "POST":
+        return JsonResponse({"error": "Method not allowed"}, status=405)
+
+    try:
+        transfers = interbank_batches.parse_batch(request.body)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    # Transfers sent before, in another batch or on their own, are not applied again
+    owner = idempotency.owner(request, request.user)
+    keys = [
+        interbank_batches.transfer_key(owner, reference) for reference, *_ in transfers
+    ]
+    stored = [idempotency.claim(key) for key in keys]
+    if idempotency.IN_FLIGHT in stored:
+        for key, claimed in zip(keys, stored, strict=True):
+            if claimed is None:
+                idempotency.release(key)
+        return JsonResponse({"error": "A transfer is in flight."}, status=409)
+
+    new = [
+        (key, transfer)
+        for key, transfer, claimed in zip(keys, transfers, stored, strict=True)
+        if claimed is None
+    ]
+    statuses = {
+        reference: interbank_batches.stored_status(claimed)
+        for (reference, *_), claimed in zip(transfers, stored, strict=True)
+        if claimed is not None
+    }
+    errors: dict[str, str | None] = {}
+    if new:
+        total = sum(amount for _, (*_, amount) in new)
+        source_account = Account.objects.get(
+            pk=os.environ["BANK_ACCOUNT_NUMBER"]
+        ).pick_shard(total)
+        results = Ledger.bulk_transfer(
+            [
+                TransferInstruction(source_account.pk, destination_account, amount)
+                for _, (_, destination_account, amount) in new
+            ],
+            all_or_nothing=False,
+        )
+        for (key, (reference, *_)), result in zip(new, results, strict=True):
+            interbank_batches.complete(key, result.ok)
+            statuses[reference] = (
+                interbank_batches.PROCESSED if result.ok else interbank_batches.REJECTED
+            )
+            errors[reference] = result.error
+
+    return JsonResponse(
+        {
+            "results": [
+                {
+                    "reference": reference,
+                    "status": statuses[reference],
+                    "error": errors.get(reference),
+                }
+                for reference, *_ in transfers
+            ]
+        }
+    )
+
+
 @decorators.group_required("employee", "supervisor")
 def staff_account_list(
     request: HttpRequest, pk: int
@@ -431,12 +679,42 @@ def staff_account_list(
     customer = get_object_or_404(Customer, user=pk)
 
     accounts = customer.get_accounts()
-    print(accounts)
 
     context = {"accounts": accounts}
     return render(request, "best_bank_as/accounts/account_list.html", context)
 
 
+@decorators.group_required("employee", "supervisor")
+def staff_metrics(request: HttpRequest) -> HttpResponse:
+    """Expose the process-local counters of this worker."""
+    return JsonResponse(metrics.snapshot())
+
+
+@decorators.group_required("employee", "supervisor")
+def staff_interbank_metrics(request: HttpRequest) -> HttpResponse:
+    """Expose the outbox, circuit breaker and retry queue of each bank."""
+    outbox = {
+        row["registration_number__reg_number"]: row
+        for row in OutboxTransfer.objects.values("registration_number__reg_number")
+        .annotate(depth=Count("id"), oldest=Min("created_at"))
+        .order_by()
+    }
+    banks = {}
+    for reg_number in bank_registry.reg_numbers():
+        depth, oldest = outgoing_transfers.retry_stats(reg_number)
+        waiting = outbox.get(reg_number)
+        banks[reg_number] = {
+            "outbox_depth": waiting["depth"] if waiting else 0,
+            "outbox_lag_seconds": (
+                (now() - waiting["oldest"]).total_seconds() if waiting else None
+            ),
+            "breaker": circuit_breaker.state(reg_number),
+            "retry_queue_depth": depth,
+            "oldest_pending_seconds": oldest,
+        }
+    return JsonResponse(banks)
+
+
 @decorators.group_required("employee", "supervisor")
 def customers_approve_list(request: HttpRequest) -> HttpResponse:
     """Get all pending new customers."""
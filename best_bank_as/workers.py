@@ -0,0 +1,37 @@
+"""
+RQ worker that runs jobs in its own process instead of forking per job.
+
+Django is loaded once, and database connections, interbank sessions and the
+in-process caches outlive a job. Start it with
+
+    python manage.py rqworker --worker-class best_bank_as.workers.PreloadedWorker
+
+or several of them with `rqworker-pool --num-workers N` and the same class.
+"""
+
+from typing import Any
+
+from django.db import close_old_connections
+from rq import Queue, SimpleWorker
+from rq.job import Job
+
+from best_bank_as import interbank
+
+
+class PreloadedWorker(SimpleWorker):
+    """Runs each job in the worker process, like Django runs a request."""
+
+    def execute_job(self, job: Job, queue: Queue) -> Any:
+        """Run a job between the connection checks Django does around requests."""
+        # Closes connections that failed or outlived CONN_MAX_AGE, the others
+        # are checked with CONN_HEALTH_CHECKS before they are used again
+        close_old_connections()
+        try:
+            return super().execute_job(job, queue)
+        finally:
+            close_old_connections()
+
+    def teardown(self) -> None:
+        """Close the interbank sessions when the worker stops."""
+        super().teardown()
+        interbank.close()
@@ -2,8 +2,44 @@
 
 echo "${RTE} Runtime Environment - Running entrypoint."
 if [ "$CONTAINER_ROLE" = "worker" ]; then
-    # Start the RQ worker
-    exec python manage.py rqworker default
+    # Start the RQ worker, its scheduler sends interbank batches after their window.
+    # Workers for the banks in INTERBANK_QUEUE_BANKS set RQ_WORKER_QUEUES to
+    # their interbank-<registration number> queue. Jobs run in preloaded
+    # processes, RQ_WORKERS of them, instead of a fork per job.
+    QUEUES=${RQ_WORKER_QUEUES:-default interbank}
+    WORKER_CLASS=${RQ_WORKER_CLASS:-best_bank_as.workers.PreloadedWorker}
+    if [ "${RQ_WORKERS:-1}" -gt 1 ]; then
+        # The pool has no scheduler, so one more worker runs it next to the
+        # pool. Without it, jobs enqueued for later never run.
+        python manage.py rqworker $QUEUES --worker-class "$WORKER_CLASS" --with-scheduler &
+        SCHEDULER=$!
+        python manage.py rqworker-pool $QUEUES --num-workers "$RQ_WORKERS" --worker-class "$WORKER_CLASS" &
+        POOL=$!
+        # Pass a stop on to both, so they finish their jobs
+        trap 'kill -TERM $SCHEDULER $POOL 2>/dev/null' TERM INT
+        wait $POOL
+        wait $POOL
+        kill -TERM $SCHEDULER 2>/dev/null
+        wait $SCHEDULER
+        exit
+    fi
+    exec python manage.py rqworker $QUEUES --worker-class "$WORKER_CLASS" --with-scheduler
+
+elif [ "$CONTAINER_ROLE" = "relay" ]; then
+    # Sends the external transfers booked into the outbox
+    exec python manage.py relay_external_transfers
+
+elif [ "$CONTAINER_ROLE" = "dispatcher" ]; then
+    # Sends external transfers queued with INTERBANK_SENDER=dispatcher
+    exec python manage.py dispatch_external_transfers
+
+elif [ "$CONTAINER_ROLE" = "scheduler" ]; then
+    # Periodic maintenance, the commands skip work already done
+    while true; do
+        python manage.py create_ledger_partitions
+        python manage.py checkpoint_balances
+        sleep 3600
+    done
 
 elif [ "$RTE" = "dev" ]; then
 
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/3.2/ref/settings/
 """
 
 import os
+import sys
 from enum import Enum
 from pathlib import Path
 
@@ -24,6 +25,7 @@ class RuntimeEnvironment(Enum):
 
 
 RTE = RuntimeEnvironment[os.environ["RTE"]]
+TESTING = "test" in sys.argv[1:2]
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -73,6 +75,7 @@ MIDDLEWARE = [
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "best_bank_as.middleware.middleware.InterbankSignatureMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "best_bank_as.middleware.middleware.NotFoundMiddleware",
@@ -114,6 +117,10 @@ DATABASES = {
         "PORT": "5432",
         #       'ENGINE': 'django.db.backends.sqlite3',
         #       'NAME': BASE_DIR / 'db.sqlite3',
+        # Seconds to keep a connection open, set for RQ workers running jobs
+        # in-process. Reused connections are checked before their next use.
+        "CONN_MAX_AGE": int(os.environ.get("CONN_MAX_AGE", "0")),
+        "CONN_HEALTH_CHECKS": True,
     }
 }
 
@@ -187,14 +194,71 @@ EMAIL_USE_TLS = True
 CORS_ALLOW_ALL_ORIGINS = True
 
 
+# Banks with an RQ queue of their own, comma separated registration numbers.
+# Jobs for the other banks share the "interbank" queue.
+INTERBANK_QUEUE_BANKS = [
+    reg_number
+    for reg_number in os.environ.get("INTERBANK_QUEUE_BANKS", "").split(",")
+    if reg_number
+]
+
+# The test runner keeps its Redis state in databases of its own, which the tests
+# flush, so runs neither see nor leave behind keys of the app or of each other
+RQ_REDIS_DB = 14 if TESTING else 0
+SESSIONS_REDIS_DB = 15 if TESTING else 1
+
+# The sends to a bank go to its own "interbank-<registration number>" queue, or
+# "interbank", the ones customers wait on at the front, see job_queues
 RQ_QUEUES = {
-    "default": {
+    name: {
         "HOST": "redis",
         "PORT": "6379",
-        "DB": 0,
+        "DB": RQ_REDIS_DB,
         "DEFAULT_TIMEOUT": 360,
     }
+    for name in [
+        "default",
+        "interbank",
+        *(f"interbank-{reg_number}" for reg_number in INTERBANK_QUEUE_BANKS),
+    ]
+}
+
+# Number of shard accounts the house account is split into, 1 disables sharding
+HOUSE_ACCOUNT_SHARDS = int(os.environ.get("HOUSE_ACCOUNT_SHARDS", "1"))
+
+# Write internal transfers with a single statement instead of locked round trips
+TRANSFER_SINGLE_STATEMENT = os.environ.get("TRANSFER_SINGLE_STATEMENT", "0") == "1"
+
+# How external transfers are sent to other banks: "outbox" books them with the
+# request and relay_external_transfers sends them, "jobs" runs an RQ job per
+# transfer, "batches" sends them in batches (the peers need the batch endpoint)
+# and "dispatcher" hands them to the dispatch_external_transfers process
+INTERBANK_SENDER = os.environ.get("INTERBANK_SENDER", "outbox")
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "sessions": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": f"redis://redis:6379/{SESSIONS_REDIS_DB}",
+    },
 }
 
+# Sessions are read from Redis and written through to the database
+SESSION_ENGINE = os.environ.get(
+    "SESSION_ENGINE", "django.contrib.sessions.backends.cached_db"
+)
+SESSION_CACHE_ALIAS = "sessions"
+
+# Only save the session for a newer last_activity after this many seconds
+SESSION_ACTIVITY_GRANULARITY_SECONDS = int(
+    os.environ.get("SESSION_ACTIVITY_GRANULARITY_SECONDS", "60")
+)
+
+# Cache account balances in the django-rq Redis, off under the test runner
+BALANCE_CACHE_ENABLED = (
+    os.environ.get("BALANCE_CACHE_ENABLED", "0" if TESTING else "1") == "1"
+)
 
 AUTH_USER_MODEL = "best_bank_as.CustomUser"